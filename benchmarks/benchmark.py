@@ -0,0 +1,170 @@
+"""
+Benchmarks the hot paths on a synthetic help center.
+
+Generates categories x sections x articles x locales in the layout filesystem.Loader reads and times loading, saving,
+rendering, fetching and pushing against the local fake server from test/fakeserver.py. Results are printed and
+written as JSON so runs can be compared between releases:
+
+    python benchmarks/benchmark.py --categories 5 --sections 10 --articles 20 --locales 3 --output results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import filesystem  # noqa
+import model  # noqa
+import utils  # noqa
+import zendesk  # noqa
+from test.fakeserver import FakeServer  # noqa
+
+TRANSLATION_LOCALES = ['de', 'fr', 'pl', 'es', 'it', 'ja', 'ko', 'pt-BR', 'ru', 'zh-CN']
+
+
+def _body(size, seed):
+    paragraph = '## Heading {}\n\nSome *markdown* text with a [link](http://example.com/{}) and `code`.\n\n'.format(
+        seed, seed)
+    return (paragraph * (size // len(paragraph) + 1))[:size]
+
+
+def generate_tree(fs, categories, sections, articles, locales, body_size):
+    translation_locales = TRANSLATION_LOCALES[:max(locales - 1, 0)]
+    for c in range(categories):
+        category = model.Category('category {}'.format(c), 'category description {}'.format(c),
+                                  'category-{}'.format(c))
+        fs.save_json(category.content_filepath, category.to_content())
+        for locale in translation_locales:
+            fs.save_json(category.content_translation_filepath(locale), category.to_content())
+        for s in range(sections):
+            section = model.Section(category, 'section {}'.format(s), 'section description {}'.format(s),
+                                    'section-{}'.format(s))
+            fs.save_json(section.content_filepath, section.to_content())
+            for locale in translation_locales:
+                fs.save_json(section.content_translation_filepath(locale), section.to_content())
+            for a in range(articles):
+                article = model.Article(section, 'article {}'.format(a), _body(body_size, a), 'article-{}'.format(a))
+                fs.save_json(article.content_filepath, article.to_content())
+                fs.save_text(article.body_filepath, article.body)
+                for locale in translation_locales:
+                    fs.save_json(article.content_translation_filepath(locale), article.to_content())
+                    fs.save_text(article.body_translation_filepath(locale), article.body)
+
+
+def seed_server(server, categories):
+    for category in categories:
+        zendesk_category = server.store.add_category(category.name, category.description)
+        for section in category.sections:
+            zendesk_section = server.store.add_section(zendesk_category['id'], section.name, section.description)
+            for article in section.articles:
+                server.store.add_article(zendesk_section['id'], article.name, article.to_dict()['body'])
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Benchmark(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.results = {'parameters': vars(args), 'phases': {}}
+
+    def _phase(self, name, fn, units, server=None):
+        if server:
+            server.reset_stats()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+        phase = {
+            'seconds': round(elapsed, 4),
+            'units': units,
+            'throughput': round(units / elapsed, 2) if elapsed else None,
+            'peak_rss_kb': _peak_rss_kb()
+        }
+        if server:
+            phase['requests'] = server.request_count
+            phase['max_in_flight'] = server.max_in_flight
+            phase['bytes_sent'] = server.bytes_received
+            phase['requests_by_endpoint'] = {'{} {} {}'.format(*key): count
+                                             for key, count in sorted(server.requests.items())}
+        self.results['phases'][name] = phase
+        print('{:<10} {:>9.3f}s {:>10} units {:>12} units/s'.format(
+            name, elapsed, units, phase['throughput'] or '-'))
+        return result
+
+    def _client(self, root_folder):
+        if self.args.in_memory:
+            return filesystem.FilesystemClient(root_folder, storage=filesystem.MemoryStorage())
+        return filesystem.client(root_folder)
+
+    def run(self):
+        args = self.args
+        work_folder = tempfile.mkdtemp(prefix='zendesk-bench-')
+        source_fs = self._client(os.path.join(work_folder, 'source'))
+        copy_fs = self._client(os.path.join(work_folder, 'copy'))
+        try:
+            generate_tree(source_fs, args.categories, args.sections, args.articles, args.locales, args.body_size)
+            items = args.categories * (1 + args.sections * (1 + args.articles))
+            translations = items * args.locales
+
+            categories = self._phase('load', lambda: filesystem.Loader(source_fs).load(), items)
+            self._phase('save', lambda: filesystem.Saver(copy_fs).save(categories), items)
+            self._phase('render', lambda: self._render(categories), translations)
+
+            with FakeServer(latency=args.latency, per_page=args.per_page,
+                            rate_limit_every=args.rate_limit_every) as server:
+                seed_server(server, categories)
+                req = zendesk.ZendeskRequest(server.url, 'user', 'password')
+                self._phase('fetch', lambda: zendesk.Fetcher(req).fetch(), items, server)
+
+            with FakeServer(latency=args.latency, per_page=args.per_page,
+                            rate_limit_every=args.rate_limit_every) as server:
+                server.store.locales = [utils.to_zendesk_locale(model.DEFAULT_LOCALE)] + [
+                    utils.to_zendesk_locale(locale) for locale in TRANSLATION_LOCALES[:args.locales - 1]]
+                req = zendesk.ZendeskRequest(server.url, 'user', 'password')
+                pusher = zendesk.Pusher(req, source_fs, '', False)
+                categories = filesystem.Loader(source_fs).load()
+                self._phase('push', lambda: pusher.push(categories), translations, server)
+                self._phase('repush', lambda: pusher.push(categories), translations, server)
+        finally:
+            shutil.rmtree(work_folder)
+
+        if args.output:
+            with open(args.output, 'w') as fp:
+                json.dump(self.results, fp, indent=4, sort_keys=True)
+        return self.results
+
+    def _render(self, categories):
+        for item in (item for category in categories for item in model.walk(category)):
+            item.to_dict()
+            for translation in item.translations:
+                translation.to_dict()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark zendesk-helpcenter-cms on a synthetic help center.')
+    parser.add_argument('--categories', type=int, default=2)
+    parser.add_argument('--sections', type=int, default=5)
+    parser.add_argument('--articles', type=int, default=20)
+    parser.add_argument('--locales', type=int, default=3, help='Locales per item including the default one')
+    parser.add_argument('--body-size', type=int, default=4000, help='Article body size in characters')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds added by the fake server to every request')
+    parser.add_argument('--per-page', type=int, default=100, help='Page size of the fake server listings')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Answer every n-th request with 429')
+    parser.add_argument('--in-memory', action='store_true', help='Keep the help center in memory instead of on disk')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    Benchmark(parse_args()).run()
@@ -25,10 +25,12 @@ setup(name='zendesk-helpcenter-cms',
       url='https://github.com/KeepSafe/zendesk-helpcenter-cms/',
       license='Apache',
       packages=find_packages('src', exclude=['test', 'test.fixtures']),
-      py_modules=['cms', 'filesystem', 'model', 'translate', 'utils', 'zendesk'],
+      py_modules=['assets', 'cache', 'canonical', 'cms', 'filesystem', 'metrics', 'model', 'snapshot', 'state',
+                  'status', 'sync', 'translate', 'utils', 'zendesk', 'zendesk_async'],
       package_dir = {'': 'src'},
       namespace_packages=[],
       install_requires = reqs,
+      extras_require={'async': ['aiohttp']},
       entry_points={
           'console_scripts': [
               'zendesk-help-cms = cms:main']
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+import metrics
+import utils
+
+IMAGE_ROOT = '$IMAGE_ROOT'
+HASH_LENGTH = 32
+# downloaded images are kept in this folder of images_folder, with the validators of every url in the index
+DOWNLOADS_FOLDER = 'zendesk'
+DOWNLOADS_INDEX = 'index.json'
+# image links as html2text writes them, with an optional title
+REMOTE_IMAGE_PATTERN = r'(!\[[^\]]*\]\()([^\s)]+)((?:\s?\".*?\")?\))'
+# hosts Zendesk serves attachments and inline images from, besides the help center itself
+ZENDESK_HOSTS = ('.zendesk.com', '.zdassets.com', '.zdusercontent.com')
+
+
+class LocalStore(object):
+
+    """
+    Keeps assets in a local directory, e.g. the document root of a web server or a folder synced to a CDN, served
+    under base_url.
+    """
+
+    def __init__(self, folder, base_url):
+        self.folder = folder
+        self.base_url = base_url.rstrip('/')
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.folder, key))
+
+    def put(self, key, path):
+        target = os.path.join(self.folder, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = target + '.tmp'
+        shutil.copyfile(path, tmp_target)
+        os.replace(tmp_target, target)
+
+    def url_for(self, key):
+        return '{}/{}'.format(self.base_url, key)
+
+
+class AssetUploader(object):
+
+    """
+    Publishes the images referenced as $IMAGE_ROOT/path in article bodies. Every image is stored under a key made of
+    the hash of its content so a file is uploaded once, never again while it does not change, and its url can be
+    cached forever.
+    """
+
+    def __init__(self, store, images_folder, fallback_url=None):
+        self.store = store
+        self.images_folder = images_folder
+        self.fallback_url = fallback_url
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.published = set()
+
+    def _hash(self, path):
+        stat = os.stat(path)
+        cache_key = (path, stat.st_mtime, stat.st_size)
+        if cache_key not in self.hashes:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(64 * 1024), b''):
+                    digest.update(chunk)
+            self.hashes[cache_key] = digest.hexdigest()
+        return self.hashes[cache_key]
+
+    def key_for(self, path):
+        _, extension = os.path.splitext(path)
+        return self._hash(path)[:HASH_LENGTH] + extension.lower()
+
+    def url_for(self, image_path):
+        """
+        Returns the url of the image referenced as $IMAGE_ROOT + image_path, uploading it first if the store does not
+        have it yet.
+        """
+        local_path = os.path.join(self.images_folder, image_path.lstrip('/'))
+        if not os.path.isfile(local_path):
+            logging.warning('Image %s does not exist, link is not rewritten', local_path)
+            if self.fallback_url:
+                return self.fallback_url + image_path
+            return IMAGE_ROOT + image_path
+        with self.lock:
+            key = self.key_for(local_path)
+            if key not in self.published:
+                if self.store.exists(key):
+                    metrics.increment('assets', action='reused')
+                else:
+                    self.store.put(key, local_path)
+                    metrics.increment('assets', action='uploaded')
+                    print('Image {} uploaded as {}'.format(image_path, key))
+                self.published.add(key)
+        return self.store.url_for(key)
+
+
+class AssetDownloader(object):
+
+    """
+    Downloads the images of article bodies fetched from Zendesk to images_folder and points their links at the local
+    copies with $IMAGE_ROOT, so the tree is self-contained and export publishes them like any other image. Every url
+    is downloaded once, over concurrent connections, and files are named by the hash of their content so an image
+    under several urls is stored once. The validators of every download are kept so the next import only asks
+    whether an image changed.
+    """
+
+    def __init__(self, base_url, images_folder, auth=None, concurrency=1):
+        self.base_url = base_url
+        self.host = urlparse(base_url).hostname
+        self.folder = os.path.join(images_folder, DOWNLOADS_FOLDER)
+        self.auth = auth
+        self.concurrency = concurrency
+        self.session = utils.pool_connections(requests.Session(), concurrency)
+        self.lock = threading.Lock()
+        self.index = self._read_index()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.folder, DOWNLOADS_INDEX)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.index, fp, indent=4, sort_keys=True)
+        os.replace(tmp_path, self._index_path)
+
+    def _is_remote_image(self, url):
+        parsed = urlparse(url)
+        return parsed.scheme in ('http', 'https') and (parsed.hostname == self.host or
+                                                       (parsed.hostname or '').endswith(ZENDESK_HOSTS))
+
+    def _headers_for(self, url):
+        entry = self.index.get(url, {})
+        if not entry.get('key') or not os.path.isfile(os.path.join(self.folder, entry['key'])):
+            return {}
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _save(self, url, content):
+        _, extension = os.path.splitext(urlparse(url).path)
+        key = hashlib.sha256(content).hexdigest()[:HASH_LENGTH] + extension.lower()
+        target = os.path.join(self.folder, key)
+        if os.path.exists(target):
+            metrics.increment('downloads', action='deduplicated')
+            return key
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_target = target + '.tmp.{}'.format(threading.get_ident())
+        with open(tmp_target, 'wb') as fp:
+            fp.write(content)
+        os.replace(tmp_target, target)
+        metrics.increment('downloads', action='downloaded')
+        print('Image {} downloaded as {}'.format(url, key))
+        return key
+
+    def _download(self, url):
+        """
+        Returns the name url is saved under, None when it could not be downloaded.
+        """
+        headers = self._headers_for(url)
+        # the credentials only go to the help center, not to the hosts it links to
+        auth = self.auth if urlparse(url).hostname == self.host else None
+        try:
+            response = utils.send_request(self.session.get, url, headers=headers, auth=auth, verify=False)
+        except requests.exceptions.RequestException as e:
+            logging.warning('Downloading %s failed: %s', url, e)
+            metrics.increment('downloads', action='failed')
+            return None
+        if headers and response.status_code == 304:
+            metrics.increment('downloads', action='not_modified')
+            return self.index[url]['key']
+        if response.status_code != 200:
+            logging.warning('Downloading %s failed with status %s, link is not rewritten', url, response.status_code)
+            metrics.increment('downloads', action='failed')
+            return None
+        key = self._save(url, response.content)
+        with self.lock:
+            self.index[url] = {'key': key, 'etag': response.headers.get('ETag'),
+                               'last_modified': response.headers.get('Last-Modified')}
+        return key
+
+    def localize(self, bodies):
+        """
+        Downloads the images linked from the markdown bodies and returns the bodies with the links pointing at them.
+        """
+        urls = {}
+        for body in bodies:
+            for match in re.finditer(REMOTE_IMAGE_PATTERN, body or ''):
+                url = urljoin(self.base_url + '/', match.group(2))
+                if self._is_remote_image(url):
+                    urls[match.group(2)] = url
+        unique_urls = sorted(set(urls.values()))
+        if not unique_urls:
+            return list(bodies)
+        with metrics.phase('download'):
+            if self.concurrency > 1 and len(unique_urls) > 1:
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    keys = dict(zip(unique_urls, executor.map(self._download, unique_urls)))
+            else:
+                keys = {url: self._download(url) for url in unique_urls}
+        self._save_index()
+
+        def local_link(match):
+            key = keys.get(urls.get(match.group(2)))
+            if key is None:
+                return match.group(0)
+            return '{}{}/{}/{}{}'.format(match.group(1), IMAGE_ROOT, DOWNLOADS_FOLDER, key, match.group(3))
+        return [re.sub(REMOTE_IMAGE_PATTERN, local_link, body) if body else body for body in bodies]
+
+
+def store(uri, base_url):
+    """
+    Creates the asset store for uri. Plain paths and file:// uris are local directories.
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme in ('', 'file'):
+        return LocalStore(parsed.path if parsed.scheme else uri, base_url)
+    raise ValueError('Unsupported asset store {}'.format(uri))
+
+
+def uploader(store_uri, base_url, images_folder, fallback_url=None):
+    return AssetUploader(store(store_uri, base_url), images_folder, fallback_url)
+
+
+def downloader(company_uri, user, password, images_folder, concurrency=1):
+    return AssetDownloader(utils.to_base_url(company_uri), images_folder, (user, password), concurrency)
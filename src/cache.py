@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+
+
+class ResponseCache(object):
+
+    """
+    Keeps JSON responses on disk together with their ETag and Last-Modified validators so unchanged resources can be
+    revalidated with a conditional GET instead of being downloaded again.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def _path_for(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, key + '.json')
+
+    def _read_entry(self, url):
+        path = self._path_for(url)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as fp:
+            try:
+                return json.load(fp)
+            except ValueError:
+                return {}
+
+    def headers_for(self, url):
+        entry = self._read_entry(url)
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, url):
+        return self._read_entry(url).get('data', {})
+
+    def save(self, url, headers, data):
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        entry = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'data': data
+        }
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self._path_for(url), 'w') as fp:
+            json.dump(entry, fp)
+
+
+class ConversionCache(object):
+
+    """
+    Keeps the results of converting article HTML to markdown on disk, keyed by a hash of the HTML and of the converter
+    version and options, so bodies that have not changed since the last import are not converted again.
+    """
+
+    def __init__(self, folder, options=''):
+        self.folder = folder
+        self.options = options
+
+    def _path_for(self, source):
+        key = hashlib.sha1((self.options + '\0' + source).encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, key + '.mkdown')
+
+    def get(self, source):
+        path = self._path_for(source)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as fp:
+            return fp.read()
+
+    def save(self, source, result):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path_for(source)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            fp.write(result)
+        os.replace(tmp_path, path)
@@ -0,0 +1,116 @@
+import functools
+import hashlib
+import re
+from html.parser import HTMLParser
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source',
+                 'track', 'wbr'}
+PREFORMATTED_ELEMENTS = {'pre', 'textarea'}
+# whitespace around these is rendered, around any other element it is not
+INLINE_ELEMENTS = {'a', 'abbr', 'b', 'bdi', 'bdo', 'big', 'cite', 'code', 'data', 'del', 'dfn', 'em', 'font', 'i',
+                   'img', 'ins', 'kbd', 'label', 'mark', 'q', 's', 'samp', 'small', 'span', 'strike', 'strong', 'sub',
+                   'sup', 'time', 'tt', 'u', 'var'}
+WHITESPACE = re.compile(r'\s+')
+
+
+class _CanonicalParser(HTMLParser):
+
+    """
+    Turns HTML into a list of tokens that does not depend on how the markup is written: tag and attribute names are
+    lowercase, attributes sorted, entities decoded, void elements unclosed and whitespace collapsed outside of <pre>.
+    Whitespace at the start and end of a block is dropped, next to inline elements it is kept as it is rendered.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+        self.text = []
+        self.preformatted = 0
+        self.block_start = True
+
+    def _flush_text(self):
+        text = ''.join(self.text)
+        self.text = []
+        if not self.preformatted:
+            text = WHITESPACE.sub(' ', text)
+            if self.block_start:
+                text = text.lstrip()
+        if text:
+            self.tokens.append(('text', text))
+            self.block_start = False
+
+    def _strip_block_end(self):
+        # drops the whitespace of the last text, unless a block was closed or opened after it
+        for index in range(len(self.tokens) - 1, -1, -1):
+            token = self.tokens[index]
+            if token[0] == 'text':
+                text = token[1].rstrip()
+                if text:
+                    self.tokens[index] = ('text', text)
+                else:
+                    del self.tokens[index]
+                return
+            if token[1] not in INLINE_ELEMENTS:
+                return
+
+    def _handle_tag(self, tag):
+        self._flush_text()
+        if tag in INLINE_ELEMENTS:
+            return
+        if not self.preformatted:
+            self._strip_block_end()
+        self.block_start = True
+
+    def _attributes(self, attrs):
+        return tuple(sorted((name.lower(), WHITESPACE.sub(' ', value or '').strip()) for name, value in attrs))
+
+    def handle_starttag(self, tag, attrs):
+        self._handle_tag(tag)
+        self.tokens.append(('start', tag, self._attributes(attrs)))
+        if tag in PREFORMATTED_ELEMENTS:
+            self.preformatted += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._handle_tag(tag)
+        self.tokens.append(('start', tag, self._attributes(attrs)))
+        if tag not in VOID_ELEMENTS:
+            self.tokens.append(('end', tag))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        self._handle_tag(tag)
+        self.tokens.append(('end', tag))
+        if tag in PREFORMATTED_ELEMENTS and self.preformatted:
+            self.preformatted -= 1
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        if not self.preformatted:
+            self._strip_block_end()
+
+
+def canonical_tokens(html):
+    parser = _CanonicalParser()
+    parser.feed(html or '')
+    parser.close()
+    return parser.tokens
+
+
+@functools.lru_cache(maxsize=8192)
+def canonical_hash(html):
+    """
+    Returns a hash of the canonical form of html, equal for markup that differs only in formatting. Results are
+    cached as the same remote bodies are compared on every export.
+    """
+    return hashlib.sha1(repr(canonical_tokens(html)).encode('utf-8')).hexdigest()
+
+
+def same_content(first, second):
+    if first == second:
+        return True
+    return canonical_hash(first or '') == canonical_hash(second or '')
@@ -2,100 +2,371 @@ import argparse
 import os
 import logging
 import configparser
+import sys
+import time
 
-import zendesk
-import filesystem
-import translate
+import metrics
+import snapshot
+import utils
 
 DEFAULE_LOG_LEVEL = 'WARNING'
 CONFIG_FILE = 'zendesk-help-cms.config'
+DISTRIBUTION_NAME = 'zendesk-helpcenter-cms'
+# request settings applied once for the whole run, so targets share them
+GLOBAL_OPTIONS = ('connect_timeout', 'read_timeout', 'hedge_requests', 'deadline')
 
 
 class ImportTask(object):
 
     def execute(self, args):
+        import zendesk
+        import filesystem
+
+        images_folder = args.get('images_folder') if args.get('download_images') else None
+        if images_folder:
+            import assets
+
+            downloads_folder = os.path.realpath(os.path.join(images_folder, assets.DOWNLOADS_FOLDER))
+            root_folder = os.path.realpath(args['root_folder'])
+            if os.path.commonpath([downloads_folder, root_folder]) == root_folder:
+                # every folder of the root folder is loaded as a category
+                logging.error('Images would be downloaded to %s inside the root folder, set images_folder outside '
+                              'of it, for example ../images', downloads_folder)
+                return
+
         print('Running import task...')
-        categories = zendesk.fetcher(args['company_uri'], args['user'], args['password']).fetch()
-        filesystem.saver(args['root_folder']).save(categories)
+        with metrics.phase('fetch'):
+            categories = zendesk.fetcher(args['company_uri'], args['user'], args['password'],
+                                         args['cache_folder'], args['concurrency'], images_folder).fetch()
+        with metrics.phase('save'):
+            filesystem.saver(args['root_folder'], args['state_db']).save(categories)
         print('Done')
 
 
+def _sync_renames(args, categories):
+    """
+    Updates renamed and moved articles in place in Zendesk and WebTranslateIt before they are seen as new ones.
+    """
+    import sync
+
+    with metrics.phase('sync'):
+        count = sync.syncer(args['root_folder'], args['state_db'], args['company_uri'], args['user'], args['password'],
+                            args['webtranslateit_api_key'], args['concurrency']).sync(categories)
+    if count:
+        print('Found {} renamed or moved articles'.format(count))
+
+
 class TranslateTask(object):
 
     def execute(self, args):
+        import filesystem
+        import translate
+
         print('Running translate task...')
-        categories = filesystem.loader(args['root_folder']).load()
-        categories = translate.translator(args['webtranslateit_api_key']).create(categories)
-        filesystem.saver(args['root_folder']).save(categories)
+        with metrics.phase('load'):
+            categories = filesystem.loader(args['root_folder'], args['state_db']).load()
+        try:
+            with metrics.phase('translate'):
+                translate.translator(args['webtranslateit_api_key'], args['root_folder']).create(categories)
+        finally:
+            # ids of the files uploaded so far are kept even when the task stops half way
+            with metrics.phase('save'):
+                filesystem.saver(args['root_folder'], args['state_db']).save(categories)
         print('Done')
 
 
 class ExportTask(object):
 
     def execute(self, args):
+        import zendesk
+        import filesystem
+
         print('Running translate task...')
-        categories = filesystem.loader(args['root_folder']).load()
-        filesystem_client = filesystem.client(args['root_folder'])
-        zendesk.pusher(args['company_uri'], args['user'], args['password'],
-                       filesystem_client, args['image_cdn'], args['disable_article_comments']).push(categories)
+        with metrics.phase('load'):
+            categories = filesystem.loader(args['root_folder'], args['state_db']).load()
+        _sync_renames(args, categories)
+        filesystem_client = filesystem.client(args['root_folder'], args['state_db'])
+        image_cdn = args['image_cdn']
+        if args.get('assets_store'):
+            import assets
+            image_cdn = assets.uploader(args['assets_store'], args['assets_url'], args['images_folder'],
+                                        args['image_cdn']).url_for
+        with metrics.phase('push'):
+            zendesk.pusher(args['company_uri'], args['user'], args['password'], filesystem_client, image_cdn,
+                           args['disable_article_comments'], args['cache_folder'], args['concurrency']).push(categories)
         print('Done')
 
 
+def _read_paths(args, key):
+    """
+    Returns the paths given on the command line followed by the ones listed in the manifest file, one per line.
+    """
+    paths = list(args.get(key) or [])
+    if args.get('manifest'):
+        with open(args['manifest'], 'r') as fp:
+            paths.extend(line.strip() for line in fp if line.strip() and not line.startswith('#'))
+    return paths
+
+
+def _unique_paths(root_folder, paths):
+    """
+    Resolves the paths against the root folder and drops duplicates and paths lying inside another listed path, since
+    removing or moving the outer one takes care of them.
+    """
+    unique = []
+    for path in sorted(set(os.path.normpath(os.path.join(root_folder, p)) for p in paths)):
+        if not any(path.startswith(parent + os.sep) for parent in unique):
+            unique.append(path)
+    return unique
+
+
+def _run_concurrently(*calls):
+    """
+    Runs the calls on separate threads and waits for all of them, re-raising the first error. Returns their results.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        futures = [executor.submit(call) for call in calls]
+    return [future.result() for future in futures]
+
+
 class RemoveTask(object):
 
     def execute(self, args):
-        print('Running remove task...')
-        path = os.path.join(args['root_folder'], args['path'])
+        import zendesk
+        import filesystem
+        import translate
 
-        if not os.path.exists(path):
-            logging.error('Provided path %s does not exist', path)
+        print('Running remove task...')
+        paths = _unique_paths(args['root_folder'], _read_paths(args, 'paths'))
+        if not paths:
+            logging.error('No paths to remove')
+            return
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            logging.error('Provided paths %s do not exist', ', '.join(missing))
             return
 
-        item = filesystem.loader(args['root_folder']).load_from_path(path)
-        zendesk.remover(args['company_uri'], args['user'], args['password']).remove(item)
-        translate.remover(args['webtranslateit_api_key']).remove(item)
-        filesystem.remover(args['root_folder']).remove(item)
+        with metrics.phase('load'):
+            loader = filesystem.loader(args['root_folder'], args['state_db'])
+            items = [loader.load_from_path(os.path.relpath(path, args['root_folder'])) for path in paths]
+        with metrics.phase('remove'):
+            zendesk_remover = zendesk.remover(args['company_uri'], args['user'], args['password'],
+                                              args['concurrency'])
+            translate_remover = translate.remover(args['webtranslateit_api_key'], args['concurrency'])
+            _run_concurrently(lambda: zendesk_remover.remove_all(items), lambda: translate_remover.remove_all(items))
+            filesystem.remover(args['root_folder'], args['state_db']).remove_all(items)
+        print('Removed {} items'.format(len(items)))
         print('Done')
 
 
 class MoveTask(object):
 
+    _parent_types = {'article': 'section', 'section': 'category'}
+
+    def _destination_for(self, src, dest):
+        import model
+
+        if os.path.isfile(src):
+            # articles keep their file names and go to the destination section
+            return dest, os.path.join(dest, model.DEFAULT_LOCALE, os.path.basename(src))
+        new_path = os.path.join(dest, os.path.basename(src))
+        return new_path, new_path
+
     def execute(self, args):
+        import zendesk
+        import filesystem
+        import translate
+
         print('Running move task...')
-        src = os.path.join(args['root_folder'], args['source'])
-        dest = os.path.join(args['root_folder'], args['destination'])
+        root_folder = args['root_folder']
+        sources = _unique_paths(root_folder, _read_paths(args, 'sources'))
+        dest = os.path.join(root_folder, args['destination'])
+
+        if not sources:
+            logging.error('No sources to move')
+            return
+        missing = [src for src in sources if not os.path.exists(src)]
+        if missing:
+            logging.error('Provided sources %s do not exist', ', '.join(missing))
+            return
+        if not os.path.isdir(dest):
+            logging.error('Provided destination %s does not exist', dest)
+            return
+        dests, targets = zip(*[self._destination_for(src, dest) for src in sources])
+        existing = [target for target in targets if os.path.exists(target)]
+        if existing:
+            logging.error('Provided destination already contains %s', ', '.join(existing))
+            return
 
-        if not os.path.exists(src):
-            logging.error('Provided source %s does not exist', src)
+        with metrics.phase('load'):
+            loader = filesystem.loader(root_folder, args['state_db'])
+            items = [loader.load_from_path(os.path.relpath(src, root_folder)) for src in sources]
+            parent = loader.load_group(os.path.relpath(dest, root_folder))
+        invalid = [item.name for item in items if self._parent_types.get(item.zendesk_name) != parent.zendesk_name]
+        if invalid:
+            logging.error('%s cannot be moved to a %s', ', '.join(invalid), parent.zendesk_name)
             return
-        if os.path.exists(dest):
-            logging.error('Provided destination %s already exist', dest)
+        if not parent.zendesk_id and any(item.zendesk_id for item in items):
+            logging.error('Destination %s is not in Zendesk yet, export it first', dest)
             return
 
-        item = filesystem.loader(args['root_folder']).load_from_path(src)
-        zendesk.mover(args['company_uri'], args['user'], args['password'], args['image_cdn']).move(item, dest)
-        translate.mover(args['webtranslateit_api_key']).move(item, dest)
-        filesystem.mover(args['root_folder']).move(item, dest)
+        dests = [os.path.relpath(d, root_folder) for d in dests]
+        with metrics.phase('move'):
+            zendesk_mover = zendesk.mover(args['company_uri'], args['user'], args['password'], args['image_cdn'],
+                                          args['concurrency'])
+            translate_mover = translate.mover(args['webtranslateit_api_key'], args['concurrency'], root_folder)
+            zendesk_moved, translate_moved = _run_concurrently(lambda: zendesk_mover.move_all(items, parent),
+                                                               lambda: translate_mover.move_all(items, dests))
+            # items not in Zendesk yet have nothing to re-parent there
+            zendesk_moved = {id(item) for item in zendesk_moved} | {id(item) for item in items if not item.zendesk_id}
+            translate_moved = {id(item) for item in translate_moved}
+            moved = [(item, d) for item, d in zip(items, dests) if id(item) in zendesk_moved & translate_moved]
+            failed = [item.name for item in items if id(item) not in zendesk_moved & translate_moved]
+            filesystem.mover(root_folder, args['state_db']).move_all([item for item, _ in moved],
+                                                                     [d for _, d in moved])
+        print('Moved {} items'.format(len(moved)))
+        if failed:
+            logging.error('Moving %s failed in Zendesk or WebTranslateIt, they were left in place on disk',
+                          ', '.join(failed))
+            return
         print('Done')
 
 
 class DoctorTask(object):
 
+    # asks for missing names and which duplicate to keep, so targets are fixed one at a time
+    interactive = True
+
     def execute(self, args):
+        import zendesk
+        import filesystem
+        import translate
+
         print('Running doctor task...')
-        categories = filesystem.loader(args['root_folder']).load()
-        filesystem_client = filesystem.client(args['root_folder'])
-        filesystem_doctor = filesystem.doctor(args['root_folder'])
+        with metrics.phase('load'):
+            categories = filesystem.loader(args['root_folder'], args['state_db']).load()
+        filesystem_client = filesystem.client(args['root_folder'], args['state_db'])
+        filesystem_doctor = filesystem.doctor(args['root_folder'], args['state_db'])
         translate_doctor = translate.doctor(args['webtranslateit_api_key'])
-        zendesk_doctor = zendesk.doctor(
-            args['company_uri'], args['user'], args['password'], filesystem_client, args['force'])
+        zendesk_doctor = zendesk.doctor(args['company_uri'], args['user'], args['password'], filesystem_client,
+                                        args['force'], args['cache_folder'], args['concurrency'])
+
+        with metrics.phase('fix'):
+            zendesk_doctor.fix(categories)
+            filesystem_doctor.fix(categories)
+            translate_doctor.fix(categories)
+
+        with metrics.phase('save'):
+            filesystem.saver(args['root_folder'], args['state_db']).save(categories)
+
+        print('Done')
+
+
+class StatusTask(object):
+
+    """
+    Lists what changed in the tree and in Zendesk since the last import or export, without requests per item.
+    """
+
+    def execute(self, args):
+        import filesystem
+        import status
+
+        print('Running status task...')
+        with metrics.phase('load'):
+            categories = filesystem.loader(args['root_folder'], args['state_db']).load()
+        checker = status.checker(args['root_folder'], args['state_db'], args['company_uri'], args['user'],
+                                 args['password'], args['cache_folder'], args['concurrency'])
+        with metrics.phase('status'):
+            changes = checker.status(categories)
+        for item_status in status.STATUSES:
+            descriptions = [description for change_status, description in changes if change_status == item_status]
+            if descriptions:
+                print('{} ({}):'.format(item_status.capitalize(), len(descriptions)))
+                for description in descriptions:
+                    print('    ' + description)
+        if not changes:
+            print('Everything is up to date')
+        print('Done')
 
-        zendesk_doctor.fix(categories)
-        filesystem_doctor.fix(categories)
-        translate_doctor.fix(categories)
 
-        filesystem.saver(args['root_folder']).save(categories)
+class CompactTask(object):
 
+    """
+    Drops the fields of the remote payloads that older versions kept in the .meta files.
+    """
+
+    def execute(self, args):
+        import filesystem
+
+        print('Running compact task...')
+        with metrics.phase('load'):
+            categories = filesystem.loader(args['root_folder'], args['state_db']).load()
+        with metrics.phase('save'):
+            count = filesystem.compactor(args['root_folder'], args['state_db']).compact(categories)
+        print('Compacted {} meta files'.format(count))
+        print('Done')
+
+
+class SnapshotTask(object):
+
+    """
+    Streams the whole help center from Zendesk into a single compressed file.
+    """
+
+    def execute(self, args):
+        import zendesk
+
+        print('Running snapshot task...')
+        snapshotter = zendesk.snapshotter(args['company_uri'], args['user'], args['password'], args['concurrency'])
+        with metrics.phase('snapshot'):
+            count = snapshot.write(args['snapshot'], snapshotter.records(), {'company_uri': args['company_uri']})
+        print('Saved {} records to {}'.format(count, args['snapshot']))
+        print('Done')
+
+
+class RestoreTask(object):
+
+    """
+    Replays a snapshot into the root folder or, with --to-zendesk, into the help center.
+    """
+
+    def execute(self, args):
+        import zendesk
+        import filesystem
+
+        print('Running restore task...')
+        records = snapshot.read(args['snapshot'])
+        if args.get('to_zendesk'):
+            restorer = zendesk.restorer(args['company_uri'], args['user'], args['password'], args['concurrency'])
+            with metrics.phase('restore'):
+                count = restorer.restore(records)
+            print('Created {} items in Zendesk'.format(count))
+        else:
+            fetcher = zendesk.fetcher(args['company_uri'], args['user'], args['password'], args['cache_folder'])
+            with metrics.phase('save'):
+                filesystem.saver(args['root_folder'], args['state_db']).save_items(fetcher.restore(records))
+        print('Done')
+
+
+class MigrateStateTask(object):
+
+    """
+    Copies the content of all .meta files into the state database set with state_db.
+    """
+
+    def execute(self, args):
+        import state
+
+        if not args['state_db']:
+            logging.error('Set state_db in the config file to migrate to a state database')
+            return
+        print('Running migrate-state task...')
+        store = state.open_store(args['state_db'])
+        count = store.migrate(args['root_folder'])
+        store.close()
+        print('Migrated {} meta files to {}'.format(count, args['state_db']))
         print('Done')
 
 
@@ -164,6 +435,11 @@ tasks = {
     'remove': RemoveTask(),
     'move': MoveTask(),
     'doctor': DoctorTask(),
+    'migrate-state': MigrateStateTask(),
+    'compact': CompactTask(),
+    'status': StatusTask(),
+    'snapshot': SnapshotTask(),
+    'restore': RestoreTask(),
     'config': ConfigTask()
 }
 
@@ -186,12 +462,34 @@ def parse_args():
     parser.add_argument('-f', '--force', help='Don\'t ask questions. YES all the way',
                         action='store_true', default=False)
     parser.add_argument('-v', '--version', help='Show version', action='store_true')
+    parser.add_argument('--profile', nargs='?', const='zendesk-help-cms.prof',
+                        help='Run the task under cProfile and write the stats to PROFILE, '
+                        'default: zendesk-help-cms.prof')
+    parser.add_argument('--timings', help='Print time spent per phase and HTTP endpoint when the task is done',
+                        action='store_true', default=False)
+    parser.add_argument('--metrics-textfile', dest='metrics_textfile',
+                        help='Write metrics in the Prometheus text format to this file when the task is done')
+    parser.add_argument('--statsd', help='Send metrics to the StatsD daemon at HOST:PORT when the task is done')
+    parser.add_argument('-t', '--target', action='append',
+                        help='Run only for this target of a multi-target config file, can be repeated')
+    parser.add_argument('--deadline', type=float,
+                        help='Stop sending requests after DEADLINE seconds, let the ones in flight finish and exit')
 
     # Task subparser settings
-    task_parsers['remove'].add_argument('path',
-                                        help='Set path for removing an item. The path is relative to the root folder')
-    task_parsers['move'].add_argument('source', help='Set source section/article')
+    task_parsers['remove'].add_argument('paths', nargs='*',
+                                        help='Set paths of the items to remove. Paths are relative to the root folder')
+    task_parsers['remove'].add_argument('--manifest', help='File listing paths of the items to remove, one per line')
+    task_parsers['move'].add_argument('sources', nargs='*', help='Set source sections/articles')
     task_parsers['move'].add_argument('destination', help='Set destination category/section')
+    task_parsers['move'].add_argument('--manifest', help='File listing source paths to move, one per line')
+    task_parsers['snapshot'].add_argument('snapshot', nargs='?',
+                                          help='Set the snapshot file, {} in the root folder by default'.format(
+                                              snapshot.DEFAULT_SNAPSHOT))
+    task_parsers['restore'].add_argument('snapshot', nargs='?',
+                                         help='Set the snapshot file to restore, {} in the root folder by '
+                                              'default'.format(snapshot.DEFAULT_SNAPSHOT))
+    task_parsers['restore'].add_argument('--to-zendesk', dest='to_zendesk', action='store_true',
+                                         help='Restore into the help center instead of the root folder')
 
     return parser.parse_args()
 
@@ -201,29 +499,172 @@ def init_log(loglevel):
     logging.basicConfig(level=num_level)
 
 
+def _merge_options(section, args, root_folder=None):
+    options = dict(section)
+    options.update({key: value for key, value in vars(args).items() if value is not None or key not in options})
+    if root_folder:
+        options['root_folder'] = os.path.abspath(root_folder)
+    options['image_cdn'] = options.get('image_cdn', '')
+    options['disable_article_comments'] = bool(options.get('disable_article_comments', False))
+    options['concurrency'] = int(options.get('concurrency') or 1)
+    options['rate_limit'] = float(options.get('rate_limit') or 0)
+    options['connect_timeout'] = float(options.get('connect_timeout') or utils.DEFAULT_CONNECT_TIMEOUT)
+    options['read_timeout'] = float(options.get('read_timeout') or utils.DEFAULT_READ_TIMEOUT)
+    options['hedge_requests'] = str(options.get('hedge_requests', '')).lower() in ('1', 'yes', 'true', 'on')
+    options['deadline'] = float(options.get('deadline') or 0)
+    # when the root folder is an archive, the paths relative to it are relative to the folder of the archive
+    base_folder = options['root_folder']
+    if os.path.isfile(base_folder):
+        base_folder = os.path.dirname(base_folder)
+    cache_folder = options.get('cache_folder', '')
+    options['cache_folder'] = os.path.join(base_folder, cache_folder) if cache_folder else ''
+    state_db = options.get('state_db', '')
+    options['state_db'] = os.path.join(base_folder, state_db) if state_db else ''
+    options['images_folder'] = os.path.join(base_folder, options.get('images_folder', ''))
+    options['assets_url'] = options.get('assets_url', '')
+    options['download_images'] = str(options.get('download_images', '')).lower() in ('1', 'yes', 'true', 'on')
+    options['snapshot'] = options.get('snapshot') or os.path.join(base_folder, snapshot.DEFAULT_SNAPSHOT)
+    return options
+
+
 def parse_config(args):
+    """
+    Reads the options from the config file and the command line. Every named section of the config file is a target,
+    a help center with its own root folder that inherits everything it does not set from the DEFAULT section. When
+    there are targets they are returned as a list under 'targets'. Targets cannot change the GLOBAL_OPTIONS.
+    """
     config = configparser.ConfigParser()
     config.read(CONFIG_FILE)
-    options = dict(config[config.default_section])
-    options.update(vars(args))
-    options['image_cdn'] = options.get('image_cdn', '')
-    options['disable_article_comments'] = bool(options.get('disable_article_comments', False))
+    options = _merge_options(config[config.default_section], args)
+    selected = getattr(args, 'target', None)
+    targets = []
+    for name in config.sections():
+        if selected and name not in selected:
+            continue
+        overridden = [key for key in GLOBAL_OPTIONS if config[name].get(key) != config.defaults().get(key)]
+        if overridden:
+            sys.exit('{} can only be set in the DEFAULT section, not in target {}'.format(', '.join(overridden), name))
+        target = _merge_options(config[name], args, config[name].get('root_folder', name))
+        target['target'] = name
+        targets.append(target)
+    if targets:
+        options['targets'] = targets
     return options
 
 
+def _configure_requests(options):
+    utils.set_timeout(options['connect_timeout'], options['read_timeout'])
+    utils.hedge_requests(options['hedge_requests'])
+    utils.set_deadline(options['deadline'])
+
+
+def _deadline_summary(options):
+    lines = ['Deadline of {:g} seconds exceeded. Requests in flight were finished, these were not sent:'.format(
+        options['deadline'])]
+    for labels, count in metrics.counter_values('skipped_requests'):
+        lines.append('{:<70} {:>6}'.format(labels['endpoint'], count))
+    lines.append('Run the task again to finish it.')
+    return '\n'.join(lines)
+
+
+def run_task(task, options):
+    if options.get('rate_limit') and options.get('company_uri'):
+        utils.limit_rate(options['company_uri'], options['rate_limit'])
+    _configure_requests(options)
+    try:
+        if options.get('profile'):
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(task.execute, options)
+            finally:
+                profiler.dump_stats(options['profile'])
+                print('Profile written to {}'.format(options['profile']))
+        else:
+            task.execute(options)
+    except utils.DeadlineExceeded:
+        sys.exit(_deadline_summary(options))
+    finally:
+        emit_metrics(options)
+
+
+def _run_target(task, options):
+    utils.limit_rate(options['company_uri'], options['rate_limit'])
+    start = time.perf_counter()
+    try:
+        with metrics.phase('target ' + options['target']):
+            task.execute(options)
+        return 'ok', time.perf_counter() - start
+    except utils.DeadlineExceeded:
+        logging.error('Deadline exceeded for target %s', options['target'])
+        return 'deadline', time.perf_counter() - start
+    except Exception:
+        logging.exception('Task failed for target %s', options['target'])
+        return 'failed', time.perf_counter() - start
+
+
+def run_targets(task, options):
+    """
+    Runs the task for all targets at the same time, one thread per target, and reports the outcome of each. Tasks
+    that prompt for input run for one target after the other. Returns the names of the targets that failed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    targets = options['targets']
+    _configure_requests(options)
+    workers = 1 if getattr(task, 'interactive', False) else len(targets)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda target: _run_target(task, target), targets))
+        print('{:<30} {:>8} {:>10}'.format('target', 'status', 'seconds'))
+        for target, (status, seconds) in zip(targets, results):
+            print('{:<30} {:>8} {:>10.3f}'.format(target['target'], status, seconds))
+        if any(status == 'deadline' for status, _ in results):
+            print(_deadline_summary(options))
+        return [target['target'] for target, (status, _) in zip(targets, results) if status != 'ok']
+    finally:
+        emit_metrics(options)
+
+
+def emit_metrics(options):
+    task_name = options.get('task', '')
+    if options.get('timings'):
+        print(metrics.report())
+    if options.get('metrics_textfile'):
+        metrics.write_textfile(options['metrics_textfile'], task_name)
+    if options.get('statsd'):
+        try:
+            metrics.send_statsd(options['statsd'], task_name)
+        except OSError as e:
+            logging.error('Sending metrics to %s failed: %s', options['statsd'], e)
+
+
+def get_version():
+    try:
+        from importlib import metadata
+    except ImportError:
+        # python < 3.8
+        import pkg_resources
+        return pkg_resources.require(DISTRIBUTION_NAME)[0].version
+    try:
+        return metadata.version(DISTRIBUTION_NAME)
+    except metadata.PackageNotFoundError:
+        return 'unknown, {} is not installed'.format(DISTRIBUTION_NAME)
+
+
 def main():
     args = parse_args()
     if args.version:
-        import pkg_resources
-        version = pkg_resources.require('zendesk-helpcenter-cms')[0].version
-        print(version)
+        print(get_version())
         return
     init_log(args.loglevel)
     options = parse_config(args)
     task_name = options.get('task')
-    if task_name:
-        task = tasks[task_name]
-        task.execute(options)
+    if task_name and options.get('targets') and task_name != 'config':
+        failed = run_targets(tasks[task_name], options)
+        if failed:
+            sys.exit('Task {} failed for {}'.format(task_name, ', '.join(failed)))
+    elif task_name:
+        run_task(tasks[task_name], options)
     else:
         print('No task provided, run with -h to see available options')
 
@@ -4,36 +4,274 @@ import logging
 import re
 import shutil
 
+import metrics
 import model
 
 GROUP_TRANSLATION_PATTERN = '{}.([a-zA-Z-]{{2,5}}){}'
 
 
-class FilesystemClient(object):
+class DiskStorage(object):
+
+    """
+    Files in a directory on disk. Storages take paths relative to the root folder.
+    """
 
     def __init__(self, root_folder):
         self.root_folder = root_folder
 
-    def _path_for(self, path):
+    def _full_path(self, path):
         return os.path.join(self.root_folder, path)
 
-    def save_text(self, path, data):
-        full_path = self._path_for(path)
+    def exists(self, path):
+        return os.path.exists(self._full_path(path))
+
+    def is_dir(self, path):
+        return os.path.isdir(self._full_path(path))
+
+    def is_file(self, path):
+        return os.path.isfile(self._full_path(path))
+
+    def list_dir(self, path):
+        full_path = self._full_path(path)
+        return os.listdir(full_path) if os.path.isdir(full_path) else []
+
+    def read(self, path):
+        with open(self._full_path(path), 'r') as fp:
+            return fp.read()
+
+    def write(self, path, data):
+        full_path = self._full_path(path)
         os.makedirs(os.path.dirname(full_path), exist_ok=True)
         with open(full_path, 'w') as fp:
             fp.write(data)
+
+    def remove(self, path):
+        if self.is_file(path):
+            os.remove(self._full_path(path))
+
+    def remove_dir(self, path):
+        if self.is_dir(path):
+            shutil.rmtree(self._full_path(path))
+
+    def move(self, old_path, new_path):
+        if self.exists(old_path):
+            os.makedirs(os.path.dirname(self._full_path(new_path)), exist_ok=True)
+            shutil.move(self._full_path(old_path), self._full_path(new_path))
+
+    def files(self):
+        """
+        Returns the paths of all files, skipping hidden folders such as the cache.
+        """
+        paths = []
+        for folder, dirs, files in os.walk(self.root_folder):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            paths.extend(os.path.relpath(os.path.join(folder, f), self.root_folder) for f in files)
+        return paths
+
+
+def _normalize(path):
+    path = os.path.normpath(path).replace('\\', '/')
+    return '' if path == '.' else path
+
+
+class MemoryStorage(object):
+
+    """
+    Files kept in a dict, for tests and benchmarks that should not touch the disk. Like in git, folders exist as long
+    as there are files in them.
+    """
+
+    def __init__(self, files=None):
+        self._files = {}
+        # names of the files and folders in every folder, '' being the root
+        self._children = {'': set()}
+        for path, data in (files or {}).items():
+            self.write(path, data)
+
+    def _add(self, path, data):
+        self._files[path] = data
+        parts = path.split('/')
+        for idx in range(len(parts)):
+            self._children.setdefault('/'.join(parts[:idx]), set()).add(parts[idx])
+
+    def _walk(self, folder):
+        for name in self._children.get(folder, ()):
+            path = folder + '/' + name if folder else name
+            if path in self._files:
+                yield path
+            else:
+                yield from self._walk(path)
+
+    def _drop_folder(self, folder):
+        for name in self._children.pop(folder, ()):
+            self._drop_folder(folder + '/' + name if folder else name)
+
+    def _prune(self, path):
+        # removes path from its folder, and the folders left empty from theirs
+        while path:
+            folder, _, name = path.rpartition('/')
+            self._children.get(folder, set()).discard(name)
+            if self._children.get(folder) or not folder:
+                return
+            self._children.pop(folder, None)
+            path = folder
+
+    def exists(self, path):
+        path = _normalize(path)
+        return path in self._files or path in self._children
+
+    def is_dir(self, path):
+        return _normalize(path) in self._children
+
+    def is_file(self, path):
+        return _normalize(path) in self._files
+
+    def list_dir(self, path):
+        return sorted(self._children.get(_normalize(path), ()))
+
+    def read(self, path):
+        path = _normalize(path)
+        if path not in self._files:
+            raise FileNotFoundError(path)
+        return self._files[path]
+
+    def write(self, path, data):
+        self._add(_normalize(path), data)
+
+    def remove(self, path):
+        path = _normalize(path)
+        if path in self._files:
+            del self._files[path]
+            self._prune(path)
+
+    def remove_dir(self, path):
+        path = _normalize(path)
+        if path not in self._children:
+            return
+        for file_path in list(self._walk(path)):
+            del self._files[file_path]
+        self._drop_folder(path)
+        self._prune(path)
+
+    def move(self, old_path, new_path):
+        old_path, new_path = _normalize(old_path), _normalize(new_path)
+        if old_path in self._files:
+            moves = [(old_path, new_path)]
+        else:
+            moves = [(path, new_path + path[len(old_path):]) for path in self._walk(old_path)]
+        data = [self._files.pop(old) for old, _ in moves]
+        self._drop_folder(old_path)
+        self._prune(old_path)
+        for (_, new), file_data in zip(moves, data):
+            self._add(new, file_data)
+
+    def files(self):
+        return [path for path in self._walk('') if not any(part.startswith('.') for part in path.split('/')[:-1])]
+
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+class ArchiveStorage(MemoryStorage):
+
+    """
+    Read-only view of a zip or tar archive of a root folder, so content packaged by CI can be loaded without
+    extracting it. Zip members are read when needed; compressed tars cannot be read out of order cheaply, so their
+    files are read in one pass when the archive is opened. Use a state database to export from an archive, the .meta
+    files cannot be written.
+    """
+
+    def __init__(self, archive_path):
+        super().__init__()
+        self.archive_path = archive_path
+        self._zip = None
+        if archive_path.endswith('.zip'):
+            import zipfile
+            self._zip = zipfile.ZipFile(archive_path)
+            for info in self._zip.infolist():
+                if not info.is_dir():
+                    self._add(_normalize(info.filename), info.filename)
+        else:
+            import tarfile
+            with tarfile.open(archive_path, 'r:*') as archive:
+                for member in archive:
+                    if member.isfile():
+                        data = archive.extractfile(member).read().decode('utf-8')
+                        self._add(_normalize(member.name), data)
+
+    def read(self, path):
+        data = super().read(path)
+        if self._zip is not None:
+            return self._zip.read(data).decode('utf-8')
+        return data
+
+    def _read_only(self, *args):
+        raise PermissionError('{} is a read-only archive'.format(self.archive_path))
+
+    write = remove = remove_dir = move = _read_only
+
+
+def storage(root_folder):
+    """
+    Returns the storage for root_folder: a zip or tar archive when it is one, the directory otherwise.
+    """
+    if root_folder.endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(root_folder):
+        return ArchiveStorage(root_folder)
+    return DiskStorage(root_folder)
+
+
+class FilesystemClient(object):
+
+    def __init__(self, root_folder, state=None, storage=None):
+        self.root_folder = root_folder
+        self.state = state
+        self.storage = storage or DiskStorage(root_folder)
+
+    def _path_for(self, path):
+        return os.path.join(self.root_folder, path)
+
+    def relative_path(self, path):
+        return os.path.relpath(self._path_for(path), self.root_folder)
+
+    def _state_path(self, path):
+        """
+        Returns the key of a .meta file in the state store, None when the path is not kept there.
+        """
+        if self.state is None or not path.endswith(model.Base._meta_exp):
+            return None
+        return self.relative_path(path)
+
+    def flush(self):
+        if self.state is not None:
+            self.state.commit()
+
+    def exists(self, path):
+        return self.storage.exists(self.relative_path(path))
+
+    def is_file(self, path):
+        return self.storage.is_file(self.relative_path(path))
+
+    def save_text(self, path, data):
+        self.storage.write(self.relative_path(path), data)
+        metrics.increment('files', service='filesystem', action='written')
+        metrics.increment('file_bytes', len(data), service='filesystem', action='written')
         return data
 
     def read_text(self, path):
-        full_path = self._path_for(path)
-        if os.path.exists(full_path):
-            with open(full_path, 'r') as fp:
-                return fp.read()
+        relative_path = self.relative_path(path)
+        if self.storage.is_file(relative_path):
+            data = self.storage.read(relative_path)
+            metrics.increment('files', service='filesystem', action='read')
+            metrics.increment('file_bytes', len(data), service='filesystem', action='read')
+            return data
         else:
             return ''
 
-    def save_json(self, path, data):
-        if os.path.exists(path):
+    def save_json(self, path, data, merge=True):
+        state_path = self._state_path(path)
+        if state_path:
+            return self.state.save(state_path, data, merge)
+        if merge and self.exists(path):
             new_data = data
             data = self.read_json(path)
             data.update(new_data)
@@ -42,6 +280,9 @@ class FilesystemClient(object):
         return data
 
     def read_json(self, path):
+        state_path = self._state_path(path)
+        if state_path:
+            return self.state.read(state_path)
         text = self.read_text(path)
         if text:
             return json.loads(text)
@@ -49,34 +290,38 @@ class FilesystemClient(object):
             return {}
 
     def read_directories(self, path):
-        full_path = self._path_for(path)
-        if os.path.exists(full_path):
-            return [d for d in os.listdir(full_path) if os.path.isdir(os.path.join(full_path, d)) and not d.startswith('.')]
-        else:
-            return []
+        relative_path = self.relative_path(path)
+        return [d for d in self.storage.list_dir(relative_path)
+                if self.storage.is_dir(os.path.join(relative_path, d)) and not d.startswith('.')]
 
     def read_files(self, path):
-        full_path = self._path_for(path)
-        if os.path.exists(full_path):
-            return [f for f in os.listdir(full_path) if os.path.isfile(os.path.join(full_path, f))]
-        else:
-            return []
+        relative_path = self.relative_path(path)
+        return [f for f in self.storage.list_dir(relative_path)
+                if self.storage.is_file(os.path.join(relative_path, f))]
+
+    def meta_files(self):
+        """
+        Returns the paths of all .meta files relative to the root folder, from the state store when there is one.
+        """
+        if self.state is not None:
+            return list(self.state.items)
+        return [path for path in self.storage.files() if path.endswith(model.Base._meta_exp)]
 
     def remove(self, path):
-        full_path = self._path_for(path)
-        if os.path.exists(full_path):
-            os.remove(full_path)
+        state_path = self._state_path(path)
+        if state_path:
+            self.state.remove(state_path)
+        self.storage.remove(self.relative_path(path))
 
     def remove_dir(self, path):
-        full_path = self._path_for(path)
-        if os.path.exists(full_path):
-            shutil.rmtree(full_path)
+        if self.state is not None:
+            self.state.remove_tree(self.relative_path(path))
+        self.storage.remove_dir(self.relative_path(path))
 
     def move(self, old_path, new_path):
-        old_full_path = self._path_for(old_path)
-        new_full_path = self._path_for(new_path)
-        if os.path.exists(old_full_path):
-            shutil.move(old_full_path, new_full_path)
+        if self._state_path(old_path) or (self.state is not None and self.storage.is_dir(self.relative_path(old_path))):
+            self.state.move(self.relative_path(old_path), self.relative_path(new_path))
+        self.storage.move(self.relative_path(old_path), self.relative_path(new_path))
 
 
 class Saver(object):
@@ -88,23 +333,64 @@ class Saver(object):
         self.fs.save_json(item.meta_filepath, item.meta)
         self.fs.save_json(item.content_filepath, item.to_content())
 
+    def _save_group_translations(self, group):
+        for translation in group.translations:
+            if translation.locale != model.DEFAULT_LOCALE:
+                self.fs.save_json(group.content_translation_filepath(translation.locale),
+                                  {'name': translation.name, 'description': translation.description})
+
+    def _save_article_translations(self, article):
+        for translation in article.translations:
+            if translation.locale != model.DEFAULT_LOCALE:
+                self.fs.save_json(article.content_translation_filepath(translation.locale), {'name': translation.name})
+                self.fs.save_text(article.body_translation_filepath(translation.locale), translation.body)
+
+    def visit_category(self, category):
+        self._save_item(category)
+        self._save_group_translations(category)
+        logging.info('Category %s saved' % category.name)
+
+    def visit_section(self, section):
+        self._save_item(section)
+        self._save_group_translations(section)
+        logging.info('Section %s saved' % section.name)
+
+    def visit_article(self, article):
+        self._save_item(article)
+        logging.info('Article %s saved' % article.name)
+        self.fs.save_text(article.body_filepath, article.body)
+        self._save_article_translations(article)
+
     def save(self, categories):
-        for category in categories:
-            self._save_item(category)
-            logging.info('Category %s saved' % category.name)
-            for section in category.sections:
-                self._save_item(section)
-                logging.info('Section %s saved' % section.name)
-                for article in section.articles:
-                    self._save_item(article)
-                    logging.info('Article %s saved' % article.name)
-                    self.fs.save_text(article.body_filepath, article.body)
+        self.save_items(item for category in categories for item in model.walk(category))
+
+    def save_items(self, items):
+        """
+        Saves items one by one, without their children, so they can be streamed from a snapshot.
+        """
+        for item in items:
+            item.accept(self)
+        self.fs.flush()
 
 
 class Loader(object):
 
     def __init__(self, fs):
         self.fs = fs
+        # categories and sections read by load_from_path and load_group, shared by all paths under them
+        self._groups = {}
+
+    def _cached_category(self, category_name):
+        key = (category_name,)
+        if key not in self._groups:
+            self._groups[key] = self._load_category(category_name)
+        return self._groups[key]
+
+    def _cached_section(self, category_name, section_name):
+        key = (category_name, section_name)
+        if key not in self._groups:
+            self._groups[key] = self._load_section(self._cached_category(category_name), section_name)
+        return self._groups[key]
 
     def _load_category(self, category_path):
         category_name = os.path.basename(category_path)
@@ -203,34 +489,70 @@ class Loader(object):
             categories.append(category)
         return categories
 
+    def _is_category_path(self, path):
+        return not os.path.dirname(self.fs.relative_path(path))
+
     def load_from_path(self, path):
-        if os.path.isfile(path):
+        """
+        Loads the category, section or article at the path, relative to the root folder like the paths of the items.
+        """
+        if self.fs.is_file(path):
             article_name, _ = os.path.splitext(os.path.basename(path))
             section_path = os.path.dirname(os.path.dirname(path))
             section_name = os.path.basename(section_path)
-            category_path = os.path.dirname(section_path)
-            category = self._load_category(category_path)
-            section = self._load_section(category, section_name)
+            category_name = os.path.basename(os.path.dirname(section_path))
+            section = self._cached_section(category_name, section_name)
             article = self._load_article(section, article_name)
             article.translations = self._article_translations(article)
             return article
-        elif os.path.samefile(os.path.dirname(path), self.fs.root_folder):
+        elif self._is_category_path(path):
             return self._fill_category(os.path.basename(path))
         else:
             section_name = os.path.basename(path)
-            category_path = os.path.dirname(path)
-            category = self._load_category(category_path)
+            category = self._load_category(os.path.basename(os.path.dirname(path)))
             section = self._load_section(category, section_name)
             self._fill_articles(section)
             return section
 
+    def load_group(self, path):
+        """
+        Loads just the category or section at the path, relative to the root folder, without its children.
+        """
+        if self._is_category_path(path):
+            return self._cached_category(os.path.basename(path))
+        return self._cached_section(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+
+
+class Compactor(object):
+
+    def __init__(self, fs):
+        self.fs = fs
+
+    def _compact_item(self, item):
+        meta = self.fs.read_json(item.meta_filepath)
+        if meta and meta != item.meta:
+            self.fs.save_json(item.meta_filepath, item.meta, merge=False)
+            return True
+        return False
+
+    def compact(self, categories):
+        """
+        Rewrites the meta of every item keeping only model.META_FIELDS. Returns the number of rewritten items.
+        """
+        count = 0
+        for category in categories:
+            for item in model.walk(category):
+                count += self._compact_item(item)
+        self.fs.flush()
+        return count
+
 
 class Remover(object):
 
     def __init__(self, fs):
         self.fs = fs
 
-    def _remove_article(self, article):
+    def visit_article(self, article):
         for translation in article.translations:
             self.fs.remove(article.content_translation_filepath(translation.locale))
             self.fs.remove(article.body_translation_filepath(translation.locale))
@@ -238,17 +560,18 @@ class Remover(object):
         self.fs.remove(article.content_filepath)
         self.fs.remove(article.body_filepath)
 
-    def _remove_group(self, section):
+    def visit_section(self, section):
         self.fs.remove_dir(section.path)
 
+    visit_category = visit_section
+
     def remove(self, item):
-        # TODO to be improved
-        if isinstance(item, model.Article):
-            self._remove_article(item)
-        if isinstance(item, model.Section):
-            self._remove_group(item)
-        if isinstance(item, model.Category):
-            self._remove_group(item)
+        item.accept(self)
+
+    def remove_all(self, items):
+        for item in items:
+            self.remove(item)
+        self.fs.flush()
 
 
 class Mover(object):
@@ -256,23 +579,30 @@ class Mover(object):
     def __init__(self, fs):
         self.fs = fs
 
+    def visit_article(self, article, dest):
+        self.fs.move(article.meta_filepath, os.path.join(
+            dest, model.DEFAULT_LOCALE, article.meta_filename + article._meta_exp))
+        for translation in article.translations:
+            content_path = article.content_translation_filepath(translation.locale)
+            self.fs.move(content_path, os.path.join(
+                dest, translation.locale, article.content_filename + article._content_exp))
+            body_path = article.body_translation_filepath(translation.locale)
+            self.fs.move(body_path, os.path.join(
+                dest, translation.locale, article.content_filename + article._body_exp))
+
+    def visit_section(self, section, dest):
+        print('Moving {} to {}'.format(section.zendesk_name, dest))
+        self.fs.move(section.path, dest)
+
+    visit_category = visit_section
+
     def move(self, item, dest):
-        # TODO to be improved
-        if isinstance(item, model.Article):
-            self.fs.move(item.meta_filepath, os.path.join(
-                dest, model.DEFAULT_LOCALE, item.meta_filename + item._meta_exp))
-            for translation in item.translations:
-                content_path = item.content_translation_filepath(translation.locale)
-                self.fs.move(content_path, os.path.join(
-                    dest, translation.locale, item.content_filename + item._content_exp))
-                body_path = item.body_translation_filepath(translation.locale)
-                self.fs.move(body_path, os.path.join(dest, translation.locale, item.content_filename + item._body_exp))
-        if isinstance(item, model.Section):
-            print('Moving category to {}'.format(dest))
-            self.fs.move(item.path, dest)
-        if isinstance(item, model.Category):
-            print('Moving category to {}'.format(dest))
-            self.fs.move(item.path, dest)
+        item.accept(self, dest)
+
+    def move_all(self, items, dests):
+        for item, dest in zip(items, dests):
+            self.move(item, dest)
+        self.fs.flush()
 
 
 class Doctor(object):
@@ -281,7 +611,7 @@ class Doctor(object):
         self.fs = fs
 
     def _fix_item_content(self, item):
-        if not os.path.exists(item.content_filepath):
+        if not self.fs.exists(item.content_filepath):
             print('Missing content file {} created'.format(item.content_filepath))
             content = item.to_content()
             for key, value in content.items():
@@ -302,37 +632,36 @@ class Doctor(object):
 
     def fix(self, categories):
         for category in categories:
-            self._fix_item_content(category)
-            for section in category.sections:
-                self._fix_item_content(section)
-                for article in section.articles:
-                    self._fix_item_content(article)
+            for item in model.walk(category):
+                self._fix_item_content(item)
+
+
+def client(root_folder, state_db=None):
+    if state_db:
+        import state
+        return FilesystemClient(root_folder, state.open_store(state_db), storage(root_folder))
+    return FilesystemClient(root_folder, storage=storage(root_folder))
 
 
-def saver(root_folder):
-    fs = FilesystemClient(root_folder)
-    return Saver(fs)
+def saver(root_folder, state_db=None):
+    return Saver(client(root_folder, state_db))
 
 
-def loader(root_folder):
-    fs = FilesystemClient(root_folder)
-    return Loader(fs)
+def loader(root_folder, state_db=None):
+    return Loader(client(root_folder, state_db))
 
 
-def remover(root_folder):
-    fs = FilesystemClient(root_folder)
-    return Remover(fs)
+def compactor(root_folder, state_db=None):
+    return Compactor(client(root_folder, state_db))
 
 
-def mover(root_folder):
-    fs = FilesystemClient(root_folder)
-    return Mover(fs)
+def remover(root_folder, state_db=None):
+    return Remover(client(root_folder, state_db))
 
 
-def doctor(root_folder):
-    fs = FilesystemClient(root_folder)
-    return Doctor(fs)
+def mover(root_folder, state_db=None):
+    return Mover(client(root_folder, state_db))
 
 
-def client(root_folder):
-    return FilesystemClient(root_folder)
+def doctor(root_folder, state_db=None):
+    return Doctor(client(root_folder, state_db))
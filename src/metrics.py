@@ -0,0 +1,214 @@
+import contextlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from urllib.parse import urlparse
+
+METRIC_PREFIX = 'zendesk_cms'
+ID_PATTERN = r'/\d+(?=/|\.json|$)'
+LOCALE_PATTERN = r'/translations/(?!missing)[\w-]+\.json$'
+
+
+def endpoint_for(method, url):
+    """
+    Groups urls by endpoint, e.g. GET https://x.zendesk.com/api/v2/help_center/en-us/articles/1.json?per_page=100
+    becomes GET /api/v2/help_center/en-us/articles/{id}.json
+    """
+    path = urlparse(url).path
+    path = re.sub(ID_PATTERN, '/{id}', path)
+    path = re.sub(LOCALE_PATTERN, '/translations/{locale}.json', path)
+    return '{} {}'.format(method.upper(), path)
+
+
+def _size(value):
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return 0
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100.0 * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Recorder(object):
+
+    """
+    Collects phase durations, per-endpoint request statistics and counters for the timings report and the metrics
+    exporters.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = OrderedDict()
+        self.requests = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.percentiles = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                calls, total = self.phases.get(name, (0, 0.0))
+                self.phases[name] = (calls + 1, total + elapsed)
+
+    def record_request(self, method, url, status, seconds, sent, received):
+        with self.lock:
+            self.requests[endpoint_for(method, url)].append((status, seconds, sent, received))
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def counter_values(self, name):
+        with self.lock:
+            return [(dict(labels), value) for (counter, labels), value in sorted(self.counters.items())
+                    if counter == name]
+
+    def latency_percentile(self, method, url, percent, min_samples=1):
+        """
+        Returns the latency percentile in seconds of the endpoint of url, None until it has min_samples responses. The
+        value is computed again only when the number of responses grew by a tenth.
+        """
+        endpoint = endpoint_for(method, url)
+        with self.lock:
+            records = self.requests.get(endpoint, [])
+            if len(records) < min_samples:
+                return None
+            count, value = self.percentiles.get((endpoint, percent), (0, None))
+            if value is None or len(records) >= count * 1.1:
+                value = _percentile([r[1] for r in records], percent)
+                self.percentiles[(endpoint, percent)] = (len(records), value)
+            return value
+
+    def samples(self, task):
+        """
+        Returns (name, labels, value, kind) tuples for everything recorded so far, kind being counter or gauge.
+        """
+        samples = []
+        for endpoint, records in sorted(self.requests.items()):
+            statuses = defaultdict(int)
+            for record in records:
+                statuses[record[0]] += 1
+            for status, count in sorted(statuses.items(), key=lambda s: str(s[0])):
+                samples.append(('requests_total', {'endpoint': endpoint, 'status': str(status)}, count, 'counter'))
+            samples.append(('request_seconds_total', {'endpoint': endpoint}, sum(r[1] for r in records), 'counter'))
+            samples.append(('request_bytes_total', {'endpoint': endpoint, 'direction': 'sent'},
+                            sum(r[2] for r in records), 'counter'))
+            samples.append(('request_bytes_total', {'endpoint': endpoint, 'direction': 'received'},
+                            sum(r[3] for r in records), 'counter'))
+        for (name, labels), value in sorted(self.counters.items()):
+            samples.append((name + '_total', dict(labels), value, 'counter'))
+        for name, (_, total) in self.phases.items():
+            samples.append(('phase_seconds', {'phase': name}, total, 'gauge'))
+        samples.append(('last_run_timestamp_seconds', {}, time.time(), 'gauge'))
+        for sample in samples:
+            sample[1]['task'] = task
+        return samples
+
+    def report(self):
+        lines = ['Phases:', '{:<40} {:>8} {:>10}'.format('phase', 'calls', 'seconds')]
+        for name, (calls, total) in self.phases.items():
+            lines.append('{:<40} {:>8} {:>10.3f}'.format(name, calls, total))
+        lines.append('')
+        lines.append('HTTP requests:')
+        lines.append('{:<70} {:>6} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+            'endpoint', 'count', 'p50 ms', 'p95 ms', 'sent', 'sent/req', 'max sent', 'received'))
+        for endpoint in sorted(self.requests):
+            records = self.requests[endpoint]
+            latencies = [r[1] * 1000 for r in records]
+            sent = [r[2] for r in records]
+            lines.append('{:<70} {:>6} {:>8.1f} {:>8.1f} {:>10} {:>10} {:>10} {:>10}'.format(
+                endpoint, len(records), _percentile(latencies, 50), _percentile(latencies, 95),
+                sum(sent), sum(sent) // len(records), max(sent), sum(r[3] for r in records)))
+        return '\n'.join(lines)
+
+
+_recorder = Recorder()
+
+
+def phase(name):
+    return _recorder.phase(name)
+
+
+def record_request(method, url, status, seconds, sent, received):
+    _recorder.record_request(method, url, status, seconds, sent, received)
+
+
+def record_response(method, url, response, seconds):
+    sent = _size(getattr(response.request, 'body', None))
+    _recorder.record_request(method, url, response.status_code, seconds, sent, _size(response.content))
+
+
+def increment(name, value=1, **labels):
+    _recorder.increment(name, value, **labels)
+
+
+def counter_values(name):
+    return _recorder.counter_values(name)
+
+
+def latency_percentile(method, url, percent, min_samples=1):
+    return _recorder.latency_percentile(method, url, percent, min_samples)
+
+
+def report():
+    return _recorder.report()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_textfile(path, task, recorder=None):
+    """
+    Writes the metrics in the Prometheus text format, to be picked up by the node_exporter textfile collector. The file
+    is replaced atomically so the collector never reads a partial file.
+    """
+    recorder = recorder or _recorder
+    lines = []
+    typed = set()
+    for name, labels, value, kind in recorder.samples(task):
+        metric = '{}_{}'.format(METRIC_PREFIX, name)
+        if metric not in typed:
+            lines.append('# TYPE {} {}'.format(metric, kind))
+            typed.add(metric)
+        label_text = ','.join('{}="{}"'.format(k, _escape(v)) for k, v in sorted(labels.items()))
+        lines.append('{}{{{}}} {}'.format(metric, label_text, value))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        fp.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def _statsd_name(value):
+    return re.sub(r'[^\w-]+', '_', str(value)).strip('_')
+
+
+def send_statsd(address, task, recorder=None):
+    """
+    Sends the metrics to a StatsD daemon listening on host:port over UDP. Labels become part of the metric name.
+    """
+    import socket
+    recorder = recorder or _recorder
+    host, _, port = address.rpartition(':')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for name, labels, value, kind in recorder.samples(task):
+            parts = [METRIC_PREFIX, _statsd_name(labels.pop('task')), name]
+            parts.extend(_statsd_name(v) for _, v in sorted(labels.items()))
+            if name in ('request_seconds_total', 'phase_seconds'):
+                line = '{}:{}|ms'.format('.'.join(parts), int(value * 1000))
+            else:
+                line = '{}:{}|{}'.format('.'.join(parts), value, 'c' if kind == 'counter' else 'g')
+            sock.sendto(line.encode('utf-8'), (host or 'localhost', int(port)))
+    finally:
+        sock.close()
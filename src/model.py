@@ -1,15 +1,48 @@
+import hashlib
+import json
 import os
 import utils
-import markdown
 
 DEFAULT_LOCALE = 'en-US'
+# the only fields of the remote payloads kept in .meta files
+META_FIELDS = ('id', 'category_id', 'section_id', 'source_locale', 'updated_at', 'webtranslateit_ids',
+               'webtranslateit_hashes', 'body_hash', 'content_hash', 'remote_hash')
+
+
+def compact_meta(meta):
+    return {key: value for key, value in (meta or {}).items() if key in META_FIELDS}
+
+
+def _hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def remote_hash(title, body):
+    """
+    The hash of a title and body as Zendesk stores them, for items and translations alike.
+    """
+    return _hash([title or '', body or ''])
+
+
+def walk(item):
+    """
+    Yields the item and everything under it, every parent before its children.
+    """
+    yield item
+    for section in getattr(item, 'sections', []):
+        yield from walk(section)
+    for article in getattr(item, 'articles', []):
+        yield article
 
 
 class Base(object):
     _meta_exp = '.meta'
     _content_exp = '.json'
     _translate_id_key = 'webtranslateit_ids'
+    _translate_hash_key = 'webtranslateit_hashes'
     _zendesk_id_key = 'id'
+    _content_hash_key = 'content_hash'
+    _remote_hash_key = 'remote_hash'
 
     def __init__(self, name, filename):
         super().__init__()
@@ -24,7 +57,7 @@ class Base(object):
 
     @meta.setter
     def meta(self, value):
-        self._meta = value or {}
+        self._meta = compact_meta(value)
 
     @property
     def zendesk_id(self):
@@ -44,14 +77,52 @@ class Base(object):
     def translate_ids(self, value):
         self._meta[self._translate_id_key] = value
 
+    @property
+    def translate_hashes(self):
+        return self._meta.get(self._translate_hash_key, {})
+
+    @translate_hashes.setter
+    def translate_hashes(self, value):
+        self._meta[self._translate_hash_key] = value
+
     @property
     def meta_filepath(self):
         return os.path.join(self.path, self.meta_filename + self._meta_exp)
 
+    def accept(self, visitor, *args):
+        """
+        Calls the visit_category, visit_section or visit_article method of the visitor, if it has one.
+        """
+        visit = getattr(visitor, 'visit_' + self.zendesk_name, None)
+        if visit:
+            return visit(self, *args)
+
     @property
     def content_filepath(self):
         return os.path.join(self.path, self.content_filename + self._content_exp)
 
+    @property
+    def content_hash(self):
+        return _hash(self.to_content())
+
+    @property
+    def stored_content_hash(self):
+        """
+        The hash of the content last imported from or exported to Zendesk.
+        """
+        return self._meta.get(self._content_hash_key)
+
+    @property
+    def stored_remote_hash(self):
+        """
+        The hash of the title and body Zendesk had at the last import or export.
+        """
+        return self._meta.get(self._remote_hash_key)
+
+    @classmethod
+    def remote_hash_of(cls, payload):
+        return remote_hash(*(payload.get(field) for field in cls._remote_fields))
+
 
 # TODO use for default locale
 class GroupTranslation(object):
@@ -72,6 +143,7 @@ class GroupTranslation(object):
 class Group(Base):
     meta_filename = '.group'
     content_filename = '__group__'
+    _remote_fields = ('name', 'description')
 
     def __init__(self, name, description, filename):
         super().__init__(name, filename)
@@ -173,6 +245,7 @@ class ArticleTranslation(object):
         body = self.body
         if image_cdn:
             body = utils.convert_to_cdn_path(image_cdn, body)
+        import markdown
         body = markdown.markdown(body)
 
         return {
@@ -188,6 +261,8 @@ class Article(Base):
 
     _body_exp = '.mkdown'
     _meta_pattern = '.article_{}'
+    _body_hash_key = 'body_hash'
+    _remote_fields = ('title', 'body')
 
     def __init__(self, section, name, body, filename):
         super().__init__(name, filename)
@@ -210,10 +285,26 @@ class Article(Base):
     def path(self):
         return self.path_from_section(self.section)
 
+    @property
+    def body_hash(self):
+        return hashlib.sha1((self.body or '').encode('utf-8')).hexdigest()
+
+    @property
+    def content_hash(self):
+        return _hash([self.to_content(), self.body or ''])
+
+    @property
+    def stored_body_hash(self):
+        """
+        The hash of the body last imported from or exported to Zendesk.
+        """
+        return self._meta.get(self._body_hash_key)
+
     def to_dict(self, image_cdn=None):
         body = self.body
         if image_cdn:
             body = utils.convert_to_cdn_path(image_cdn, body)
+        import markdown
         body = markdown.markdown(body)
         return {
             'title': self.name,
@@ -247,6 +338,16 @@ class Article(Base):
         body_path = os.path.join(path, name + cls._body_exp)
         return meta_path, content_path, body_path
 
+    @classmethod
+    def name_from_meta_filename(cls, filename):
+        """
+        Returns the name of the article a .meta file belongs to, None when it is not the meta of an article.
+        """
+        prefix, suffix = cls._meta_pattern.format(''), cls._meta_exp
+        if filename.startswith(prefix) and filename.endswith(suffix) and len(filename) > len(prefix + suffix):
+            return filename[len(prefix):-len(suffix)]
+        return None
+
     @staticmethod
     def from_dict(section, meta, content, body, filename):
         article = Article(section, content['name'], body, filename)
@@ -256,3 +357,4 @@ class Article(Base):
     @property
     def new_item_url(self):
         return 'sections/{}/articles.json'.format(self.section.zendesk_id)
+
@@ -0,0 +1,66 @@
+import gzip
+import json
+import os
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT = 'help-center.jsonl.gz'
+TRANSLATION = 'translation'
+
+
+def write(path, records, header=None):
+    """
+    Writes the records to a gzipped file with one JSON object per line, after a header line. Records are written as
+    they come so a snapshot of any size takes little memory. The file is replaced atomically once complete. Returns
+    the number of records.
+    """
+    count = 0
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as fp:
+        fp.write(json.dumps(dict(header or {}, type='snapshot', version=SNAPSHOT_VERSION), sort_keys=True) + '\n')
+        for record in records:
+            fp.write(json.dumps(record, sort_keys=True) + '\n')
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def read(path):
+    """
+    Yields the records of the snapshot at path one at a time.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as fp:
+        header = json.loads(fp.readline() or '{}')
+        if header.get('type') != 'snapshot':
+            raise ValueError('{} is not a snapshot'.format(path))
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('Snapshot {} has version {}, only version {} is supported'.format(
+                path, header.get('version'), SNAPSHOT_VERSION))
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def item_record(kind, data):
+    return {'type': kind, 'data': data}
+
+
+def translation_record(kind, item_id, data):
+    return {'type': TRANSLATION, 'item_type': kind, 'item_id': item_id, 'data': data}
+
+
+def grouped(records):
+    """
+    Yields (item record, translations) pairs. Every item is followed by its translations in a snapshot, so this needs
+    to hold only one item at a time.
+    """
+    record, translations = None, []
+    for next_record in records:
+        if next_record['type'] == TRANSLATION:
+            if record is not None and next_record['item_id'] == record['data'].get('id'):
+                translations.append(next_record['data'])
+            continue
+        if record is not None:
+            yield record, translations
+        record, translations = next_record, []
+    if record is not None:
+        yield record, translations
@@ -0,0 +1,176 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+META_EXTENSION = '.meta'
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS items (path TEXT PRIMARY KEY, zendesk_id INTEGER, updated_at TEXT, meta TEXT NOT NULL)',
+    # lookups by remote id of earlier versions, items are only read by path
+    'DROP INDEX IF EXISTS items_zendesk_id',
+    'DROP TABLE IF EXISTS translate_files'
+]
+
+
+def _normalize(path):
+    return os.path.normpath(path).replace('\\', '/')
+
+
+class StateStore(object):
+
+    """
+    Keeps the content of the .meta files (Zendesk ids, WebTranslateIt ids and hashes, remote timestamps) in a single
+    SQLite database. Everything is read with one query the first time it is needed, changes are kept in memory and
+    written in one transaction by commit().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._connection = None
+        self._items = None
+        self._dirty = set()
+        self._removed = set()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self._connection:
+                for statement in SCHEMA:
+                    self._connection.execute(statement)
+        return self._connection
+
+    @property
+    def items(self):
+        with self.lock:
+            if self._items is None:
+                rows = self.connection.execute('SELECT path, meta FROM items')
+                self._items = {path: json.loads(meta) for path, meta in rows}
+            return self._items
+
+    def read(self, path):
+        return dict(self.items.get(_normalize(path), {}))
+
+    def save(self, path, data, merge=True):
+        """
+        Merges data into the stored meta of path, like FilesystemClient.save_json does with the files, or replaces it.
+        """
+        path = _normalize(path)
+        with self.lock:
+            meta = dict(self.items.get(path, {})) if merge else {}
+            meta.update(data)
+            self.items[path] = meta
+            self._dirty.add(path)
+            self._removed.discard(path)
+        return meta
+
+    def remove(self, path):
+        path = _normalize(path)
+        with self.lock:
+            if self.items.pop(path, None) is not None:
+                self._removed.add(path)
+            self._dirty.discard(path)
+
+    def _paths_under(self, folder):
+        prefix = _normalize(folder) + '/'
+        return [path for path in self.items if path.startswith(prefix)]
+
+    def remove_tree(self, folder):
+        with self.lock:
+            for path in self._paths_under(folder):
+                self.remove(path)
+
+    def move(self, old_path, new_path):
+        with self.lock:
+            old_path = _normalize(old_path)
+            if old_path in self.items:
+                meta = self.items[old_path]
+                self.remove(old_path)
+                self.save(new_path, meta)
+            else:
+                old_prefix, new_prefix = old_path + '/', _normalize(new_path) + '/'
+                for path in self._paths_under(old_path):
+                    meta = self.items[path]
+                    self.remove(path)
+                    self.save(new_prefix + path[len(old_prefix):], meta)
+
+    def commit(self):
+        """
+        Writes all changes made since the last commit in a single transaction.
+        """
+        with self.lock:
+            if not self._dirty and not self._removed:
+                return
+            rows = [(path, self._items[path].get('id'), self._items[path].get('updated_at'),
+                     json.dumps(self._items[path], sort_keys=True)) for path in sorted(self._dirty)]
+            with self.connection:
+                self.connection.executemany('DELETE FROM items WHERE path = ?', [(p,) for p in self._removed])
+                self.connection.executemany('INSERT OR REPLACE INTO items (path, zendesk_id, updated_at, meta) '
+                                            'VALUES (?, ?, ?, ?)', rows)
+            self._dirty.clear()
+            self._removed.clear()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Commits the changes made inside the block, or drops them when it fails.
+        """
+        try:
+            yield self
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+
+    def rollback(self):
+        with self.lock:
+            self._items = None
+            self._dirty.clear()
+            self._removed.clear()
+
+    def migrate(self, root_folder):
+        """
+        Imports every .meta file under root_folder, skipping hidden folders such as the cache. Returns the number of
+        imported files. The files themselves are left in place.
+        """
+        count = 0
+        with self.transaction():
+            for folder, dirs, files in os.walk(root_folder):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                for filename in files:
+                    if not filename.endswith(META_EXTENSION):
+                        continue
+                    full_path = os.path.join(folder, filename)
+                    with open(full_path, 'r') as fp:
+                        try:
+                            meta = json.load(fp)
+                        except ValueError:
+                            continue
+                    self.save(os.path.relpath(full_path, root_folder), meta)
+                    count += 1
+        return count
+
+    def close(self):
+        self.commit()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_stores = {}
+
+
+def open_store(path):
+    """
+    Returns the store for the database at path, shared by all clients of one run.
+    """
+    path = os.path.abspath(path)
+    if path not in _stores:
+        _stores[path] = StateStore(path)
+    return _stores[path]
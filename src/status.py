@@ -0,0 +1,92 @@
+import model
+import sync
+
+NEW = 'new'
+MODIFIED_LOCALLY = 'modified locally'
+MODIFIED_REMOTELY = 'modified remotely'
+CONFLICT = 'conflict'
+DELETED_LOCALLY = 'deleted locally'
+DELETED_REMOTELY = 'deleted remotely'
+NEW_REMOTELY = 'new remotely'
+STATUSES = (NEW, MODIFIED_LOCALLY, MODIFIED_REMOTELY, CONFLICT, DELETED_LOCALLY, DELETED_REMOTELY, NEW_REMOTELY)
+
+
+class StatusChecker(object):
+
+    """
+    Three-way diff of the tree, the last import or export recorded in the .meta files and Zendesk. Both sides are
+    compared by hash with what the meta recorded, so Zendesk is only read with one listing per kind.
+    """
+
+    def __init__(self, fs, lister):
+        self.fs = fs
+        self.lister = lister
+
+    def _modified_locally(self, item):
+        if item.stored_content_hash:
+            return item.stored_content_hash != item.content_hash
+        # trees imported before content hashes were recorded only know the body of their articles
+        if isinstance(item, model.Article) and item.stored_body_hash:
+            return item.stored_body_hash != item.body_hash
+        return False
+
+    def _modified_remotely(self, item, payload):
+        if item.stored_remote_hash:
+            return item.stored_remote_hash != item.remote_hash_of(payload)
+        updated_at = item.meta.get('updated_at')
+        return bool(updated_at) and updated_at != payload.get('updated_at')
+
+    def _local_status(self, item, remote):
+        if not item.zendesk_id:
+            return NEW
+        payload = remote.get((item.zendesk_name, item.zendesk_id))
+        if payload is None:
+            return DELETED_REMOTELY
+        modified_locally = self._modified_locally(item)
+        modified_remotely = self._modified_remotely(item, payload)
+        if modified_locally and modified_remotely:
+            return CONFLICT
+        if modified_locally:
+            return MODIFIED_LOCALLY
+        if modified_remotely:
+            return MODIFIED_REMOTELY
+        return None
+
+    def _describe(self, item):
+        path = item.body_filepath if isinstance(item, model.Article) else item.content_filepath
+        return self.fs.relative_path(path)
+
+    def status(self, categories):
+        """
+        Returns (status, description) for every item that differs between the tree and Zendesk, the items of the tree
+        first and in its order.
+        """
+        remote = self.lister.list()
+        changes = []
+        local_ids = set()
+        for item in (item for category in categories for item in model.walk(category)):
+            if item.zendesk_id:
+                local_ids.add((item.zendesk_name, item.zendesk_id))
+            item_status = self._local_status(item, remote)
+            if item_status:
+                changes.append((item_status, self._describe(item)))
+
+        # articles deleted from the tree usually leave their .meta file behind, other items are taken for new ones
+        deleted_ids = {meta.get('id') for meta in sync.RenameDetector(self.fs).orphans().values()}
+        for (zendesk_name, zendesk_id), payload in sorted(remote.items()):
+            if (zendesk_name, zendesk_id) in local_ids:
+                continue
+            item_status = NEW_REMOTELY
+            if zendesk_name == model.Article.zendesk_name and zendesk_id in deleted_ids:
+                item_status = DELETED_LOCALLY
+            changes.append((item_status, '{} {} {}'.format(zendesk_name, zendesk_id,
+                                                           payload.get('name') or payload.get('title'))))
+        return changes
+
+
+def checker(root_folder, state_db, company_uri, user, password, cache_folder=None, concurrency=1):
+    import filesystem
+    import zendesk
+
+    return StatusChecker(filesystem.client(root_folder, state_db),
+                         zendesk.lister(company_uri, user, password, cache_folder, concurrency))
@@ -0,0 +1,133 @@
+import logging
+import os
+
+import metrics
+import model
+
+
+class RenameDetector(object):
+
+    """
+    Finds articles renamed or moved to another section on disk. Their .meta file is usually left behind, so the tools
+    see an orphaned meta and a new article without ids. The two are matched when the body hash recorded in the meta
+    at the last import or export is the one of the new article and no other orphan or new article shares it.
+    """
+
+    def __init__(self, fs):
+        self.fs = fs
+
+    def orphans(self):
+        """
+        Returns the meta, by path, of the articles whose files are gone but that exist in Zendesk or WebTranslateIt.
+        """
+        orphans = {}
+        for meta_path in self.fs.meta_files():
+            folder, filename = os.path.split(meta_path)
+            name = model.Article.name_from_meta_filename(filename)
+            if name is None or self.fs.exists(os.path.join(folder, name + model.Article._body_exp)):
+                continue
+            meta = self.fs.read_json(meta_path)
+            if meta.get('id') or meta.get('webtranslateit_ids'):
+                orphans[meta_path] = meta
+        return orphans
+
+    def _by_hash(self, pairs):
+        groups = {}
+        for body_hash, value in pairs:
+            if body_hash:
+                groups.setdefault(body_hash, []).append(value)
+        return {body_hash: values[0] for body_hash, values in groups.items() if len(values) == 1}
+
+    def matches(self, categories):
+        """
+        Returns (article, old meta path, old meta) for every new article that is a renamed or moved one.
+        """
+        new_articles = [item for category in categories for item in model.walk(category)
+                        if isinstance(item, model.Article) and not item.zendesk_id and not item.translate_ids]
+        if not new_articles:
+            return []
+        orphans = self.orphans()
+        orphans_by_hash = self._by_hash((meta.get('body_hash'), path) for path, meta in orphans.items())
+        articles_by_hash = self._by_hash((article.body_hash, article) for article in new_articles)
+        return [(article, orphans_by_hash[body_hash], orphans[orphans_by_hash[body_hash]])
+                for body_hash, article in articles_by_hash.items() if body_hash in orphans_by_hash]
+
+
+class Syncer(object):
+
+    """
+    Turns renamed and moved articles into in-place updates: a section_id change in Zendesk and a rename of the
+    WebTranslateIt files, instead of creating them again and leaving the old ones behind.
+    """
+
+    def __init__(self, fs, zendesk_mover, translate_mover):
+        self.fs = fs
+        self.detector = RenameDetector(fs)
+        self.zendesk_mover = zendesk_mover
+        self.translate_mover = translate_mover
+
+    def _move_local_translations(self, article, old_meta_path):
+        old_locale_folder = os.path.dirname(old_meta_path)
+        old_name = model.Article.name_from_meta_filename(os.path.basename(old_meta_path))
+        old_section_folder = os.path.dirname(old_locale_folder)
+        for locale in self.fs.read_directories(old_section_folder):
+            if locale == model.DEFAULT_LOCALE:
+                continue
+            for extension, new_path in ((article._content_exp, article.content_translation_filepath(locale)),
+                                        (article._body_exp, article.body_translation_filepath(locale))):
+                old_path = os.path.join(old_section_folder, locale, old_name + extension)
+                if os.path.normpath(old_path) != os.path.normpath(new_path):
+                    self.fs.move(old_path, new_path)
+
+    def _save(self, article, old_meta_path):
+        self.fs.remove(old_meta_path)
+        self.fs.save_json(article.meta_filepath, article.meta, merge=False)
+        self._move_local_translations(article, old_meta_path)
+        metrics.increment('items', kind=article.zendesk_name, action='renamed')
+
+    def sync(self, categories):
+        """
+        Carries the ids of renamed and moved articles over and updates Zendesk and WebTranslateIt. Returns the number
+        of articles updated. The local files of an article change only once all its remote updates succeeded, so the
+        next run finds the others again.
+        """
+        moved = {}
+        renamed = []
+        for article, old_meta_path, meta in self.detector.matches(categories):
+            if meta.get('id') and not article.section.zendesk_id:
+                logging.warning('Article %s was moved to a section that is not in Zendesk yet, it will be exported '
+                                'as a new one', article.name)
+                continue
+            print('Article {} was renamed or moved from {}'.format(article.body_filepath, old_meta_path))
+            if meta.get('id') and meta.get('section_id') != article.section.zendesk_id:
+                moved.setdefault(article.section, []).append(article)
+                meta = dict(meta, section_id=article.section.zendesk_id)
+            article.meta = meta
+            renamed.append((article, old_meta_path))
+
+        failed = set()
+        for section, articles in moved.items():
+            updated = {id(article) for article in self.zendesk_mover.move_all(articles, section)}
+            failed.update(id(article) for article in articles if id(article) not in updated)
+        articles = [article for article, _ in renamed if article.translate_ids and id(article) not in failed]
+        if articles:
+            updated = {id(article) for article in self.translate_mover.rename_all(articles)}
+            failed.update(id(article) for article in articles if id(article) not in updated)
+        saved = [(article, old_meta_path) for article, old_meta_path in renamed if id(article) not in failed]
+        for article, old_meta_path in saved:
+            self._save(article, old_meta_path)
+        for article, old_meta_path in renamed:
+            if id(article) in failed:
+                logging.warning('Updating renamed article %s failed, it is tried again on the next run', article.name)
+        self.fs.flush()
+        return len(saved)
+
+
+def syncer(root_folder, state_db, company_uri, user, password, api_key, concurrency=1):
+    import filesystem
+    import translate
+    import zendesk
+
+    return Syncer(filesystem.client(root_folder, state_db),
+                  zendesk.mover(company_uri, user, password, None, concurrency),
+                  translate.mover(api_key, concurrency, root_folder))
@@ -0,0 +1,429 @@
+"""
+In-process stand-in for the Zendesk help center and WebTranslateIt APIs.
+
+Implements the endpoints used by zendesk.ZendeskRequest and translate.WebTranslateItRequest on top of an in-memory
+store, with configurable latency, page size and 429 injection. Point the clients at it with:
+
+    server = FakeServer(per_page=30, latency=0.01).start()
+    req = zendesk.ZendeskRequest(server.url, 'user', 'password')
+    wti = translate.WebTranslateItRequest('api key', server.url)
+"""
+import email
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_LOCALE = 'en-us'
+TIMESTAMP = '2015-05-05T10:00:00Z'
+
+GROUP_NAMES = {'categories': 'category', 'sections': 'section', 'articles': 'article'}
+PARENT_KEYS = {'sections': ('categories', 'category_id'), 'articles': ('sections', 'section_id')}
+
+ROUTES = [
+    ('GET', r'^/api/v2/help_center/[\w-]+/(?P<group>categories|sections|articles)\.json$', 'list_items'),
+    ('POST', r'^/api/v2/help_center/[\w-]+/(?P<group>categories)\.json$', 'create_item'),
+    ('GET', r'^/api/v2/help_center/[\w-]+/(?P<parent_group>categories|sections)/(?P<parent_id>\d+)/'
+            r'(?P<group>sections|articles)\.json$', 'list_items'),
+    ('POST', r'^/api/v2/help_center/[\w-]+/(?P<parent_group>categories|sections)/(?P<parent_id>\d+)/'
+             r'(?P<group>sections|articles)\.json$', 'create_item'),
+    ('GET', r'^/api/v2/help_center/[\w-]+/(?P<group>categories|sections|articles)/(?P<id>\d+)\.json$', 'get_item'),
+    ('PUT', r'^/api/v2/help_center/[\w-]+/(?P<group>categories|sections|articles)/(?P<id>\d+)\.json$', 'update_item'),
+    ('DELETE', r'^/api/v2/help_center/[\w-]+/(?P<group>categories|sections|articles)/(?P<id>\d+)\.json$',
+     'delete_item'),
+    ('GET', r'^/api/v2/help_center/(?P<group>categories|sections|articles)/(?P<id>\d+)/translations/missing\.json$',
+     'missing_translations'),
+    ('GET', r'^/api/v2/help_center/(?P<group>categories|sections|articles)/(?P<id>\d+)/translations\.json$',
+     'list_translations'),
+    ('POST', r'^/api/v2/help_center/(?P<group>categories|sections|articles)/(?P<id>\d+)/translations\.json$',
+     'create_translation'),
+    ('GET', r'^/api/v2/help_center/(?P<group>categories|sections|articles)/(?P<id>\d+)/translations/'
+            r'(?P<locale>[\w-]+)\.json$', 'get_translation'),
+    ('PUT', r'^/api/v2/help_center/(?P<group>categories|sections|articles)/(?P<id>\d+)/translations/'
+            r'(?P<locale>[\w-]+)\.json$', 'update_translation'),
+    ('GET', r'^/api/projects/(?P<key>[^/]+)\.json$', 'wti_project'),
+    ('POST', r'^/api/projects/(?P<key>[^/]+)/files$', 'wti_create_file'),
+    ('PUT', r'^/api/projects/(?P<key>[^/]+)/files/(?P<id>\d+)/locales/(?P<locale>[\w-]+)$', 'wti_update_file'),
+    ('DELETE', r'^/api/projects/(?P<key>[^/]+)/files/(?P<id>\d+)$', 'wti_delete_file'),
+]
+
+
+class NotFound(Exception):
+    pass
+
+
+class HelpCenterStore(object):
+
+    """
+    In-memory help center and WebTranslateIt project. All access goes through a single lock.
+    """
+
+    def __init__(self, locales=(DEFAULT_LOCALE,)):
+        self.lock = threading.RLock()
+        self.locales = list(locales)
+        self.items = {'categories': {}, 'sections': {}, 'articles': {}}
+        self.translations = {}
+        self.files = {}
+        self._ids = iter(range(1000, 10 ** 9))
+
+    def _next_id(self):
+        return next(self._ids)
+
+    def add_item(self, group, data, parent_id=None):
+        with self.lock:
+            item_id = self._next_id()
+            item = {
+                'id': item_id,
+                'url': '/api/v2/help_center/{}/{}/{}.json'.format(DEFAULT_LOCALE, group, item_id),
+                'html_url': '/hc/{}/{}/{}'.format(DEFAULT_LOCALE, group, item_id),
+                'position': 0,
+                'locale': DEFAULT_LOCALE,
+                'source_locale': DEFAULT_LOCALE,
+                'created_at': TIMESTAMP,
+                'updated_at': TIMESTAMP,
+                'outdated': False
+            }
+            item.update(data)
+            if group == 'articles':
+                item.setdefault('title', item.get('name', ''))
+                item['name'] = item['title']
+                item.setdefault('body', '')
+                item.setdefault('comments_disabled', False)
+            else:
+                item.setdefault('description', '')
+            if group in PARENT_KEYS:
+                item[PARENT_KEYS[group][1]] = parent_id
+            self.items[group][item_id] = item
+            self.translations[(group, item_id)] = {DEFAULT_LOCALE: self._translation_from(group, item)}
+            return item
+
+    def add_category(self, name, description=''):
+        return self.add_item('categories', {'name': name, 'description': description})
+
+    def add_section(self, category_id, name, description=''):
+        return self.add_item('sections', {'name': name, 'description': description}, category_id)
+
+    def add_article(self, section_id, title, body=''):
+        return self.add_item('articles', {'title': title, 'body': body}, section_id)
+
+    def add_translation(self, group, item_id, locale, title, body):
+        with self.lock:
+            translation = {'id': self._next_id(), 'locale': locale, 'title': title, 'body': body,
+                           'source_id': item_id, 'source_type': GROUP_NAMES[group].capitalize(),
+                           'created_at': TIMESTAMP, 'updated_at': TIMESTAMP, 'outdated': False}
+            self.translations[(group, item_id)][locale] = translation
+            return translation
+
+    def _translation_from(self, group, item):
+        body = item['body'] if group == 'articles' else item['description']
+        title = item['title'] if group == 'articles' else item['name']
+        return {'id': self._next_id(), 'locale': DEFAULT_LOCALE, 'title': title, 'body': body,
+                'source_id': item['id'], 'source_type': GROUP_NAMES[group].capitalize(),
+                'created_at': TIMESTAMP, 'updated_at': TIMESTAMP, 'outdated': False}
+
+    def get(self, group, item_id):
+        try:
+            return self.items[group][item_id]
+        except KeyError:
+            raise NotFound()
+
+    def children(self, group, parent_id):
+        parent_key = PARENT_KEYS[group][1]
+        return [i for i in self.items[group].values() if i[parent_key] == parent_id]
+
+    def remove(self, group, item_id):
+        self.get(group, item_id)
+        del self.items[group][item_id]
+        del self.translations[(group, item_id)]
+        for child_group, (parent_group, _) in PARENT_KEYS.items():
+            if parent_group == group:
+                for child in self.children(child_group, item_id):
+                    self.remove(child_group, child['id'])
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def store(self):
+        return self.server.fake.store
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        parsed = urlparse(self.path)
+        self.query = parse_qs(parsed.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+        for route_method, pattern, handler_name in ROUTES:
+            match = re.match(pattern, parsed.path)
+            if route_method == method and match:
+                break
+        else:
+            fake.record(method, 'unknown', 404, len(self.body))
+            return self._send_json(404, {'error': 'RecordNotFound'})
+
+        fake.enter()
+        try:
+            if fake.latency:
+                time.sleep(fake.latency)
+            if fake.should_rate_limit():
+                fake.record(method, handler_name, 429, len(self.body))
+                return self._send(429, b'', {'Retry-After': str(fake.retry_after)})
+            try:
+                with self.store.lock:
+                    status, payload = getattr(self, handler_name)(**match.groupdict())
+            except NotFound:
+                status, payload = 404, {'error': 'RecordNotFound'}
+            fake.record(method, handler_name, status, len(self.body))
+            if isinstance(payload, str):
+                return self._send(status, payload.encode('utf-8'), {'Content-Type': 'text/plain'})
+            return self._send_json(status, payload)
+        finally:
+            fake.leave()
+
+    def _send(self, status, data, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+        if self.command == 'GET' and status == 200 and self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', {'ETag': etag})
+        return self._send(status, data, {'Content-Type': 'application/json', 'ETag': etag})
+
+    def _json_body(self):
+        return json.loads(self.body.decode('utf-8')) if self.body else {}
+
+    def _form_body(self):
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = email.message_from_bytes(
+                'Content-Type: {}\r\n\r\n'.format(content_type).encode('utf-8') + self.body)
+            form = {}
+            for part in message.get_payload():
+                name = part.get_param('name', header='content-disposition')
+                form[name] = part.get_payload(decode=True).decode('utf-8')
+            return form
+        return {k: v[0] for k, v in parse_qs(self.body.decode('utf-8')).items()}
+
+    def _page(self, group, items):
+        per_page = min(int(self.query.get('per_page', [100])[0]), self.server.fake.per_page)
+        page = int(self.query.get('page', [1])[0])
+        start = (page - 1) * per_page
+        page_count = max(1, -(-len(items) // per_page))
+        next_page = None
+        if page < page_count:
+            next_page = '{}{}?per_page={}&page={}'.format(self.server.fake.url, urlparse(self.path).path,
+                                                          per_page, page + 1)
+        return {group: items[start:start + per_page], 'page': page, 'per_page': per_page,
+                'page_count': page_count, 'count': len(items), 'next_page': next_page,
+                'previous_page': None}
+
+    def _public(self, item):
+        return dict(item, url=self.server.fake.url + item['url'])
+
+    # Zendesk
+
+    def list_items(self, group, parent_group=None, parent_id=None):
+        if parent_id:
+            self.store.get(parent_group, int(parent_id))
+            items = self.store.children(group, int(parent_id))
+        else:
+            items = list(self.store.items[group].values())
+        return 200, self._page(group, [self._public(i) for i in items])
+
+    def create_item(self, group, parent_group=None, parent_id=None):
+        data = self._json_body()[GROUP_NAMES[group]]
+        if parent_id:
+            self.store.get(parent_group, int(parent_id))
+        item = self.store.add_item(group, data, int(parent_id) if parent_id else None)
+        return 201, {GROUP_NAMES[group]: self._public(item)}
+
+    def get_item(self, group, id):
+        return 200, {GROUP_NAMES[group]: self._public(self.store.get(group, int(id)))}
+
+    def update_item(self, group, id):
+        item = self.store.get(group, int(id))
+        data = self._json_body()
+        item.update(data.get(GROUP_NAMES[group], data))
+        return 200, {GROUP_NAMES[group]: self._public(item)}
+
+    def delete_item(self, group, id):
+        self.store.remove(group, int(id))
+        return 200, {}
+
+    def missing_translations(self, group, id):
+        existing = self.store.translations.get((group, int(id)))
+        if existing is None:
+            raise NotFound()
+        return 200, {'locales': [locale for locale in self.store.locales if locale not in existing]}
+
+    def list_translations(self, group, id):
+        existing = self.store.translations.get((group, int(id)))
+        if existing is None:
+            raise NotFound()
+        return 200, self._page('translations', list(existing.values()))
+
+    def create_translation(self, group, id):
+        self.store.get(group, int(id))
+        data = self._json_body()['translation']
+        translation = self.store.add_translation(group, int(id), data['locale'], data.get('title', ''),
+                                                 data.get('body', ''))
+        return 201, {'translation': translation}
+
+    def get_translation(self, group, id, locale):
+        translation = self.store.translations.get((group, int(id)), {}).get(locale)
+        if translation is None:
+            raise NotFound()
+        return 200, {'translation': translation}
+
+    def update_translation(self, group, id, locale):
+        translation = self.store.translations.get((group, int(id)), {}).get(locale)
+        if translation is None:
+            raise NotFound()
+        translation.update(self._json_body()['translation'])
+        item = self.store.get(group, int(id))
+        if locale == item['source_locale']:
+            # like Zendesk, the translation in the source locale is the content of the item
+            title_key, body_key = ('title', 'body') if group == 'articles' else ('name', 'description')
+            item.update({title_key: translation['title'], body_key: translation['body']})
+        return 200, {'translation': translation}
+
+    # WebTranslateIt
+
+    def wti_project(self, key):
+        files = [{'id': file_id, 'name': f['name'], 'locale_code': f['locale_code']}
+                 for file_id, f in self.store.files.items()]
+        return 200, {'project': {'project_files': files}}
+
+    def wti_create_file(self, key):
+        form = self._form_body()
+        file_id = self.store._next_id()
+        self.store.files[file_id] = {'name': form.get('name'), 'content': form.get('file', ''),
+                                     'locale_code': 'en-US'}
+        return 200, str(file_id)
+
+    def wti_update_file(self, key, id, locale):
+        stored = self.store.files.get(int(id))
+        if stored is None:
+            raise NotFound()
+        form = self._form_body()
+        stored['name'] = form.get('name', stored['name'])
+        if 'file' in form:
+            stored['content'] = form['file']
+        return 200, 'OK'
+
+    def wti_delete_file(self, key, id):
+        if self.store.files.pop(int(id), None) is None:
+            raise NotFound()
+        return 200, 'OK'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FakeServer(object):
+
+    """
+    Runs FakeRequestHandler on a local port in a background thread.
+
+    latency - seconds added to every request
+    per_page - maximum page size for listings, regardless of what the client asks for
+    rate_limit_every - every n-th request is answered with 429 Too Many Requests (0 disables)
+    retry_after - value of the Retry-After header sent with 429 responses
+    """
+
+    def __init__(self, store=None, latency=0, per_page=100, rate_limit_every=0, retry_after=0):
+        self.store = store or HelpCenterStore()
+        self.latency = latency
+        self.per_page = per_page
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._count = 0
+        self._stats_lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._httpd = _HTTPServer(('127.0.0.1', 0), FakeRequestHandler)
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def enter(self):
+        with self._stats_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+
+    def should_rate_limit(self):
+        with self._stats_lock:
+            self._count += 1
+            return bool(self.rate_limit_every) and self._count % self.rate_limit_every == 0
+
+    def record(self, method, endpoint, status, size):
+        with self._stats_lock:
+            self.requests[(method, endpoint, status)] += 1
+            self.bytes_received += size
+
+    @property
+    def request_count(self):
+        return sum(self.requests.values())
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.requests.clear()
+            self.bytes_received = 0
+            self.max_in_flight = 0
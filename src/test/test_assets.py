@@ -0,0 +1,98 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+import os
+import tempfile
+import shutil
+
+import assets
+import utils
+
+
+class TestAssetUploader(TestCase):
+
+    def setUp(self):
+        self.images_folder = tempfile.mkdtemp()
+        self.store_folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.images_folder, 'images'))
+        self._write_image('images/logo.PNG', b'logo')
+        self._write_image('images/copy.png', b'logo')
+        self.uploader = assets.uploader(self.store_folder, 'https://cdn.io/', self.images_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.images_folder)
+        shutil.rmtree(self.store_folder)
+
+    def _write_image(self, path, data):
+        with open(os.path.join(self.images_folder, path), 'wb') as fp:
+            fp.write(data)
+
+    def test_rewrites_links_to_content_addressed_urls(self):
+        body = utils.convert_to_cdn_path(
+            self.uploader.url_for, '![logo]($IMAGE_ROOT/images/logo.PNG "Logo") and ![copy]($IMAGE_ROOT/images/copy.png)')
+
+        key = self.uploader.key_for(os.path.join(self.images_folder, 'images', 'logo.PNG'))
+        self.assertTrue(key.endswith('.png'))
+        self.assertEqual('![logo](https://cdn.io/{} "Logo") and ![copy](https://cdn.io/{})'.format(key, key), body)
+        self.assertEqual([key], os.listdir(self.store_folder))
+
+    def test_unchanged_images_are_not_uploaded_again(self):
+        first_url = self.uploader.url_for('/images/logo.PNG')
+        uploader = assets.uploader(self.store_folder, 'https://cdn.io', self.images_folder)
+        uploader.store = MagicMock(wraps=uploader.store)
+
+        self.assertEqual(first_url, uploader.url_for('/images/logo.PNG'))
+        self.assertFalse(uploader.store.put.called)
+
+        self._write_image('images/logo.PNG', b'new logo')
+        self.assertNotEqual(first_url, uploader.url_for('/images/logo.PNG'))
+        self.assertEqual(1, uploader.store.put.call_count)
+
+    def test_missing_image_falls_back_to_image_cdn(self):
+        uploader = assets.uploader(self.store_folder, 'https://cdn.io', self.images_folder, 'https://old.cdn.io')
+
+        self.assertEqual('https://old.cdn.io/images/missing.png', uploader.url_for('/images/missing.png'))
+
+
+class TestAssetDownloader(TestCase):
+
+    def setUp(self):
+        self.images_folder = tempfile.mkdtemp()
+        self.downloader = assets.downloader('company.zendesk.com', 'user', 'password', self.images_folder, 2)
+        self.session = self.downloader.session = MagicMock()
+        self.session.get.return_value = MagicMock(status_code=200, content=b'logo', headers={'ETag': '"v1"'})
+
+    def tearDown(self):
+        shutil.rmtree(self.images_folder)
+
+    def test_downloads_images_once_and_rewrites_links(self):
+        bodies = ['![logo](https://company.zendesk.com/hc/article_attachments/1/logo.PNG "Logo")',
+                  '![logo](/hc/article_attachments/1/logo.PNG) ![copy](https://theme.zdassets.com/copy.png) '
+                  '![other](https://example.com/other.png)']
+
+        localized = self.downloader.localize(bodies)
+
+        key = self.downloader.index['https://company.zendesk.com/hc/article_attachments/1/logo.PNG']['key']
+        self.assertTrue(key.endswith('.png'))
+        self.assertEqual(key, self.downloader.index['https://theme.zdassets.com/copy.png']['key'])
+        self.assertEqual(['![logo]($IMAGE_ROOT/zendesk/{} "Logo")'.format(key),
+                          '![logo]($IMAGE_ROOT/zendesk/{}) ![copy]($IMAGE_ROOT/zendesk/{}) '
+                          '![other](https://example.com/other.png)'.format(key, key)], localized)
+        self.assertEqual(2, self.session.get.call_count)
+        self.assertEqual(sorted([key, assets.DOWNLOADS_INDEX]),
+                         sorted(os.listdir(os.path.join(self.images_folder, assets.DOWNLOADS_FOLDER))))
+
+    def test_unchanged_images_are_not_downloaded_again(self):
+        body = '![logo](https://company.zendesk.com/logo.png)'
+        first = self.downloader.localize([body])
+        downloader = assets.downloader('company.zendesk.com', 'user', 'password', self.images_folder)
+        downloader.session = MagicMock()
+        downloader.session.get.return_value = MagicMock(status_code=304, headers={})
+
+        self.assertEqual(first, downloader.localize([body]))
+        self.assertEqual({'If-None-Match': '"v1"'}, downloader.session.get.call_args[1]['headers'])
+
+    def test_failed_download_keeps_the_link(self):
+        self.session.get.return_value = MagicMock(status_code=404, content=b'', headers={})
+        body = '![logo](https://company.zendesk.com/missing.png)'
+
+        self.assertEqual([body], self.downloader.localize([body]))
@@ -0,0 +1,55 @@
+from unittest import TestCase
+import tempfile
+import shutil
+
+import cache
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = cache.ResponseCache(self.folder)
+        self.url = 'https://company.com/api/v2/help_center/en-us/categories.json'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_no_headers_for_unknown_url(self):
+        self.assertEqual({}, self.cache.headers_for(self.url))
+        self.assertEqual({}, self.cache.read(self.url))
+
+    def test_saves_validators(self):
+        self.cache.save(self.url, {'ETag': '"abc"', 'Last-Modified': 'Mon, 05 May 2015 10:00:00 GMT'},
+                        {'categories': []})
+
+        self.assertEqual({'If-None-Match': '"abc"', 'If-Modified-Since': 'Mon, 05 May 2015 10:00:00 GMT'},
+                         self.cache.headers_for(self.url))
+        self.assertEqual({'categories': []}, self.cache.read(self.url))
+
+    def test_skips_responses_without_validators(self):
+        self.cache.save(self.url, {}, {'categories': []})
+
+        self.assertEqual({}, self.cache.read(self.url))
+
+
+class TestConversionCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = cache.ConversionCache(self.folder, 'html2text 1')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_returns_saved_result(self):
+        self.assertIsNone(self.cache.get('<p>body</p>'))
+
+        self.cache.save('<p>body</p>', 'body\n\n')
+
+        self.assertEqual('body\n\n', self.cache.get('<p>body</p>'))
+
+    def test_options_are_part_of_the_key(self):
+        self.cache.save('<p>body</p>', 'body\n\n')
+
+        self.assertIsNone(cache.ConversionCache(self.folder, 'html2text 2').get('<p>body</p>'))
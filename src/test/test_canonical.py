@@ -0,0 +1,27 @@
+from unittest import TestCase
+
+import canonical
+
+
+class TestCanonical(TestCase):
+
+    def test_formatting_differences_are_ignored(self):
+        rendered = '<p>Tom &amp; Jerry\n<a title="x" href="/a">link</a><br />\n</p>\n<img alt="a" src="b.png"/>'
+        sanitized = '<P>Tom &#38; Jerry <a href="/a"  title="x">link</a><br></p><img src="b.png" alt="a">'
+
+        self.assertTrue(canonical.same_content(rendered, sanitized))
+
+    def test_content_differences_are_detected(self):
+        self.assertFalse(canonical.same_content('<p>body</p>', '<p>new body</p>'))
+        self.assertFalse(canonical.same_content('<p>body</p>', '<p class="note">body</p>'))
+        self.assertFalse(canonical.same_content('<p>body</p>', '<div>body</div>'))
+
+    def test_whitespace_is_kept_in_preformatted_text(self):
+        self.assertFalse(canonical.same_content('<pre>a  b</pre>', '<pre>a b</pre>'))
+        self.assertTrue(canonical.same_content('<p>a  b</p>', '<p>a b</p>'))
+
+    def test_whitespace_next_to_inline_elements_is_kept(self):
+        self.assertFalse(canonical.same_content('<p>foo <b>bar</b></p>', '<p>foo<b>bar</b></p>'))
+        self.assertFalse(canonical.same_content('<p><b>foo</b> bar</p>', '<p><b>foo</b>bar</p>'))
+        self.assertTrue(canonical.same_content('<p> <b>foo</b> bar </p>\n<p>baz</p>',
+                                               '<p><b>foo</b> bar</p><p>baz</p>'))
@@ -3,10 +3,15 @@ from unittest.mock import MagicMock, patch
 import tempfile
 import shutil
 import os
+import subprocess
+import sys
+import json
+import time
 
 from model import Category, Section, Article
 import filesystem
 import cms
+from .fakeserver import FakeServer
 
 
 def _create_structure():
@@ -29,6 +34,8 @@ class TestRemoveTask(TestCase):
             'user': 'test_user',
             'password': 'test_password',
             'webtranslateit_api_key': 'test_key',
+            'concurrency': 1,
+            'state_db': '',
             'root_folder': self.root_folder
         }
         self.category, self.section, self.article = _create_structure()
@@ -52,54 +59,308 @@ class TestRemoveTask(TestCase):
         self.assertTrue(self._exists(self.article.meta_filepath))
         self.assertTrue(self._exists(self.article.body_filepath))
 
+    def _assert_section_exists(self):
+        self.assertTrue(self._exists(self.section.content_filepath))
+        self.assertTrue(self._exists(self.section.meta_filepath))
+
     def _assert_article_deleted(self, zendesk_requests, translate_requests):
         self.assertFalse(self._exists(self.article.content_filepath))
         self.assertFalse(self._exists(self.article.meta_filepath))
         self.assertFalse(self._exists(self.article.body_filepath))
-        translate_requests.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/3')
-        translate_requests.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/4')
+        translate_requests.Session.return_value.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/3')
+        translate_requests.Session.return_value.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/4')
 
     def _assert_section_deleted(self, zendesk_requests, translate_requests):
         self.assertFalse(self._exists(self.section.content_filepath))
         self.assertFalse(self._exists(self.section.meta_filepath))
-        translate_requests.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/2')
+        translate_requests.Session.return_value.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/2')
 
     def _assert_category_deleted(self, zendesk_requests, translate_requests):
         self.assertFalse(self._exists(self.section.content_filepath))
         self.assertFalse(self._exists(self.section.meta_filepath))
-        translate_requests.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/1')
+        translate_requests.Session.return_value.delete.assert_any_call('https://webtranslateit.com/api/projects/test_key/files/1')
 
     @patch('translate.requests')
     @patch('zendesk.requests')
     def test_remove_article(self, zendesk_requests, translate_requests):
-        self.args['path'] = self.article.content_filepath
+        self.args['paths'] = [self.article.content_filepath]
 
         self._assert_structure_exists()
         self.task.execute(self.args)
         self._assert_article_deleted(zendesk_requests, translate_requests)
-        zendesk_requests.delete.assert_any_call('https://test_company.com/api/v2/help_center/en-us/articles/3.json', verify=False, auth=('test_user', 'test_password'))
+        zendesk_requests.Session.return_value.delete.assert_any_call('https://test_company.com/api/v2/help_center/en-us/articles/3.json', verify=False, auth=('test_user', 'test_password'))
+
+
+    @patch('translate.requests')
+    @patch('zendesk.requests')
+    def test_remove_article_with_relative_root_folder(self, zendesk_requests, translate_requests):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(os.path.dirname(self.root_folder))
+        self.args['root_folder'] = os.path.basename(self.root_folder)
+        self.args['paths'] = [self.article.body_filepath]
 
+        self.task.execute(self.args)
+
+        self._assert_article_deleted(zendesk_requests, translate_requests)
+        self._assert_section_exists()
 
     @patch('translate.requests')
     @patch('zendesk.requests')
     def test_remove_section(self, zendesk_requests, translate_requests):
-        self.args['path'] = self.section.path
+        self.args['paths'] = [self.section.path]
 
         self._assert_structure_exists()
         self.task.execute(self.args)
         self._assert_section_deleted(zendesk_requests, translate_requests)
         self._assert_article_deleted(zendesk_requests, translate_requests)
-        zendesk_requests.delete.assert_any_call('https://test_company.com/api/v2/help_center/en-us/sections/2.json', verify=False, auth=('test_user', 'test_password'))
+        zendesk_requests.Session.return_value.delete.assert_any_call('https://test_company.com/api/v2/help_center/en-us/sections/2.json', verify=False, auth=('test_user', 'test_password'))
 
 
     @patch('translate.requests')
     @patch('zendesk.requests')
     def test_remove_category(self, zendesk_requests, translate_requests):
-        self.args['path'] = self.category.path
+        self.args['paths'] = [self.category.path]
 
         self._assert_structure_exists()
         self.task.execute(self.args)
         self._assert_category_deleted(zendesk_requests, translate_requests)
         self._assert_section_deleted(zendesk_requests, translate_requests)
         self._assert_article_deleted(zendesk_requests, translate_requests)
-        zendesk_requests.delete.assert_any_call('https://test_company.com/api/v2/help_center/en-us/categories/1.json', verify=False, auth=('test_user', 'test_password'))
+        zendesk_requests.Session.return_value.delete.assert_any_call('https://test_company.com/api/v2/help_center/en-us/categories/1.json', verify=False, auth=('test_user', 'test_password'))
+
+    @patch('translate.requests')
+    @patch('zendesk.requests')
+    @patch('utils.is_installed', MagicMock(return_value=False))
+    def test_remove_many_skips_nested_paths(self, zendesk_requests, translate_requests):
+        manifest = os.path.join(self.root_folder, 'manifest.txt')
+        with open(manifest, 'w') as fp:
+            fp.write('{}\n\n{}\n'.format(self.article.content_filepath, self.section.path))
+        self.args['paths'] = [self.section.path]
+        self.args['manifest'] = manifest
+        self.args['concurrency'] = 4
+
+        self.task.execute(self.args)
+        self._assert_section_deleted(zendesk_requests, translate_requests)
+        self._assert_article_deleted(zendesk_requests, translate_requests)
+        zendesk_delete = zendesk_requests.Session.return_value.delete
+        self.assertEqual(1, zendesk_delete.call_count)
+        self.assertEqual(3, translate_requests.Session.return_value.delete.call_count)
+
+    def test_remove_missing_path_removes_nothing(self):
+        self.args['paths'] = [self.section.path, 'missing']
+
+        self.task.execute(self.args)
+        self._assert_structure_exists()
+
+
+class TestMoveTask(TestCase):
+    def setUp(self):
+        self.root_folder = tempfile.mkdtemp()
+        self.args = {
+            'company_uri': 'test_company.com',
+            'user': 'test_user',
+            'password': 'test_password',
+            'webtranslateit_api_key': 'test_key',
+            'image_cdn': '',
+            'concurrency': 1,
+            'state_db': '',
+            'root_folder': self.root_folder
+        }
+        self.category, self.section, self.article = _create_structure()
+        self.other_section = Section(self.category, 'other section', 'section test', 'other_section')
+        self.other_section.meta = {'id': 5, 'webtranslateit_ids': {'content': 6}}
+        self.category.sections.append(self.other_section)
+        filesystem.saver(self.root_folder).save([self.category])
+        self.task = cms.MoveTask()
+
+    def tearDown(self):
+        shutil.rmtree(self.root_folder)
+
+    def _exists(self, path):
+        return os.path.exists(os.path.join(self.root_folder, path))
+
+    def _respond(self, zendesk_requests, translate_requests, wti_text='OK'):
+        zendesk_requests.Session.return_value.put.return_value = MagicMock(
+            status_code=200, json=MagicMock(return_value={'article': {'id': 3, 'section_id': 5}}))
+        translate_requests.Session.return_value.put.return_value = MagicMock(status_code=200, text=wti_text)
+
+    @patch('translate.requests')
+    @patch('zendesk.requests')
+    def test_move_article(self, zendesk_requests, translate_requests):
+        self.args['sources'] = [self.article.content_filepath]
+        self.args['destination'] = self.other_section.path
+        self._respond(zendesk_requests, translate_requests)
+
+        self.task.execute(self.args)
+
+        moved_path = os.path.join(self.other_section.path, 'en-US', 'test_article')
+        self.assertTrue(self._exists(moved_path + '.json'))
+        self.assertTrue(self._exists(moved_path + '.mkdown'))
+        self.assertFalse(self._exists(self.article.content_filepath))
+        zendesk_requests.Session.return_value.put.assert_called_once_with(
+            'https://test_company.com/api/v2/help_center/en-us/articles/3.json',
+            data=json.dumps({'article': {'section_id': 5}}), auth=('test_user', 'test_password'),
+            headers={'Content-type': 'application/json'}, verify=False)
+        translate_puts = {call[0][0]: call[1] for call in translate_requests.Session.return_value.put.call_args_list}
+        file_url = 'https://webtranslateit.com/api/projects/test_key/files/{}/locales/en-US'
+        self.assertEqual({'file': moved_path + '.json', 'name': moved_path + '.json'},
+                         translate_puts[file_url.format(3)]['data'])
+        self.assertEqual({'file': moved_path + '.mkdown', 'name': moved_path + '.mkdown'},
+                         translate_puts[file_url.format(4)]['data'])
+        self.assertIn('file', translate_puts[file_url.format(4)]['files'])
+
+    @patch('translate.requests')
+    @patch('zendesk.requests')
+    def test_failed_remote_move_is_not_moved_on_disk(self, zendesk_requests, translate_requests):
+        self.args['sources'] = [self.article.content_filepath]
+        self.args['destination'] = self.other_section.path
+        self._respond(zendesk_requests, translate_requests, wti_text='')
+
+        self.task.execute(self.args)
+
+        self.assertTrue(self._exists(self.article.content_filepath))
+        self.assertTrue(self._exists(self.article.meta_filepath))
+
+    @patch('translate.requests')
+    @patch('zendesk.requests')
+    def test_move_section_to_section_is_refused(self, zendesk_requests, translate_requests):
+        self.args['sources'] = [self.section.path]
+        self.args['destination'] = self.other_section.path
+
+        self.task.execute(self.args)
+
+        self.assertTrue(self._exists(self.section.content_filepath))
+        self.assertFalse(zendesk_requests.Session.return_value.put.called)
+
+
+class TestImportTask(TestCase):
+    def setUp(self):
+        self.root_folder = tempfile.mkdtemp()
+        self.server = FakeServer(per_page=2, rate_limit_every=4).start()
+        category = self.server.store.add_category('test category', 'category test')
+        section = self.server.store.add_section(category['id'], 'test section', 'section test')
+        for idx in range(5):
+            article = self.server.store.add_article(section['id'], 'article {}'.format(idx),
+                                                    '<p>body {}</p>'.format(idx))
+        self.server.store.add_translation('categories', category['id'], 'pt-br', 'categoria', 'teste')
+        self.server.store.add_translation('articles', article['id'], 'pl', 'artykul', '<p>tresc</p>')
+        self.args = {
+            'company_uri': self.server.url,
+            'user': 'test_user',
+            'password': 'test_password',
+            'cache_folder': '',
+            'concurrency': 1,
+            'state_db': '',
+            'root_folder': self.root_folder
+        }
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.root_folder)
+
+    def test_import_follows_pages_and_retries_rate_limited_requests(self):
+        cms.ImportTask().execute(self.args)
+
+        articles_path = os.path.join(self.root_folder, 'test-category', 'test-section', 'en-US')
+        articles = sorted(f for f in os.listdir(articles_path) if f.endswith('.mkdown'))
+        self.assertEqual(['article-{}.mkdown'.format(idx) for idx in range(5)], articles)
+        self.assertIn(('GET', 'list_items', 429), self.server.requests)
+
+    def test_import_writes_translations_per_locale(self):
+        cms.ImportTask().execute(self.args)
+
+        categories = filesystem.loader(self.root_folder).load()
+        category = categories[0]
+        article = next(a for a in category.sections[0].articles if a.name == 'article 4')
+        self.assertIn(('pt-BR', 'categoria', 'teste'),
+                      [(t.locale, t.name, t.description) for t in category.translations])
+        self.assertIn(('pl', 'artykul', 'tresc\n\n'), [(t.locale, t.name, t.body) for t in article.translations])
+        self.assertEqual(7, self.server.requests[('GET', 'list_translations', 200)])
+
+
+    def test_import_refuses_to_download_images_into_the_root_folder(self):
+        self.args.update({'download_images': True, 'images_folder': os.path.join(self.root_folder, 'images')})
+
+        cms.ImportTask().execute(self.args)
+
+        self.assertEqual([], os.listdir(self.root_folder))
+        self.assertEqual(0, self.server.request_count)
+
+
+class TestStartup(TestCase):
+    def test_heavy_dependencies_are_not_imported_on_startup(self):
+        src_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = 'import sys, cms; print(sorted(m for m in ["requests", "markdown", "html2text", "pkg_resources", ' \
+               '"zendesk", "translate", "filesystem"] if m in sys.modules))'
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=src_folder)
+        self.assertEqual('[]', output.decode('utf-8').strip())
+
+
+class TestTargets(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.folder, 'zendesk-help-cms.config')
+        with open(self.config_file, 'w') as fp:
+            fp.write('[DEFAULT]\nuser = test_user\nconcurrency = 4\n\n'
+                     '[brand-a]\ncompany_uri = a.zendesk.com\nroot_folder = {}\nrate_limit = 10\n\n'
+                     '[brand-b]\ncompany_uri = b.zendesk.com\nconcurrency = 2\n'.format(self.folder))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _parse(self, *argv):
+        with patch('cms.CONFIG_FILE', self.config_file), patch('sys.argv', ['zendesk-help-cms'] + list(argv)):
+            return cms.parse_config(cms.parse_args())
+
+    def test_sections_are_targets(self):
+        options = self._parse('import')
+
+        brand_a, brand_b = options['targets']
+        self.assertEqual(('brand-a', 'a.zendesk.com', self.folder, 4, 10.0),
+                         (brand_a['target'], brand_a['company_uri'], brand_a['root_folder'], brand_a['concurrency'],
+                          brand_a['rate_limit']))
+        self.assertEqual(('brand-b', 'test_user', os.path.abspath('brand-b'), 2),
+                         (brand_b['target'], brand_b['user'], brand_b['root_folder'], brand_b['concurrency']))
+
+    def test_selects_targets(self):
+        options = self._parse('-t', 'brand-b', 'import')
+
+        self.assertEqual(['brand-b'], [target['target'] for target in options['targets']])
+
+    def test_request_settings_cannot_be_set_per_target(self):
+        with open(self.config_file, 'a') as fp:
+            fp.write('read_timeout = 5\n')
+
+        with self.assertRaises(SystemExit):
+            self._parse('import')
+
+    def test_runs_all_targets_and_reports_failures(self):
+        options = self._parse('import')
+        task = MagicMock()
+        task.execute.side_effect = lambda target: 1 / (target['target'] != 'brand-b')
+
+        failed = cms.run_targets(task, options)
+
+        self.assertEqual(['brand-b'], failed)
+        self.assertEqual(2, task.execute.call_count)
+
+
+    def test_interactive_tasks_run_one_target_at_a_time(self):
+        import threading
+
+        class Task(object):
+            interactive = True
+            running = 0
+            max_running = 0
+            lock = threading.Lock()
+
+            def execute(self, target):
+                with self.lock:
+                    Task.running += 1
+                    Task.max_running = max(Task.max_running, Task.running)
+                time.sleep(0.05)
+                with self.lock:
+                    Task.running -= 1
+
+        self.assertEqual([], cms.run_targets(Task(), self._parse('doctor')))
+        self.assertEqual(1, Task.max_running)
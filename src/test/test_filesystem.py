@@ -1,5 +1,10 @@
 from unittest import TestCase
 from unittest.mock import create_autospec
+import os
+import tarfile
+import tempfile
+import shutil
+import zipfile
 
 import filesystem
 import model
@@ -105,3 +110,87 @@ class TestLoader(TestCase):
         self.assertEqual('dummy body', translations[0].body)
         self.assertEqual('en-US', translations[0].locale)
         self.assertEqual('pl', translations[1].locale)
+
+
+class TestCompactor(TestCase):
+
+    def setUp(self):
+        self.fs = create_autospec(filesystem.FilesystemClient)
+        self.compactor = filesystem.Compactor(self.fs)
+        self.category = fixtures.simple_category()
+
+    def test_rewrites_meta_with_remote_payload(self):
+        article = self.category.sections[0].articles[0]
+        stored = dict(article.meta, body='<p>large body</p>', html_url='https://company.com/article')
+        self.fs.read_json.side_effect = lambda path: stored if path == article.meta_filepath else {'id': 'x'}
+        self.category.meta = {'id': 'x'}
+        self.category.sections[0].meta = {'id': 'x'}
+
+        self.assertEqual(1, self.compactor.compact([self.category]))
+        self.fs.save_json.assert_called_once_with(article.meta_filepath, article.meta, merge=False)
+
+    def test_meta_keeps_whitelisted_fields(self):
+        article = self.category.sections[0].articles[0]
+        article.meta = {'id': 1, 'section_id': 2, 'body': '<p>body</p>', 'html_url': 'https://company.com/1'}
+
+        self.assertEqual({'id': 1, 'section_id': 2}, article.meta)
+
+
+
+class TestMemoryStorage(TestCase):
+
+    def setUp(self):
+        self.fs = filesystem.FilesystemClient('/help-center', storage=filesystem.MemoryStorage())
+        filesystem.Saver(self.fs).save([fixtures.category_with_translations()])
+
+    def test_saved_tree_is_loaded_back(self):
+        category = filesystem.Loader(self.fs).load()[0]
+        article = category.sections[0].articles[0]
+
+        self.assertEqual(('category', 'category id'), (category.name, category.zendesk_id))
+        self.assertEqual(('article', 'body'), (article.name, article.body))
+        self.assertEqual(['en-US', 'pl'], sorted(t.locale for t in article.translations))
+
+    def test_remove_and_move(self):
+        categories = filesystem.Loader(self.fs).load()
+        section = categories[0].sections[0]
+        filesystem.Mover(self.fs).move(section, 'moved')
+        self.assertEqual(['category', 'moved'], sorted(self.fs.read_directories('/help-center')))
+
+        filesystem.Remover(self.fs).remove(categories[0])
+        self.assertTrue(self.fs.exists('moved/en-US/article.mkdown'))
+        filesystem.Remover(self.fs).remove_all(filesystem.Loader(self.fs).load())
+        self.assertEqual([], self.fs.storage.files())
+
+
+class TestArchiveStorage(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.root = os.path.join(self.folder, 'content')
+        filesystem.saver(self.root).save([fixtures.simple_category()])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _load(self, archive_path):
+        return filesystem.loader(archive_path).load()[0].sections[0].articles[0]
+
+    def test_loads_zip(self):
+        archive_path = os.path.join(self.folder, 'content.zip')
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            for path in filesystem.DiskStorage(self.root).files():
+                archive.write(os.path.join(self.root, path), path)
+
+        article = self._load(archive_path)
+
+        self.assertEqual(('article', 'body', 'article id'), (article.name, article.body, article.zendesk_id))
+
+    def test_loads_tar_and_refuses_writes(self):
+        archive_path = os.path.join(self.folder, 'content.tar.gz')
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            archive.add(self.root, '.')
+
+        self.assertEqual('body', self._load(archive_path).body)
+        with self.assertRaises(PermissionError):
+            filesystem.client(archive_path).save_text('category/__group__.json', '{}')
@@ -0,0 +1,82 @@
+from unittest import TestCase
+import os
+import socket
+import tempfile
+
+import metrics
+
+
+class TestEndpointFor(TestCase):
+
+    def test_replaces_ids(self):
+        self.assertEqual('GET /api/v2/help_center/en-us/sections/{id}/articles.json',
+                         metrics.endpoint_for('get', 'https://company.com/api/v2/help_center/en-us/sections/12/'
+                                                     'articles.json?per_page=100'))
+
+    def test_replaces_translation_locales(self):
+        self.assertEqual('PUT /api/v2/help_center/articles/{id}/translations/{locale}.json',
+                         metrics.endpoint_for('put', 'https://company.com/api/v2/help_center/articles/3/'
+                                                     'translations/pt-br.json'))
+        self.assertEqual('GET /api/v2/help_center/articles/{id}/translations/missing.json',
+                         metrics.endpoint_for('get', 'https://company.com/api/v2/help_center/articles/3/'
+                                                     'translations/missing.json'))
+
+
+class TestRecorder(TestCase):
+
+    def setUp(self):
+        self.recorder = metrics.Recorder()
+
+    def test_phase_accumulates(self):
+        with self.recorder.phase('render'):
+            pass
+        with self.recorder.phase('render'):
+            pass
+
+        self.assertEqual(2, self.recorder.phases['render'][0])
+
+    def test_report(self):
+        with self.recorder.phase('load'):
+            pass
+        for seconds in [0.01, 0.02, 0.03, 0.04]:
+            self.recorder.record_request('get', 'https://company.com/api/v2/help_center/en-us/categories.json',
+                                         200, seconds, 0, 100)
+
+        report = self.recorder.report()
+
+        self.assertIn('load', report)
+        self.assertIn('GET /api/v2/help_center/en-us/categories.json', report)
+        self.assertIn('400', report)
+
+
+class TestExporters(TestCase):
+
+    def setUp(self):
+        self.recorder = metrics.Recorder()
+        self.recorder.record_request('get', 'https://company.com/api/v2/help_center/en-us/categories.json',
+                                     200, 0.5, 0, 100)
+        self.recorder.increment('items', kind='article', action='created')
+
+    def test_write_textfile(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'cms.prom')
+            metrics.write_textfile(path, 'export', self.recorder)
+            with open(path) as fp:
+                text = fp.read()
+
+        self.assertIn('# TYPE zendesk_cms_requests_total counter', text)
+        self.assertIn('zendesk_cms_requests_total{endpoint="GET /api/v2/help_center/en-us/categories.json",'
+                      'status="200",task="export"} 1', text)
+        self.assertIn('zendesk_cms_items_total{action="created",kind="article",task="export"} 1', text)
+
+    def test_send_statsd(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+            server.bind(('127.0.0.1', 0))
+            server.settimeout(1)
+            metrics.send_statsd('127.0.0.1:{}'.format(server.getsockname()[1]), 'export', self.recorder)
+            lines = set()
+            for _ in range(len(self.recorder.samples('export'))):
+                lines.add(server.recv(1024).decode('utf-8'))
+
+        self.assertIn('zendesk_cms.export.requests_total.GET_api_v2_help_center_en-us_categories_json.200:1|c', lines)
+        self.assertIn('zendesk_cms.export.items_total.created.article:1|c', lines)
@@ -0,0 +1,42 @@
+from unittest import TestCase
+import gzip
+import os
+import tempfile
+import shutil
+
+import snapshot
+
+
+class TestSnapshot(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'snapshot.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        records = [snapshot.item_record('category', {'id': 1, 'name': 'category'}),
+                   snapshot.translation_record('category', 1, {'locale': 'pl', 'title': 'kategoria'})]
+
+        self.assertEqual(2, snapshot.write(self.path, iter(records)))
+
+        self.assertEqual(records, list(snapshot.read(self.path)))
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_read_rejects_other_files(self):
+        with gzip.open(self.path, 'wt') as fp:
+            fp.write('{"id": 1}\n')
+
+        with self.assertRaises(ValueError):
+            list(snapshot.read(self.path))
+
+    def test_grouped(self):
+        records = [snapshot.item_record('section', {'id': 1}),
+                   snapshot.translation_record('section', 1, {'locale': 'pl'}),
+                   snapshot.translation_record('section', 1, {'locale': 'de'}),
+                   snapshot.item_record('section', {'id': 2})]
+
+        self.assertEqual([(records[0], [{'locale': 'pl'}, {'locale': 'de'}]), (records[3], [])],
+                         list(snapshot.grouped(records)))
@@ -0,0 +1,87 @@
+from unittest import TestCase
+import os
+import tempfile
+import shutil
+
+from model import Category, Section, Article
+import filesystem
+import state
+
+
+def _create_structure():
+    category = Category('test category', 'category test', 'test_category')
+    category.meta = {'id': 1, 'webtranslateit_ids': {'content': 11}}
+    section = Section(category, 'test section', 'section test', 'test_section')
+    section.meta = {'id': 2, 'webtranslateit_ids': {'content': 12}}
+    category.sections.append(section)
+    article = Article(section, 'test article', 'article body', 'test_article')
+    article.meta = {'id': 3, 'updated_at': '2015-05-05T10:00:00Z', 'webtranslateit_ids': {'content': 13, 'body': 14}}
+    section.articles.append(article)
+    return category
+
+
+class TestStateStore(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'state.db')
+        self.store = state.StateStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.folder)
+
+    def test_changes_are_written_on_commit(self):
+        self.store.save('category/.group.meta', {'id': 1})
+        self.store.save('category/.group.meta', {'webtranslateit_ids': {'content': 2}})
+
+        self.assertEqual({}, state.StateStore(self.path).read('category/.group.meta'))
+        self.store.commit()
+        self.assertEqual({'id': 1, 'webtranslateit_ids': {'content': 2}},
+                         state.StateStore(self.path).read('category/.group.meta'))
+
+    def test_failed_transaction_is_rolled_back(self):
+        with self.assertRaises(ValueError):
+            with self.store.transaction():
+                self.store.save('category/.group.meta', {'id': 1})
+                raise ValueError()
+
+        self.assertEqual({}, self.store.read('category/.group.meta'))
+
+    def test_moves_and_removes_folders(self):
+        self.store.save('category/section/.group.meta', {'id': 2})
+        self.store.save('category/section/en-US/.article_a.meta', {'id': 3})
+
+        self.store.move('category/section', 'other/section')
+        self.assertEqual({'id': 3}, self.store.read('other/section/en-US/.article_a.meta'))
+        self.assertEqual({}, self.store.read('category/section/en-US/.article_a.meta'))
+
+        self.store.remove_tree('other')
+        self.store.commit()
+        self.assertEqual({}, state.StateStore(self.path).read('other/section/.group.meta'))
+
+
+class TestFilesystemState(TestCase):
+
+    def setUp(self):
+        self.root_folder = tempfile.mkdtemp()
+        self.store = state.StateStore(os.path.join(self.root_folder, '.state.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.root_folder)
+
+    def test_meta_is_kept_in_the_store(self):
+        filesystem.Saver(filesystem.FilesystemClient(self.root_folder, self.store)).save([_create_structure()])
+
+        self.assertFalse(os.path.exists(os.path.join(self.root_folder, 'test_category', '.group.meta')))
+        loader = filesystem.Loader(filesystem.FilesystemClient(self.root_folder, state.StateStore(self.store.path)))
+        article = loader.load()[0].sections[0].articles[0]
+        self.assertEqual(3, article.zendesk_id)
+        self.assertEqual({'content': 13, 'body': 14}, article.translate_ids)
+
+    def test_migrate_meta_files(self):
+        filesystem.saver(self.root_folder).save([_create_structure()])
+
+        self.assertEqual(3, self.store.migrate(self.root_folder))
+        self.assertEqual(3, self.store.read('test_category/test_section/en-US/.article_test_article.meta')['id'])
@@ -0,0 +1,69 @@
+from unittest import TestCase, mock
+
+from model import Category
+import filesystem
+import status
+import zendesk
+from .fakeserver import FakeServer
+
+
+class TestStatusChecker(TestCase):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        store = self.server.store
+        category = store.add_category('category')
+        self.section = store.add_section(category['id'], 'section')
+        self.first = store.add_article(self.section['id'], 'first', '<p>first</p>')
+        self.second = store.add_article(self.section['id'], 'second', '<p>second</p>')
+        self.req = req = zendesk.ZendeskRequest(self.server.url, 'user', 'password')
+        self.fs = filesystem.FilesystemClient('/help-center', storage=filesystem.MemoryStorage())
+        filesystem.Saver(self.fs).save(zendesk.Fetcher(req).fetch())
+        self.checker = status.StatusChecker(self.fs, zendesk.Lister(req))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _status(self):
+        return self.checker.status(filesystem.Loader(self.fs).load())
+
+    def test_nothing_changed(self):
+        self.assertEqual([], self._status())
+
+    def test_changes(self):
+        self.fs.save_text('category/section/en-US/first.mkdown', 'edited')
+        self.fs.save_text('category/section/en-US/second.mkdown', 'edited')
+        self.server.store.items['articles'][self.second['id']]['body'] = '<p>edited remotely</p>'
+        self.server.store.items['sections'][self.section['id']]['name'] = 'renamed'
+        new_category = Category('new', '', 'new')
+        self.fs.save_json(new_category.content_filepath, new_category.to_content())
+        third = self.server.store.add_article(self.section['id'], 'third')
+
+        self.assertEqual([(status.MODIFIED_REMOTELY, 'category/section/__group__.json'),
+                          (status.MODIFIED_LOCALLY, 'category/section/en-US/first.mkdown'),
+                          (status.CONFLICT, 'category/section/en-US/second.mkdown'),
+                          (status.NEW, 'new/__group__.json'),
+                          (status.NEW_REMOTELY, 'article {} third'.format(third['id']))], self._status())
+
+    def test_exported_changes_are_synced(self):
+        self.fs.save_text('category/section/en-US/first.mkdown', 'edited')
+
+        zendesk.Pusher(self.req, self.fs, '', False).push(filesystem.Loader(self.fs).load())
+
+        self.assertEqual([], self._status())
+
+    def test_failed_export_is_not_synced(self):
+        self.fs.save_text('category/section/en-US/first.mkdown', 'edited')
+        # the request classes log failed calls and return no payload
+        with mock.patch.object(self.req, 'put_translation', return_value={}):
+            zendesk.Pusher(self.req, self.fs, '', False).push(filesystem.Loader(self.fs).load())
+
+        self.assertEqual([(status.MODIFIED_LOCALLY, 'category/section/en-US/first.mkdown')], self._status())
+
+    def test_deleted(self):
+        self.fs.remove('category/section/en-US/first.mkdown')
+        self.fs.remove('category/section/en-US/first.json')
+        self.server.store.remove('articles', self.second['id'])
+
+        self.assertEqual([(status.DELETED_REMOTELY, 'category/section/en-US/second.mkdown'),
+                          (status.DELETED_LOCALLY, 'article {} first'.format(self.first['id']))], self._status())
@@ -0,0 +1,96 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+import os
+import tempfile
+import shutil
+
+from model import Category, Section, Article, ArticleTranslation
+import filesystem
+import sync
+
+
+class TestSyncer(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.fs = filesystem.FilesystemClient(self.root)
+        category = Category('category', '', 'category')
+        category.meta = {'id': 1}
+        old_section = Section(category, 'old', '', 'old')
+        old_section.meta = {'id': 2}
+        new_section = Section(category, 'new', '', 'new')
+        new_section.meta = {'id': 5}
+        category.sections.extend([old_section, new_section])
+        article = Article(old_section, 'article', 'article body', 'article')
+        article.meta = {'id': 3, 'section_id': 2, 'body_hash': article.body_hash,
+                        'webtranslateit_ids': {'content': 13, 'body': 14}}
+        article.translations.append(ArticleTranslation('pl', 'artykul', 'tresc'))
+        old_section.articles.append(article)
+        filesystem.Saver(self.fs).save([category])
+
+        self.zendesk_mover = MagicMock()
+        self.zendesk_mover.move_all.side_effect = lambda articles, section: articles
+        self.translate_mover = MagicMock()
+        self.translate_mover.rename_all.side_effect = lambda articles: articles
+        self.syncer = sync.Syncer(self.fs, self.zendesk_mover, self.translate_mover)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _path(self, *parts):
+        return os.path.join(self.root, 'category', *parts)
+
+    def _move(self, old_path, new_path):
+        os.makedirs(os.path.dirname(self._path(new_path)), exist_ok=True)
+        os.rename(self._path(old_path), self._path(new_path))
+
+    def _load(self):
+        return filesystem.Loader(self.fs).load()
+
+    def test_moved_article_is_updated_in_place(self):
+        self._move('old/en-US/article.mkdown', 'new/en-US/moved.mkdown')
+        self._move('old/en-US/article.json', 'new/en-US/moved.json')
+        categories = self._load()
+
+        self.assertEqual(1, self.syncer.sync(categories))
+
+        article = next(a for s in categories[0].sections for a in s.articles
+                       if a.body_filepath == 'category/new/en-US/moved.mkdown')
+        self.assertEqual({'id': 3, 'section_id': 5, 'body_hash': article.body_hash,
+                          'webtranslateit_ids': {'content': 13, 'body': 14}}, article.meta)
+        self.zendesk_mover.move_all.assert_called_once_with([article], article.section)
+        self.translate_mover.rename_all.assert_called_once_with([article])
+        self.assertFalse(os.path.exists(self._path('old/en-US/.article_article.meta')))
+        self.assertTrue(os.path.exists(self._path('new/en-US/.article_moved.meta')))
+        self.assertTrue(os.path.exists(self._path('new/pl/moved.mkdown')))
+
+    def test_renamed_article_stays_in_its_section(self):
+        self._move('old/en-US/article.mkdown', 'old/en-US/renamed.mkdown')
+        self._move('old/en-US/article.json', 'old/en-US/renamed.json')
+
+        self.assertEqual(1, self.syncer.sync(self._load()))
+
+        self.assertFalse(self.zendesk_mover.move_all.called)
+        self.assertTrue(self.translate_mover.rename_all.called)
+        self.assertTrue(os.path.exists(self._path('old/pl/renamed.json')))
+
+    def test_edited_article_is_not_matched(self):
+        self._move('old/en-US/article.mkdown', 'new/en-US/moved.mkdown')
+        self._move('old/en-US/article.json', 'new/en-US/moved.json')
+        with open(self._path('new/en-US/moved.mkdown'), 'w') as fp:
+            fp.write('edited body')
+
+        self.assertEqual(0, self.syncer.sync(self._load()))
+        self.assertTrue(os.path.exists(self._path('old/en-US/.article_article.meta')))
+
+    def test_failed_rename_is_tried_again(self):
+        self._move('old/en-US/article.mkdown', 'new/en-US/moved.mkdown')
+        self._move('old/en-US/article.json', 'new/en-US/moved.json')
+        self.translate_mover.rename_all.side_effect = lambda articles: []
+
+        self.assertEqual(0, self.syncer.sync(self._load()))
+        self.assertTrue(os.path.exists(self._path('old/en-US/.article_article.meta')))
+
+        self.translate_mover.rename_all.side_effect = lambda articles: articles
+        self.assertEqual(1, self.syncer.sync(self._load()))
+        self.assertFalse(os.path.exists(self._path('old/en-US/.article_article.meta')))
@@ -1,5 +1,8 @@
 from unittest import TestCase
 from unittest.mock import create_autospec, mock_open, patch, MagicMock
+import os
+import shutil
+import tempfile
 
 from . import fixtures
 import translate
@@ -9,6 +12,7 @@ class TestWebTranslateItClient(TestCase):
 
     def setUp(self):
         self.req = create_autospec(translate.WebTranslateItRequest)
+        self.req.concurrency = 1
         self.client = translate.WebTranslateItClient(self.req)
         self.category = fixtures.simple_category()
 
@@ -35,21 +39,6 @@ class TestWebTranslateItClient(TestCase):
                          self.req.post.call_args[0][1])
         self.assertIn('file', self.req.post.call_args[0][2])
 
-    def test_move_group(self):
-        self.client._move_item = MagicMock()
-        with patch('builtins.open', mock_open()):
-            self.client.move(self.category, 'test/fixtures/articles.json')
-
-        self.client._move_item.assert_called_with('category translate id', 'category/__group__.json')
-
-    def test_move_article(self):
-        self.client._move_item = MagicMock()
-        with patch('builtins.open', mock_open()):
-            self.client.move(self.category.sections[0].articles[0], 'test/fixtures/articles.json')
-
-        self.client._move_item.assert_any_call('body translate id', 'category/section/en-US/article.mkdown')
-        self.client._move_item.assert_any_call('article translate id', 'category/section/en-US/article.json')
-
     def test_move_item_happy_path(self):
         with patch('builtins.open', mock_open()):
             self.client._move_item('1', 'test/fixtures/articles.json')
@@ -60,6 +49,18 @@ class TestWebTranslateItClient(TestCase):
                          self.req.put.call_args[0][1])
         self.assertIn('file', self.req.put.call_args[0][2])
 
+    def test_rename_all_uploads_files_under_new_names(self):
+        self.req.put.side_effect = ['OK', '']
+        with patch('builtins.open', mock_open()):
+            results = self.client.rename_all([('1', 'old/article.json', 'new/article.json'),
+                                              ('2', 'old/article.mkdown', 'new/article.mkdown')])
+
+        self.assertEqual([True, False], results)
+        self.assertEqual('files/1/locales/en-US', self.req.put.call_args_list[0][0][0])
+        self.assertEqual({'file': 'new/article.json', 'name': 'new/article.json'},
+                         self.req.put.call_args_list[0][0][1])
+        self.assertIn('file', self.req.put.call_args_list[0][0][2])
+
     def test_delete_happy_path(self):
         self.client.delete(self.category)
 
@@ -79,3 +80,65 @@ class TestWebTranslateItClient(TestCase):
 
         self.assertEqual({'file': 'test/fixtures/articles.json', 'name': 'test/fixtures/articles.json'},
                          self.req.put.call_args[0][1])
+
+    def test_create_stores_checksums(self):
+        self.category.translate_ids = {}
+        self.req.post.return_value = 'new translate id'
+        with patch('builtins.open', mock_open(read_data='data')):
+            self.client.create([self.category])
+
+        self.assertEqual({'content': '8d777f385d3dfec8815d20f7496026dc'}, self.category.translate_hashes)
+        self.assertEqual({'content': 'new translate id'}, self.category.translate_ids)
+
+    def test_create_skips_unchanged_files(self):
+        article = self.category.sections[0].articles[0]
+        for item in [self.category, self.category.sections[0], article]:
+            item.translate_hashes = {'content': '8d777f385d3dfec8815d20f7496026dc',
+                                     'body': '8d777f385d3dfec8815d20f7496026dc'}
+        with patch('builtins.open', mock_open(read_data='data')):
+            self.client.create([self.category])
+
+        self.assertFalse(self.req.post.called)
+        self.assertFalse(self.req.put.called)
+
+    def test_create_uploads_changed_files(self):
+        self.category.translate_hashes = {'content': 'old checksum'}
+        self.client._move_item = MagicMock()
+        with patch('builtins.open', mock_open(read_data='data')):
+            self.client.create([self.category])
+
+        self.client._move_item.assert_any_call('category translate id', 'category/__group__.json')
+        self.assertEqual('8d777f385d3dfec8815d20f7496026dc', self.category.translate_hashes['content'])
+
+    def test_create_records_checksums_of_files_uploaded_before_without_uploading(self):
+        self.category.translate_hashes = {}
+        with patch('builtins.open', mock_open(read_data='data')):
+            self.client.create([self.category])
+
+        self.assertFalse(self.req.put.called)
+        self.assertEqual('8d777f385d3dfec8815d20f7496026dc', self.category.translate_hashes['content'])
+
+    def test_create_keeps_checksums_of_failed_uploads(self):
+        self.category.translate_hashes = {'content': 'old checksum'}
+        self.req.put.return_value = ''
+        with patch('builtins.open', mock_open(read_data='data')):
+            self.client.create([self.category])
+
+        self.assertTrue(self.req.put.called)
+        self.assertEqual('old checksum', self.category.translate_hashes['content'])
+
+    def test_files_are_read_from_root_folder(self):
+        root_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root_folder)
+        os.makedirs(os.path.join(root_folder, 'category'))
+        with open(os.path.join(root_folder, self.category.content_filepath), 'w') as fp:
+            fp.write('data')
+        self.category.translate_ids = {}
+        self.req.post.return_value = 'new translate id'
+
+        translate.WebTranslateItClient(self.req, root_folder)._update_item(self.category, 'content',
+                                                                          self.category.content_filepath)
+
+        self.assertEqual({'file': 'category/__group__.json', 'name': 'category/__group__.json'},
+                         self.req.post.call_args[0][1])
+        self.assertEqual({'content': '8d777f385d3dfec8815d20f7496026dc'}, self.category.translate_hashes)
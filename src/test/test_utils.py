@@ -0,0 +1,85 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import time
+
+import requests
+
+import utils
+
+
+class TestRateLimiter(TestCase):
+
+    @patch('utils.time.monotonic', return_value=100.0)
+    def test_spaces_requests(self, monotonic):
+        limiter = utils.RateLimiter(4)
+
+        self.assertEqual([0.0, 0.25, 0.5], [limiter.reserve() for _ in range(3)])
+
+    def test_limits_configured_hosts_only(self):
+        utils.limit_rate('a.zendesk.com', 10)
+        try:
+            self.assertIsNotNone(utils.rate_limiter_for('https://a.zendesk.com/api/v2/help_center/en-us/articles.json'))
+            self.assertIsNone(utils.rate_limiter_for('https://b.zendesk.com/api/v2/help_center/en-us/articles.json'))
+        finally:
+            utils.limit_rate('a.zendesk.com', 0)
+
+
+def _response():
+    return MagicMock(status_code=200, content=b'')
+
+
+class TestRequestLimits(TestCase):
+
+    def tearDown(self):
+        utils.set_deadline(0)
+        utils.hedge_requests(False)
+
+    @patch('requests.adapters.HTTPAdapter.send', side_effect=requests.exceptions.ConnectionError)
+    def test_requests_get_default_timeout(self, send):
+        session = utils.pool_connections(requests.Session())
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            session.get('https://a.zendesk.com/api/v2/help_center/en-us/articles.json')
+
+        self.assertEqual(utils.get_timeout(), send.call_args[1]['timeout'])
+
+    def test_no_requests_after_deadline(self):
+        request_fn = MagicMock(return_value=_response())
+        with patch('utils.time.monotonic', return_value=100.0):
+            utils.set_deadline(10)
+            utils.send_request(request_fn, 'https://a.zendesk.com/1.json')
+        with patch('utils.time.monotonic', return_value=111.0):
+            with self.assertRaises(utils.DeadlineExceeded):
+                utils.send_request(request_fn, 'https://a.zendesk.com/2.json')
+
+        self.assertEqual(1, request_fn.call_count)
+
+    @patch('metrics.latency_percentile', return_value=0.05)
+    def test_slow_get_is_hedged(self, latency_percentile):
+        slow, fast = _response(), _response()
+        responses = iter([(1.0, slow), (0, fast)])
+
+        def get(url, **kwargs):
+            delay, response = next(responses)
+            time.sleep(delay)
+            return response
+
+        utils.hedge_requests(True)
+        self.assertIs(fast, utils.send_request(get, 'https://a.zendesk.com/1.json'))
+
+    @patch('metrics.record_response')
+    @patch('metrics.latency_percentile', return_value=0.05)
+    def test_only_the_used_hedged_response_is_recorded(self, latency_percentile, record_response):
+        slow, fast = _response(), _response()
+        responses = iter([(0.2, slow), (0, fast)])
+
+        def get(url, **kwargs):
+            delay, response = next(responses)
+            time.sleep(delay)
+            return response
+
+        utils.hedge_requests(True)
+        utils.send_request(get, 'https://a.zendesk.com/1.json')
+        time.sleep(0.3)
+
+        record_response.assert_called_once()
+        self.assertIs(fast, record_response.call_args[0][2])
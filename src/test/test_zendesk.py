@@ -1,11 +1,24 @@
 import os
 import json
-from unittest import TestCase
-from unittest.mock import MagicMock, create_autospec
+import tempfile
+import shutil
+import types
+from unittest import TestCase, skipUnless
+from unittest.mock import MagicMock, create_autospec, patch
 
+import cache
 import zendesk
 import filesystem
+import model
+import utils
 from . import fixtures
+from .fakeserver import FakeServer
+
+try:
+    import aiohttp
+    import zendesk_async
+except ImportError:
+    aiohttp = None
 
 
 def load_fixture(name):
@@ -14,10 +27,88 @@ def load_fixture(name):
         return json.load(fp)
 
 
+class TestZendeskRequest(TestCase):
+
+    def setUp(self):
+        self.cache_folder = tempfile.mkdtemp()
+        self.req = zendesk.ZendeskRequest('company.com', 'user', 'password', self.cache_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_folder)
+
+    def test_get_items_uses_cached_response_when_not_modified(self):
+        requests = self.req.session = MagicMock()
+        requests.get.return_value = MagicMock(status_code=200, headers={'ETag': '"v1"'},
+                                              json=MagicMock(return_value=load_fixture('categories')))
+        self.req.get_items(model.Category)
+
+        requests.get.return_value = MagicMock(status_code=304)
+        categories = self.req.get_items(model.Category)
+
+        self.assertEqual('test category', categories[0]['name'])
+        self.assertEqual({'If-None-Match': '"v1"'}, requests.get.call_args[1]['headers'])
+
+
+@skipUnless(aiohttp, 'aiohttp is not installed')
+class TestAsyncZendeskRequest(TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(latency=0.01, rate_limit_every=10).start()
+        self.server.store.locales = ['en-us', 'pl']
+        category = self.server.store.add_category('test category', 'category description')
+        for s in range(3):
+            section = self.server.store.add_section(category['id'], 'section {}'.format(s))
+            for a in range(5):
+                self.server.store.add_article(section['id'], 'article {}'.format(a), '<p>body</p>')
+        self.req = zendesk_async.AsyncZendeskRequest(self.server.url, 'user', 'password', concurrency=5)
+
+    def tearDown(self):
+        self.req.close()
+        self.server.stop()
+
+    def test_fetch(self):
+        categories = zendesk.Fetcher(self.req).fetch()
+
+        self.assertEqual(3, len(categories[0].sections))
+        self.assertEqual(15, sum(len(s.articles) for s in categories[0].sections))
+        self.assertLessEqual(self.server.max_in_flight, 5)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_push_translations_concurrently(self):
+        categories = zendesk.Fetcher(self.req).fetch()
+        for section in categories[0].sections:
+            for article in section.articles:
+                article.translations.append(model.ArticleTranslation('pl', 'tytul', 'tresc'))
+        fs = create_autospec(filesystem.FilesystemClient)
+
+        zendesk.Pusher(self.req, fs, '', False).push(categories)
+
+        self.assertEqual(15, self.server.requests[('POST', 'create_translation', 201)])
+        self.assertLessEqual(self.server.max_in_flight, 5)
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_close_closes_the_event_loop(self):
+        zendesk.Fetcher(self.req).fetch()
+        loop = self.req.loop
+
+        self.req.close()
+
+        self.assertTrue(loop.is_closed())
+        self.assertEqual(1, len(zendesk.Fetcher(self.req).fetch()))
+
+    def test_missing_record(self):
+        article = model.Article(None, 'missing', '', 'missing')
+        article.meta = {'id': 1}
+
+        with self.assertRaises(zendesk.RecordNotFoundError):
+            zendesk._call(self.req, 'get_item', article)
+
+
 class TestFetcher(TestCase):
 
     def setUp(self):
         req = create_autospec(zendesk.ZendeskRequest)
+        req.concurrency = 1
         req.get_items.side_effect = lambda *c: load_fixture(c[0].zendesk_group)[c[0].zendesk_group]
         self.fetcher = zendesk.Fetcher(req)
 
@@ -51,10 +142,52 @@ class TestFetcher(TestCase):
         self.assertFalse(hasattr(article, 'description'))
 
 
+class TestFetcherConversion(TestCase):
+
+    def setUp(self):
+        self.cache_folder = tempfile.mkdtemp()
+        self.req = create_autospec(zendesk.ZendeskRequest)
+        self.req.concurrency = 1
+        self.req.get_items.side_effect = lambda *c: load_fixture(c[0].zendesk_group)[c[0].zendesk_group]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_folder)
+
+    def test_unchanged_bodies_are_not_converted_again(self):
+        conversion_cache = cache.ConversionCache(self.cache_folder)
+        zendesk.Fetcher(self.req, conversion_cache).fetch()
+
+        with patch('zendesk._html_to_markdown') as convert:
+            categories = zendesk.Fetcher(self.req, conversion_cache).fetch()
+
+        self.assertFalse(convert.called)
+        self.assertEqual('### title\n\nbody\n\n', categories[0].sections[0].articles[0].body)
+
+    def test_converts_in_worker_processes(self):
+        bodies = ['<p>body {}</p>'.format(idx) for idx in range(zendesk.PARALLEL_CONVERSION_THRESHOLD)]
+
+        converted = zendesk.Fetcher(self.req, workers=2)._convert(bodies + bodies[:1])
+
+        self.assertEqual(['body {}\n\n'.format(idx) for idx in range(len(bodies))] + ['body 0\n\n'], converted)
+
+    def test_conversion_options_of_the_pinned_html2text(self):
+        # html2text 2014.7.3 from requirements.txt has no config module and a string version
+        pinned = types.ModuleType('html2text')
+        pinned.__version__ = '2014.7.3'
+        pinned.BODY_WIDTH = 78
+
+        with patch.dict('sys.modules', {'html2text': pinned}):
+            self.assertEqual('html2text 2014.7.3 bodywidth=78', zendesk._conversion_options())
+
+    def test_conversion_options_of_the_installed_html2text(self):
+        self.assertTrue(zendesk._conversion_options().startswith('html2text '))
+
+
 class TestPusher(TestCase):
 
     def setUp(self):
         self.req = create_autospec(zendesk.ZendeskRequest)
+        self.req.concurrency = 1
         self.fs = create_autospec(filesystem.FilesystemClient)
         self.pusher = zendesk.Pusher(self.req, self.fs, 'dummy_path', False)
         self.category = fixtures.category_with_translations()
@@ -76,7 +209,7 @@ class TestPusher(TestCase):
 
     def test_push_update(self):
         self.req.get_missing_locales = MagicMock(return_value=[])
-        self.pusher._has_content_changed = MagicMock(return_value=True)
+        self.req.get_translation.return_value = {}
         self.pusher.push([self.category])
 
         self.req.put_translation.assert_any_call(self.category, 'pl', {
@@ -89,6 +222,36 @@ class TestPusher(TestCase):
                                                  'translation': {'locale': 'pl', 'title': 'dummy name',
                                                                  'body': '<p>dummy body</p>'}})
 
+    def test_push_update_sends_changed_fields_only(self):
+        self.req.get_missing_locales = MagicMock(return_value=[])
+        self.req.get_translation.return_value = {'locale': 'pl', 'title': 'old name', 'body': '<p>dummy body</p>'}
+        article = self.category.sections[0].articles[0]
+
+        self.pusher._push_items_translations([article])
+
+        self.req.put_translation.assert_called_once_with(article, 'pl', {'translation': {'title': 'dummy name'}})
+
+    def test_content_reformatted_by_zendesk_has_not_changed(self):
+        article = self.category.sections[0].articles[0]
+        zendesk_content = {'title': 'dummy name', 'locale': 'pl', 'body': '<p>dummy   body</p>\n'}
+
+        changed = self.pusher._changed_fields(article.translations[0], article, 'pl', zendesk_content)
+
+        self.assertEqual({}, changed)
+
+    def test_items_created_before_deadline_are_saved(self):
+        first = model.Category('first', '', 'first')
+        second = model.Category('second', '', 'second')
+        self.req.post.side_effect = [{'id': 1}, utils.DeadlineExceeded('late')]
+        self.fs.save_json.side_effect = lambda path, data: data
+
+        with self.assertRaises(utils.DeadlineExceeded):
+            self.pusher._push_new_items([(first, None), (second, None)])
+
+        self.fs.save_json.assert_called_once_with(first.meta_filepath, {'id': 1})
+        self.assertEqual(1, first.zendesk_id)
+        self.assertIsNone(second.zendesk_id)
+
     def test_push_disable_comments(self):
         self.req.get_missing_locales = MagicMock(return_value=['pl'])
         pusher = zendesk.Pusher(self.req, self.fs, 'dummy_path', True)
@@ -96,3 +259,50 @@ class TestPusher(TestCase):
 
         article = self.category.sections[0].articles[0]
         self.req.put.assert_called_with(article, {'comments_disabled': True})
+
+
+class TestSnapshot(TestCase):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        store = self.server.store
+        category = store.add_category('category', 'category description')
+        store.add_translation('categories', category['id'], 'pl', 'kategoria', 'opis')
+        section = store.add_section(category['id'], 'section')
+        self.article = store.add_article(section['id'], 'article', '<p>body</p>')
+        store.add_translation('articles', self.article['id'], 'pl', 'artykul', '<p>tresc</p>')
+        self.req = zendesk.ZendeskRequest(self.server.url, 'user', 'password')
+        self.records = list(zendesk.Snapshotter(self.req).records())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_records(self):
+        self.assertEqual(['category', 'translation', 'translation', 'section', 'translation', 'article',
+                          'translation', 'translation'], [record['type'] for record in self.records])
+
+    def test_restore_to_disk(self):
+        fs = filesystem.FilesystemClient('/help-center', storage=filesystem.MemoryStorage())
+
+        filesystem.Saver(fs).save_items(zendesk.Fetcher(self.req).restore(self.records))
+
+        categories = filesystem.Loader(fs).load()
+        article = categories[0].sections[0].articles[0]
+        self.assertEqual('body\n\n', article.body)
+        self.assertEqual(self.article['id'], article.zendesk_id)
+        self.assertIn('pl', [t.locale for t in categories[0].translations])
+        self.assertEqual('tresc\n\n', {t.locale: t.body for t in article.translations}['pl'])
+
+    def test_restore_to_zendesk(self):
+        store = self.server.store
+        store.translations[('articles', self.article['id'])]['pl']['title'] = 'zmieniony'
+        section = next(iter(store.items['sections'].values()))
+        store.remove('sections', section['id'])
+
+        self.assertEqual(2, zendesk.Restorer(self.req).restore(self.records))
+
+        new_article = next(iter(store.items['articles'].values()))
+        self.assertNotEqual(self.article['id'], new_article['id'])
+        self.assertEqual('<p>body</p>', new_article['body'])
+        self.assertEqual('artykul', store.translations[('articles', new_article['id'])]['pl']['title'])
+        self.assertEqual(1, len(store.items['categories']))
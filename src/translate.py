@@ -1,33 +1,39 @@
 import os
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
+import metrics
 import model
+import utils
 
 
 class WebTranslateItRequest(object):
-    _default_url = 'https://webtranslateit.com/api/projects/{}/{}'
-    _project_url = 'https://webtranslateit.com/api/projects/{}.json'
-    _file_url = 'https://webtranslateit.com/api/projects/{}/files/...?file_path={}'
+    _default_url = '{}/api/projects/{}/{}'
+    _project_url = '{}/api/projects/{}.json'
+    _file_url = '{}/api/projects/{}/files/...?file_path={}'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url='https://webtranslateit.com', concurrency=1):
         self.api_key = api_key
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.session = utils.pool_connections(requests.Session(), concurrency)
 
     def _url_for(self, path):
-        return self._default_url.format(self.api_key, path)
+        return self._default_url.format(self.base_url, self.api_key, path)
 
     def _path_url_for(self, path):
-        return self._file_url.format(self.api_key, path)
+        return self._file_url.format(self.base_url, self.api_key, path)
 
     def get_master_files(self):
-        url = self._project_url.format(self.api_key)
-        res = requests.get(url)
+        url = self._project_url.format(self.base_url, self.api_key)
+        res = utils.send_request(self.session.get, url)
         files = res.json()['project']['project_files']
         return list(filter(lambda f: f['locale_code'] == model.DEFAULT_LOCALE, files))
 
     def _send_request(self, request_fn, url, data, files):
         full_url = self._url_for(url)
-        response = request_fn(full_url, data=data, files=files)
+        response = utils.send_request(request_fn, full_url, data=data, files=files)
         return self._parse_response(response)
 
     def _parse_response(self, response):
@@ -42,35 +48,40 @@ class WebTranslateItRequest(object):
         return response.text.strip()
 
     def post(self, url, data, files=None):
-        return self._send_request(requests.post, url, data, files)
+        return self._send_request(self.session.post, url, data, files)
 
     def put(self, url, data, files=None):
-        return self._send_request(requests.put, url, data, files)
+        return self._send_request(self.session.put, url, data, files)
 
     def delete(self, url):
         full_url = self._url_for(url)
-        response = requests.delete(full_url)
+        response = utils.send_request(self.session.delete, full_url)
         return response.status_code == 200
 
 
 class WebTranslateItClient(object):
 
     """
-    Handles all reuests to WebTranslateIt
+    Handles all reuests to WebTranslateIt. File paths are relative to root_folder, which is also how they are named
+    in WebTranslateIt.
     """
 
-    def __init__(self, req):
+    def __init__(self, req, root_folder=''):
         self.req = req
+        self.root_folder = root_folder
+
+    def _full_path(self, filepath):
+        return os.path.join(self.root_folder, filepath)
 
     def _create_item(self, filepath):
-        with open(filepath, 'r') as fp:
-            normalized_filepath = os.path.relpath(filepath).replace('\\', '/')
+        with open(self._full_path(filepath), 'r') as fp:
+            normalized_filepath = os.path.normpath(filepath).replace('\\', '/')
             data = {'file': normalized_filepath, 'name': normalized_filepath}
             files = {'file': fp}
             return self.req.post('files', data, files)
 
     def _get_translate_id(self, path, master_files):
-        master_files_for_item = list(filter(lambda f: f['name'] == path, master_files))
+        master_files_for_item = master_files.get(path, [])
         if len(master_files_for_item) > 1:
             # TODO error?
             return ''
@@ -102,47 +113,83 @@ class WebTranslateItClient(object):
         if translate_ids:
             article.translate_ids = translate_ids
 
-    def _move_item(self, file_id, filepath):
-        with open(filepath, 'r') as file:
-            normalized_new_path = filepath.replace('\\', '/')
+    def _move_item(self, file_id, filepath, new_path=None):
+        # uploads the file at filepath as the master file file_id, named new_path when given
+        with open(self._full_path(filepath), 'r') as file:
+            normalized_new_path = (new_path or filepath).replace('\\', '/')
             data = {'file': normalized_new_path, 'name': normalized_new_path}
             files = {'file': file}
-            self.req.put('files/{}/locales/{}'.format(file_id, model.DEFAULT_LOCALE), data, files)
+            return self.req.put('files/{}/locales/{}'.format(file_id, model.DEFAULT_LOCALE), data, files)
 
     def delete(self, item):
-        for _, file_id in item.translate_ids.items():
-            self.req.delete('files/{}'.format(file_id))
-
-    def move(self, item, new_path):
-        # Guido weeps
-        if isinstance(item, model.Article):
-            self._move_item(item.translate_ids['body'], item.body_filepath)
-            self._move_item(item.translate_ids['content'], item.content_filepath)
+        self.delete_all([item])
+
+    def _map(self, fn, args):
+        workers = self.req.concurrency
+        if workers > 1 and len(args) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(fn, args))
+        return [fn(arg) for arg in args]
+
+    def delete_all(self, items):
+        urls = ['files/{}'.format(file_id) for item in items for file_id in item.translate_ids.values()]
+        self._map(self.req.delete, urls)
+
+    def rename_all(self, renames):
+        """
+        Renames master files in place from (file id, current path, new path) tuples. The file is uploaded again under
+        its new name, so the translations stay attached to it. Returns whether each rename succeeded.
+        """
+        def rename(file_rename):
+            if not self._move_item(*file_rename):
+                return False
+            metrics.increment('files', service='webtranslateit', action='renamed')
+            return True
+        return self._map(rename, renames)
+
+    def _update_item(self, item, key, filepath):
+        checksum = utils.file_checksum(self._full_path(filepath))
+        translate_ids = item.translate_ids
+        translate_hashes = item.translate_hashes
+        if not translate_ids.get(key):
+            file_id = self._create_item(filepath)
+            if not file_id:
+                # the request was logged, the file is uploaded again on the next run
+                return
+            translate_ids[key] = file_id
+            metrics.increment('files', service='webtranslateit', action='created')
+        elif key not in translate_hashes:
+            # uploaded before checksums were kept, take the file as it is for the uploaded one instead of uploading
+            # the whole project again
+            logging.info('%s has no checksum yet, recording it without uploading', filepath)
+            metrics.increment('files', service='webtranslateit', action='seeded')
+        elif translate_hashes[key] != checksum:
+            if not self._move_item(translate_ids[key], filepath):
+                return
+            metrics.increment('files', service='webtranslateit', action='updated')
         else:
-            self._move_item(item.translate_ids['content'], item.content_filepath)
+            logging.info('%s has not changed, skipping upload', filepath)
+            metrics.increment('files', service='webtranslateit', action='skipped')
+            return
+        translate_hashes[key] = checksum
+        item.translate_ids = translate_ids
+        item.translate_hashes = translate_hashes
 
     def create(self, categories):
         for category in categories:
-            if not category.translate_ids.get('content'):
-                translate_id = self._create_item(category.content_filepath)
-                category.translate_ids = {'content': translate_id}
+            self._update_item(category, 'content', category.content_filepath)
             for section in category.sections:
-                if not section.translate_ids.get('content'):
-                    translate_id = self._create_item(section.content_filepath)
-                    section.translate_ids = {'content': translate_id}
+                self._update_item(section, 'content', section.content_filepath)
                 for article in section.articles:
-                    translate_ids = {}
-                    if not article.translate_ids.get('content'):
-                        translate_id = self._create_item(article.content_filepath)
-                        translate_ids['content'] = translate_id
-                    if not article.translate_ids.get('body'):
-                        translate_id = self._create_item(article.body_filepath)
-                        translate_ids['body'] = translate_id
-                    article.translate_ids = translate_ids
+                    self._update_item(article, 'content', article.content_filepath)
+                    self._update_item(article, 'body', article.body_filepath)
         return categories
 
     def fix(self, categories):
-        master_files = self.req.get_master_files()
+        # master files by name, so every item is looked up without scanning the whole project
+        master_files = {}
+        for master_file in self.req.get_master_files():
+            master_files.setdefault(master_file['name'], []).append(master_file)
         for category in categories:
             self.fix_group(category, master_files)
             for section in category.sections:
@@ -154,8 +201,8 @@ class WebTranslateItClient(object):
 
 class Translator(object):
 
-    def __init__(self, req):
-        self.client = WebTranslateItClient(req)
+    def __init__(self, req, root_folder=''):
+        self.client = WebTranslateItClient(req, root_folder)
 
     def create(self, categories):
         return self.client.create(categories)
@@ -166,37 +213,70 @@ class Remover(object):
     def __init__(self, req):
         self.client = WebTranslateItClient(req)
 
-    def _remove_item(self, item):
-        self.client.delete(item)
-
-    # TODO the remove link should be part of the model and this should be one method.
-    def _remove_article(self, article):
-        self._remove_item(article)
-
-    def _remove_section(self, section):
-        self._remove_item(section)
-        for article in section.articles:
-            self._remove_article(article)
-
-    def _remove_category(self, category):
-        self._remove_item(category)
-        for section in category.sections:
-            self._remove_section(section)
-
     def remove(self, item):
-        # TODO to be improved, read above
-        if isinstance(item, model.Article):
-            self._remove_article(item)
-        if isinstance(item, model.Section):
-            self._remove_section(item)
-        if isinstance(item, model.Category):
-            self._remove_category(item)
+        self.remove_all([item])
+
+    def remove_all(self, items):
+        """
+        Removes the items and everything under them, deleting the files over concurrent connections.
+        """
+        self.client.delete_all([i for item in items for i in model.walk(item)])
 
 
 class Mover(object):
 
-    def __init__(self, req):
+    def __init__(self, req, root_folder=''):
         self.req = req
+        self.client = WebTranslateItClient(req, root_folder)
+
+    def _renames(self, item, dest):
+        # articles go to the locale folder of the destination section, sections become the destination folder
+        old_root = item.path
+        new_root = os.path.join(dest, model.DEFAULT_LOCALE) if isinstance(item, model.Article) else dest
+        for moved in model.walk(item):
+            filepaths = {'content': moved.content_filepath}
+            if isinstance(moved, model.Article):
+                filepaths['body'] = moved.body_filepath
+            for key, file_id in moved.translate_ids.items():
+                if key in filepaths:
+                    yield file_id, filepaths[key], new_root + filepaths[key][len(old_root):]
+
+    def move(self, item, dest):
+        self.move_all([item], [dest])
+
+    def rename_all(self, articles):
+        """
+        Points the WebTranslateIt files of articles already renamed or moved on disk at their current paths. Returns
+        the articles whose files were all renamed.
+        """
+        renames = []
+        owners = []
+        for article in articles:
+            filepaths = {'content': article.content_filepath, 'body': article.body_filepath}
+            for key, file_id in article.translate_ids.items():
+                if key in filepaths:
+                    renames.append((file_id, filepaths[key], filepaths[key]))
+                    owners.append(article)
+        results = self.client.rename_all(renames)
+        failed = {id(article) for article, renamed in zip(owners, results) if not renamed}
+        print('Renamed {} files in WebTranslateIt'.format(sum(1 for renamed in results if renamed)))
+        return [article for article in articles if id(article) not in failed]
+
+    def move_all(self, items, dests):
+        """
+        Renames the WebTranslateIt files of items and everything under them to their paths in dests. Returns the items
+        whose files were all renamed.
+        """
+        renames = []
+        owners = []
+        for item, dest in zip(items, dests):
+            for rename in self._renames(item, dest):
+                renames.append(rename)
+                owners.append(item)
+        results = self.client.rename_all(renames)
+        failed = {id(item) for item, renamed in zip(owners, results) if not renamed}
+        print('Renamed {} files in WebTranslateIt'.format(sum(1 for renamed in results if renamed)))
+        return [item for item in items if id(item) not in failed]
 
 
 class Doctor(object):
@@ -208,19 +288,19 @@ class Doctor(object):
         self.client.fix(categories)
 
 
-def translator(api_key):
+def translator(api_key, root_folder=''):
     req = WebTranslateItRequest(api_key)
-    return Translator(req)
+    return Translator(req, root_folder)
 
 
-def remover(api_key):
-    req = WebTranslateItRequest(api_key)
+def remover(api_key, concurrency=1):
+    req = WebTranslateItRequest(api_key, concurrency=concurrency)
     return Remover(req)
 
 
-def mover(api_key):
-    req = WebTranslateItRequest(api_key)
-    return Mover(req)
+def mover(api_key, concurrency=1, root_folder=''):
+    req = WebTranslateItRequest(api_key, concurrency=concurrency)
+    return Mover(req, root_folder)
 
 
 def doctor(api_key):
@@ -1,7 +1,36 @@
 import unicodedata
+import hashlib
+import logging
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from urllib.parse import urlparse
+
+import metrics
 
 IMAGE_CDN_PATTERN = r'(!\[.*?\]\()\$IMAGE_ROOT(.*?(?:\s?\".*?\")?\))'
+IMAGE_PATH_PATTERN = r'(!\[.*?\]\()\$IMAGE_ROOT([^\s)]*)((?:\s?\".*?\")?\))'
+RATE_LIMITED_STATUS = 429
+MAX_RETRIES = 5
+# seconds to wait for a connection and for the next bytes of a response
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+# a GET is hedged only once its endpoint has this many timed responses, before that the p95 means little
+HEDGE_MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 95
+
+
+class DeadlineExceeded(Exception):
+
+    """
+    Raised for requests that were not sent because the deadline of the run passed. When raised for a batch of calls,
+    results holds the results of the calls that were made, in order, with the refused ones in between.
+    """
+
+    def __init__(self, message, results=None):
+        super().__init__(message)
+        self.results = results
 
 
 def slugify(value):
@@ -15,6 +44,12 @@ def slugify(value):
 
 
 def convert_to_cdn_path(cdn_path, body):
+    """
+    Replaces $IMAGE_ROOT in image links with cdn_path. cdn_path can also be a function returning the url of the image
+    path that follows $IMAGE_ROOT.
+    """
+    if callable(cdn_path):
+        return re.sub(IMAGE_PATH_PATTERN, lambda m: m.group(1) + cdn_path(m.group(2)) + m.group(3), body)
     return re.sub(IMAGE_CDN_PATTERN, '\\1{}\\2'.format(cdn_path), body)
 
 
@@ -28,3 +63,205 @@ def to_iso_locale(locale):
         return first + '-' + second.upper()
     else:
         return locale
+
+
+def file_checksum(path):
+    with open(path, 'r') as fp:
+        return hashlib.md5(fp.read().encode('utf-8')).hexdigest()
+
+
+def to_base_url(uri):
+    if uri.startswith('http://') or uri.startswith('https://'):
+        return uri.rstrip('/')
+    return 'https://' + uri
+
+
+def is_installed(module_name):
+    import importlib.util
+    return importlib.util.find_spec(module_name) is not None
+
+
+def pool_connections(session, pool_size=1):
+    """
+    Lets the session keep up to pool_size connections per host alive so that concurrent requests made by one client
+    reuse them instead of opening a new connection each. Requests sent without a timeout get the one set with
+    set_timeout, so a stalled connection cannot hang the run.
+    """
+    from requests.adapters import HTTPAdapter
+
+    class TimeoutAdapter(HTTPAdapter):
+        def send(self, request, timeout=None, **kwargs):
+            return super().send(request, timeout=timeout or get_timeout(), **kwargs)
+
+    adapter = TimeoutAdapter(pool_connections=pool_size, pool_maxsize=max(pool_size, 10))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RateLimiter(object):
+
+    """
+    Spaces requests to one host evenly so that no more than rate requests per second are sent, across all threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def reserve(self):
+        """
+        Books the next free slot and returns how many seconds to wait for it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+            return start - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiters = {}
+
+
+def limit_rate(uri, rate):
+    """
+    Limits requests sent to the host of uri to rate per second, rate 0 removes the limit.
+    """
+    host = urlparse(to_base_url(uri)).netloc
+    if rate:
+        _rate_limiters[host] = RateLimiter(rate)
+    else:
+        _rate_limiters.pop(host, None)
+
+
+def rate_limiter_for(url):
+    return _rate_limiters.get(urlparse(url).netloc)
+
+
+_timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_hedging = False
+_deadline = None
+
+
+def set_timeout(connect, read):
+    global _timeout
+    _timeout = (connect, read)
+
+
+def get_timeout():
+    return _timeout
+
+
+def hedge_requests(enabled):
+    """
+    Turns hedging of GET requests on or off, see hedge_delay.
+    """
+    global _hedging
+    _hedging = bool(enabled)
+
+
+def hedge_delay(method, url):
+    """
+    Returns how long to wait for a GET to url before sending it a second time, the p95 latency of its endpoint, or None
+    when it should not be hedged.
+    """
+    if not _hedging or method.upper() != 'GET':
+        return None
+    return metrics.latency_percentile(method, url, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+
+
+def set_deadline(seconds):
+    """
+    Refuses to send requests once seconds have passed from now, 0 removes the deadline.
+    """
+    global _deadline
+    _deadline = time.monotonic() + seconds if seconds else None
+
+
+def check_deadline(method, url):
+    if _deadline is not None and time.monotonic() > _deadline:
+        metrics.increment('skipped_requests', endpoint=metrics.endpoint_for(method, url))
+        raise DeadlineExceeded('Deadline exceeded, {} {} was not sent'.format(method.upper(), url))
+
+
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+
+def _hedge_pool():
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=32)
+        return _hedge_executor
+
+
+def _hedged_request(request_fn, url, **kwargs):
+    """
+    Sends the request, and when it is a GET slower than most responses of its endpoint sends it again, returning the
+    first response that arrives. The other one is left to finish in the background. Only the latency of the response
+    used is recorded, so the copies do not skew the percentile that decides hedging.
+    """
+    method = getattr(request_fn, '__name__', 'request')
+    delay = hedge_delay(method, url)
+    if delay is None:
+        return _timed_request(request_fn, url, **kwargs)
+    pool = _hedge_pool()
+    measurements = [[], []]
+    futures = [pool.submit(_timed_request, request_fn, url, measurements[0], **kwargs)]
+    done, _ = wait(futures, timeout=delay)
+    if not done:
+        metrics.increment('hedged_requests', endpoint=metrics.endpoint_for(method, url))
+        futures.append(pool.submit(_timed_request, request_fn, url, measurements[1], **kwargs))
+    error = None
+    for future in as_completed(futures):
+        try:
+            response = future.result()
+        except Exception as e:
+            error = e
+            continue
+        for measurement in measurements[futures.index(future)]:
+            metrics.record_response(*measurement)
+        return response
+    raise error
+
+
+def send_request(request_fn, url, **kwargs):
+    """
+    Sends the request retrying it when the server responds with 429 Too Many Requests, waiting as long as the
+    Retry-After header asks for.
+    """
+    for _ in range(MAX_RETRIES):
+        response = _hedged_request(request_fn, url, **kwargs)
+        if response.status_code != RATE_LIMITED_STATUS:
+            return response
+        delay = float(response.headers.get('Retry-After', 1))
+        logging.warning('Rate limited by %s, retrying in %s seconds', url, delay)
+        metrics.increment('retries', endpoint=metrics.endpoint_for(getattr(request_fn, '__name__', 'request'), url))
+        time.sleep(delay)
+        for fp in (kwargs.get('files') or {}).values():
+            fp.seek(0)
+    return _hedged_request(request_fn, url, **kwargs)
+
+
+def _timed_request(request_fn, url, measurements=None, **kwargs):
+    # with a measurements list the response is added to it to be recorded later, and not recorded right away
+    method = getattr(request_fn, '__name__', 'request')
+    check_deadline(method, url)
+    limiter = rate_limiter_for(url)
+    if limiter:
+        limiter.wait()
+    start = time.perf_counter()
+    response = request_fn(url, **kwargs)
+    measurement = (method, url, response, time.perf_counter() - start)
+    if measurements is None:
+        metrics.record_response(*measurement)
+    else:
+        measurements.append(measurement)
+    return response
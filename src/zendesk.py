@@ -1,19 +1,31 @@
 import logging
 import requests
 import json
-import html2text
-import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from operator import attrgetter
 
+import cache
+import canonical
+import metrics
 import model
+import snapshot
 import utils
 
 requests.packages.urllib3.disable_warnings()
 
+CONVERSION_CACHE_FOLDER = 'conversions'
+# below this many bodies to convert starting worker processes costs more than it saves
+PARALLEL_CONVERSION_THRESHOLD = 20
+# items whose translations are listed, converted or restored together when streaming a snapshot
+SNAPSHOT_BATCH_SIZE = 100
+
 
 class ZendeskRequest(object):
-    _default_url = 'https://{}/api/v2/help_center/' + utils.to_zendesk_locale(model.DEFAULT_LOCALE) + '/{}'
-    _translations_url = 'https://{}/api/v2/help_center/{}'
+    _default_url = '{}/api/v2/help_center/' + utils.to_zendesk_locale(model.DEFAULT_LOCALE) + '/{}'
+    _translations_url = '{}/api/v2/help_center/{}'
 
     item_url = '{}/{}.json'
     items_url = '{}.json?per_page=100'
@@ -23,17 +35,21 @@ class ZendeskRequest(object):
     translations_url = '{}/{}/translations.json?per_page=100'
     missing_translations_url = '{}/{}/translations/missing.json'
 
-    def __init__(self, company_uri, user, password):
+    def __init__(self, company_uri, user, password, cache_folder=None, concurrency=1):
         super().__init__()
         self.company_uri = company_uri
+        self.base_url = utils.to_base_url(company_uri)
         self.user = user
         self.password = password
+        self.cache = cache.ResponseCache(cache_folder) if cache_folder else None
+        self.concurrency = concurrency
+        self.session = utils.pool_connections(requests.Session(), concurrency)
 
     def _url_for(self, path):
-        return self._default_url.format(self.company_uri, path)
+        return self._default_url.format(self.base_url, path)
 
     def _translation_url_for(self, path):
-        return self._translations_url.format(self.company_uri, path)
+        return self._translations_url.format(self.base_url, path)
 
     def _parse_response(self, response):
         if response.status_code == 404:
@@ -46,25 +62,36 @@ class ZendeskRequest(object):
 
     def _send_request(self, request_fn, url, data):
         full_url = self._url_for(url)
-        response = request_fn(full_url, data=json.dumps(data),
-                              auth=(self.user, self.password),
-                              headers={'Content-type': 'application/json'},
-                              verify=False)
+        response = utils.send_request(request_fn, full_url, data=json.dumps(data),
+                                      auth=(self.user, self.password),
+                                      headers={'Content-type': 'application/json'},
+                                      verify=False)
         return self._parse_response(response)
 
     def _send_translation(self, request_fn, url, data):
         full_url = self._translation_url_for(url)
-        response = request_fn(full_url, data=json.dumps(data),
-                              auth=(self.user, self.password),
-                              headers={'Content-type': 'application/json'},
-                              verify=False)
+        response = utils.send_request(request_fn, full_url, data=json.dumps(data),
+                                      auth=(self.user, self.password),
+                                      headers={'Content-type': 'application/json'},
+                                      verify=False)
         return self._parse_response(response)
 
+    def _get(self, full_url):
+        headers = self.cache.headers_for(full_url) if self.cache else {}
+        response = utils.send_request(self.session.get, full_url, auth=(self.user, self.password), headers=headers,
+                                      verify=False)
+        if self.cache and response.status_code == 304:
+            logging.debug('%s not modified, using cached response', full_url)
+            return self.cache.read(full_url)
+        data = self._parse_response(response)
+        if self.cache and response.status_code == 200:
+            self.cache.save(full_url, response.headers, data)
+        return data
+
     def get_item(self, item):
         url = self.item_url.format(item.zendesk_group, item.zendesk_id)
         full_url = self._url_for(url)
-        response = requests.get(full_url, auth=(self.user, self.password), verify=False)
-        return self._parse_response(response).get(item.zendesk_name, {})
+        return self._get(full_url).get(item.zendesk_name, {})
 
     def get_items(self, item, parent=None):
         if parent:
@@ -72,39 +99,50 @@ class ZendeskRequest(object):
         else:
             url = self.items_url.format(item.zendesk_group)
         full_url = self._url_for(url)
-        response = requests.get(full_url, auth=(self.user, self.password), verify=False)
-        return self._parse_response(response).get(item.zendesk_group, {})
+        items = []
+        while full_url:
+            data = self._get(full_url)
+            items.extend(data.get(item.zendesk_group, []))
+            full_url = data.get('next_page')
+        return items
 
     def get_missing_locales(self, item):
         url = self.missing_translations_url.format(item.zendesk_group, item.zendesk_id)
         full_url = self._translation_url_for(url)
-        response = requests.get(full_url, auth=(self.user, self.password), verify=False)
-        return self._parse_response(response).get('locales', [])
+        return self._get(full_url).get('locales', [])
 
     def get_translation(self, item, locale):
         url = self.translation_url.format(item.zendesk_group, item.zendesk_id, locale)
         full_url = self._translation_url_for(url)
-        response = requests.get(full_url, auth=(self.user, self.password), verify=False)
-        return self._parse_response(response).get('translation', {})
+        return self._get(full_url).get('translation', {})
+
+    def get_translations(self, item):
+        full_url = self._translation_url_for(self.translations_url.format(item.zendesk_group, item.zendesk_id))
+        translations = []
+        while full_url:
+            data = self._get(full_url)
+            translations.extend(data.get('translations', []))
+            full_url = data.get('next_page')
+        return translations
 
     def put(self, item, data):
         url = self.item_url.format(item.zendesk_group, item.zendesk_id)
-        return self._send_request(requests.put, url, data).get(item.zendesk_name, {})
+        return self._send_request(self.session.put, url, data).get(item.zendesk_name, {})
 
     def put_translation(self, item, locale, data):
         url = self.translation_url.format(item.zendesk_group, item.zendesk_id, locale)
-        return self._send_translation(requests.put, url, data).get('translation', {})
+        return self._send_translation(self.session.put, url, data).get('translation', {})
 
     def post(self, item, data, parent=None):
         if parent:
             url = self.items_in_group_url.format(parent.zendesk_group, parent.zendesk_id, item.zendesk_group)
         else:
             url = self.items_url.format(item.zendesk_group)
-        return self._send_request(requests.post, url, data).get(item.zendesk_name, {})
+        return self._send_request(self.session.post, url, data).get(item.zendesk_name, {})
 
     def post_translation(self, item, data):
         url = self.translations_url.format(item.zendesk_group, item.zendesk_id)
-        return self._send_translation(requests.post, url, data).get('translation', {})
+        return self._send_translation(self.session.post, url, data).get('translation', {})
 
     def delete(self, item):
         url = self.item_url.format(item.zendesk_group, item.zendesk_id)
@@ -112,43 +150,229 @@ class ZendeskRequest(object):
         return self.raw_delete(full_url)
 
     def raw_delete(self, full_url):
-        response = requests.delete(full_url, auth=(self.user, self.password), verify=False)
+        response = utils.send_request(self.session.delete, full_url, auth=(self.user, self.password), verify=False)
         return response.status_code == 200
 
 
+def _gather(req, calls, return_exceptions=False):
+    """
+    Runs (method name, args) calls against req and returns their results in order. An AsyncZendeskRequest runs them
+    concurrently on its event loop, a ZendeskRequest with concurrency above 1 on a thread pool and anything else one
+    after another. With return_exceptions a missing record is returned as RecordNotFoundError in place of its result.
+    """
+    # the asyncio client is only imported when it is used, so its module is loaded when there can be one
+    zendesk_async = sys.modules.get('zendesk_async')
+    if zendesk_async and isinstance(req, zendesk_async.AsyncZendeskRequest):
+        results = req.gather(calls, return_exceptions)
+    else:
+        def call(name_args):
+            name, args = name_args
+            try:
+                return getattr(req, name)(*args)
+            except RecordNotFoundError as e:
+                if not return_exceptions:
+                    raise
+                return e
+            except utils.DeadlineExceeded as e:
+                return e
+
+        workers = req.concurrency
+        if workers > 1 and len(calls) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(call, calls))
+        else:
+            results = [call(c) for c in calls]
+    # calls started before the deadline are finished, the caller gets their results with the error
+    refused = [result for result in results if isinstance(result, utils.DeadlineExceeded)]
+    if refused:
+        raise utils.DeadlineExceeded('Deadline exceeded, {} of {} calls were not made'.format(
+            len(refused), len(results)), results)
+    return results
+
+
+def _call(req, name, *args):
+    return _gather(req, [(name, args)])[0]
+
+
+def _html_to_markdown(html):
+    import html2text
+    return html2text.html2text(html)
+
+
+def _conversion_options():
+    import html2text
+    # the pinned html2text is a single module with a string version, later releases a package with a version tuple
+    version = html2text.__version__
+    if isinstance(version, tuple):
+        version = '.'.join(map(str, version))
+    config = getattr(html2text, 'config', html2text)
+    return 'html2text {} bodywidth={}'.format(version, getattr(config, 'BODY_WIDTH', None))
+
+
+def _synced_meta(item, payload):
+    """
+    The meta of an item built from its Zendesk payload, with the hashes that tell later what changed on either side.
+    """
+    meta = dict(payload, content_hash=item.content_hash, remote_hash=item.remote_hash_of(payload))
+    if isinstance(item, model.Article):
+        meta['body_hash'] = item.body_hash
+    return meta
+
+
 class Fetcher(object):
 
-    def __init__(self, req):
+    def __init__(self, req, conversion_cache=None, workers=None, downloader=None):
         super().__init__()
         self.req = req
+        self.conversion_cache = conversion_cache
+        self.workers = workers or os.cpu_count() or 1
+        self.downloader = downloader
+
+    def _localize(self, bodies):
+        # images linked from the bodies are downloaded into the tree when a downloader is set, see assets.py
+        return self.downloader.localize(bodies) if self.downloader else bodies
+
+    def _convert(self, bodies):
+        """
+        Converts article bodies from HTML to markdown. Bodies found in the conversion cache are not converted again, the
+        rest is converted in worker processes when there are enough of them.
+        """
+        results = {}
+        misses = []
+        for body in set(bodies):
+            cached = self.conversion_cache.get(body) if self.conversion_cache else None
+            if cached is None:
+                misses.append(body)
+            else:
+                results[body] = cached
+        metrics.increment('conversions', action='cached', value=len(results))
+        metrics.increment('conversions', action='converted', value=len(misses))
+
+        with metrics.phase('convert'):
+            if self.workers > 1 and len(misses) >= PARALLEL_CONVERSION_THRESHOLD:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    converted = executor.map(_html_to_markdown, misses,
+                                             chunksize=max(1, len(misses) // (self.workers * 4)))
+                    results.update(zip(misses, converted))
+            else:
+                results.update((body, _html_to_markdown(body)) for body in misses)
+
+        if self.conversion_cache:
+            for body in misses:
+                self.conversion_cache.save(body, results[body])
+        return [results[body] for body in bodies]
 
     def fetch(self):
         categories = []
-        zendesk_categories = self.req.get_items(model.Category)
-        for zendesk_category in zendesk_categories:
+        for zendesk_category in _call(self.req, 'get_items', model.Category):
             category_filename = utils.slugify(zendesk_category['name'])
             category = model.Category(zendesk_category['name'], zendesk_category['description'], category_filename)
             print('Category %s created' % category.name)
-            category.meta = zendesk_category
-            zendesk_sections = self.req.get_items(model.Section, category)
+            category.meta = _synced_meta(category, zendesk_category)
             categories.append(category)
-            for zendesk_section in zendesk_sections:
+
+        sections = []
+        zendesk_sections = _gather(self.req, [('get_items', (model.Section, c)) for c in categories])
+        for category, category_sections in zip(categories, zendesk_sections):
+            for zendesk_section in category_sections:
                 section_filename = utils.slugify(zendesk_section['name'])
                 section = model.Section(category, zendesk_section['name'],
                                         zendesk_section['description'], section_filename)
                 print('Section %s created' % section.name)
-                section.meta = zendesk_section
-                zendesk_articles = self.req.get_items(model.Article, section)
+                section.meta = _synced_meta(section, zendesk_section)
                 category.sections.append(section)
-                for zendesk_article in zendesk_articles:
-                    body = html2text.html2text(zendesk_article.get('body', ''))
-                    article_filename = utils.slugify(zendesk_article['title'])
-                    article = model.Article(section, zendesk_article['title'], body, article_filename)
-                    print('Article %s created' % article.name)
-                    article.meta = zendesk_article
-                    section.articles.append(article)
+                sections.append(section)
+
+        zendesk_articles = _gather(self.req, [('get_items', (model.Article, s)) for s in sections])
+        bodies = iter(self._localize(self._convert([a.get('body', '') or '' for articles in zendesk_articles
+                                                    for a in articles])))
+        for section, section_articles in zip(sections, zendesk_articles):
+            for zendesk_article in section_articles:
+                body = next(bodies)
+                article_filename = utils.slugify(zendesk_article['title'])
+                article = model.Article(section, zendesk_article['title'], body, article_filename)
+                print('Article %s created' % article.name)
+                article.meta = _synced_meta(article, zendesk_article)
+                section.articles.append(article)
+
+        articles = [article for section in sections for article in section.articles]
+        self._fetch_translations(categories + sections + articles)
         return categories
 
+    def restore(self, records):
+        """
+        Builds items from snapshot records the way fetch builds them from Zendesk and yields them parents first. Items
+        are not added to their parents so only a batch of articles is held at a time.
+        """
+        groups = {}
+        articles = []
+        for record, translations in snapshot.grouped(records):
+            data = record['data']
+            if record['type'] == model.Article.zendesk_name:
+                articles.append((data, translations))
+                if len(articles) >= SNAPSHOT_BATCH_SIZE:
+                    yield from self._restore_articles(articles, groups)
+                    articles = []
+                continue
+            if record['type'] == model.Category.zendesk_name:
+                group = model.Category(data['name'], data.get('description') or '', utils.slugify(data['name']))
+            else:
+                category = groups.get((model.Category.zendesk_name, data.get('category_id')))
+                if category is None:
+                    logging.warning('Category of section %s is not in the snapshot, skipping', data['name'])
+                    continue
+                group = model.Section(category, data['name'], data.get('description') or '',
+                                      utils.slugify(data['name']))
+            group.meta = _synced_meta(group, data)
+            groups[(record['type'], data['id'])] = group
+            self._attach_translations([(group, translation) for translation in translations])
+            yield group
+        yield from self._restore_articles(articles, groups)
+
+    def _restore_articles(self, articles, groups):
+        restored = []
+        for data, translations in articles:
+            section = groups.get((model.Section.zendesk_name, data.get('section_id')))
+            if section is None:
+                logging.warning('Section of article %s is not in the snapshot, skipping', data['title'])
+                continue
+            article = model.Article(section, data['title'], '', utils.slugify(data['title']))
+            restored.append((article, data, translations))
+        bodies = iter(self._localize(self._convert([data.get('body', '') or '' for _, data, _ in restored])))
+        for article, data, _ in restored:
+            article.body = next(bodies)
+            article.meta = _synced_meta(article, data)
+        self._attach_translations([(article, translation) for article, _, translations in restored
+                                   for translation in translations])
+        return [article for article, _, _ in restored]
+
+    def _fetch_translations(self, items):
+        """
+        Lists the translations of all items, one request per item, and attaches them.
+        """
+        translations = _gather(self.req, [('get_translations', (item,)) for item in items])
+        self._attach_translations([(item, translation) for item, item_translations in zip(items, translations)
+                                   for translation in item_translations])
+
+    def _attach_translations(self, item_translations):
+        """
+        Attaches every translation other than the one in the default locale to its item, converting article bodies.
+        """
+        default_locale = utils.to_zendesk_locale(model.DEFAULT_LOCALE)
+        item_translations = [(item, translation) for item, translation in item_translations
+                             if translation.get('locale', default_locale) != default_locale]
+
+        articles = [(item, t) for item, t in item_translations if isinstance(item, model.Article)]
+        bodies = iter(self._localize(self._convert([t.get('body', '') or '' for _, t in articles])))
+        for item, translation in item_translations:
+            locale = utils.to_iso_locale(translation['locale'])
+            if isinstance(item, model.Article):
+                item.translations.append(model.ArticleTranslation(locale, translation.get('title', ''), next(bodies)))
+            else:
+                item.translations.append(model.GroupTranslation(locale, translation.get('title', ''),
+                                                                translation.get('body', '') or ''))
+        metrics.increment('translations', action='fetched', value=len(item_translations))
+
 
 class Pusher(object):
 
@@ -157,62 +381,127 @@ class Pusher(object):
         self.fs = fs
         self.image_cdn = image_cdn
         self.disable_comments = disable_comments
-
-    def _has_content_changed(self, translation, item, locale):
-        zendesk_content = self.req.get_translation(item, locale)
-        item_content = translation.to_dict(self.image_cdn)
-        for key in item_content:
-            zendesk_body = zendesk_content.get(key, '')
-            zendesk_hash = hashlib.md5(zendesk_body.encode('utf-8'))
-            item_hash = hashlib.md5(item_content[key].encode('utf-8'))
-            if zendesk_hash.hexdigest() != item_hash.hexdigest():
-                return True
-        return False
-
-    def _push_new_item(self, item, parent=None):
-        data = {item.zendesk_name: item.to_dict(self.image_cdn)}
-        meta = self.req.post(item, data, parent)
-        meta = self.fs.save_json(item.meta_filepath, meta)
-        item.meta = meta
-
-    def _push_item_translations(self, item):
-        missing_locales = self.req.get_missing_locales(item)
-        for translation in item.translations:
-            locale = utils.to_zendesk_locale(translation.locale)
-            data = {'translation': translation.to_dict(self.image_cdn)}
-            if locale in missing_locales:
-                print('New translation for locale {}'.format(translation.locale))
-                self.req.post_translation(item, data)
-            else:
-                if self._has_content_changed(translation, item, locale):
-                    print('Updating translation for locale {}'.format(translation.locale))
-                    self.req.put_translation(item, locale, data)
+        # what Zendesk has for the items pushed, by item, to tell remote changes from the ones pushed
+        self._remote_hashes = {}
+        # items with a call that returned no payload, their hashes are not recorded so they are pushed again
+        self._failed = set()
+
+    def _changed_fields(self, translation, item, locale, zendesk_content=None):
+        """
+        Returns the rendered fields of the translation that differ from the ones in Zendesk.
+        """
+        if zendesk_content is None:
+            zendesk_content = _call(self.req, 'get_translation', item, locale)
+        item_content = self._render(translation)
+        # Zendesk sanitizes the HTML it stores, so compare the canonical forms and not the raw strings
+        return {key: value for key, value in item_content.items()
+                if not canonical.same_content(zendesk_content.get(key) or '', value or '')}
+
+    def _render(self, item):
+        with metrics.phase('render'):
+            return item.to_dict(self.image_cdn)
+
+    def _push_new_items(self, items):
+        new_items = [(item, parent) for item, parent in items if not item.zendesk_id]
+        calls = [('post', (item, {item.zendesk_name: self._render(item)}, parent)) for item, parent in new_items]
+        try:
+            metas = _gather(self.req, calls)
+        except utils.DeadlineExceeded as e:
+            # keep the ids of the items created before the deadline, the next run would create them again
+            self._save_new_items(new_items, e.results or [])
+            raise
+        self._save_new_items(new_items, metas)
+
+    def _save_new_items(self, new_items, metas):
+        for (item, _), meta in zip(new_items, metas):
+            if isinstance(meta, Exception) or not meta:
+                self._failed.add(item)
+                continue
+            metrics.increment('items', kind=item.zendesk_name, action='created')
+            self._remote_hashes[item] = item.remote_hash_of(meta)
+            meta = self.fs.save_json(item.meta_filepath, model.compact_meta(meta))
+            item.meta = meta
+        self.fs.flush()
+
+    def _push_items_translations(self, items):
+        new_translations = []
+        existing_translations = []
+        missing_locales = _gather(self.req, [('get_missing_locales', (item,)) for item in items])
+        for item, item_missing_locales in zip(items, missing_locales):
+            for translation in item.translations:
+                locale = utils.to_zendesk_locale(translation.locale)
+                if locale in item_missing_locales:
+                    new_translations.append((item, translation))
                 else:
-                    print('Nothing changed for locale {}'.format(translation.locale))
-
-    def _disable_article_comments(self, article):
-        data = {
-            'comments_disabled': True
-        }
-        self.req.put(article, data)
-
-    def _push(self, item, parent=None):
-        if not item.zendesk_id:
-            self._push_new_item(item, parent)
-        self._push_item_translations(item)
+                    existing_translations.append((item, translation, locale))
+
+        calls = []
+        pushed = []
+        for item, translation in new_translations:
+            print('New translation for locale {} of {}'.format(translation.locale, item.name))
+            calls.append(('post_translation', (item, {'translation': self._render(translation)})))
+            pushed.append((item, translation))
+            metrics.increment('translations', kind=item.zendesk_name, action='created')
+
+        zendesk_contents = _gather(self.req, [('get_translation', (item, locale))
+                                              for item, _, locale in existing_translations])
+        for (item, translation, locale), zendesk_content in zip(existing_translations, zendesk_contents):
+            if not zendesk_content:
+                self._failed.add(item)
+            if translation.locale == model.DEFAULT_LOCALE and zendesk_content:
+                self._remote_hashes[item] = model.remote_hash(zendesk_content.get('title'), zendesk_content.get('body'))
+            changed_fields = self._changed_fields(translation, item, locale, zendesk_content)
+            if changed_fields:
+                print('Updating {} of locale {} of {}'.format(', '.join(sorted(changed_fields)), translation.locale,
+                                                             item.name))
+                calls.append(('put_translation', (item, locale, {'translation': changed_fields})))
+                pushed.append((item, translation))
+                metrics.increment('translations', kind=item.zendesk_name, action='updated')
+                for field in changed_fields:
+                    metrics.increment('translation_fields', kind=item.zendesk_name, field=field)
+            else:
+                print('Nothing changed for locale {} of {}'.format(translation.locale, item.name))
+                metrics.increment('translations', kind=item.zendesk_name, action='skipped')
+        for (item, translation), result in zip(pushed, _gather(self.req, calls)):
+            if not result:
+                self._failed.add(item)
+            if translation.locale == model.DEFAULT_LOCALE and result:
+                self._remote_hashes[item] = model.remote_hash(result.get('title'), result.get('body'))
+
+    def _push(self, items):
+        for item, _ in items:
+            print('Pushing {} {}'.format(item.zendesk_name, item.name))
+        self._push_new_items(items)
+        self._push_items_translations([item for item, _ in items])
+
+    def _save_hashes(self, items):
+        # remembers what was exported so a renamed or moved article can be recognised by its body, see sync.py, and
+        # changes made since on either side can be told apart, see status.py
+        for item in items:
+            if not item.zendesk_id or item in self._failed:
+                continue
+            hashes = {'content_hash': item.content_hash}
+            if isinstance(item, model.Article):
+                hashes['body_hash'] = item.body_hash
+            if item in self._remote_hashes:
+                hashes['remote_hash'] = self._remote_hashes[item]
+            changed = {key: value for key, value in hashes.items() if item.meta.get(key) != value}
+            if changed:
+                item.meta = dict(item.meta, **changed)
+                self.fs.save_json(item.meta_filepath, changed)
+        self.fs.flush()
 
     def push(self, categories):
-        for category in categories:
-            print('Pushing category %s' % category.name)
-            self._push(category)
-            for section in category.sections:
-                print('Pushing section %s' % section.name)
-                self._push(section, category)
-                for article in section.articles:
-                    print('Pushing article %s' % article.name)
-                    self._push(article, section)
-                    if self.disable_comments:
-                        self._disable_article_comments(article)
+        self._remote_hashes = {}
+        self._failed = set()
+        sections = [section for category in categories for section in category.sections]
+        articles = [article for section in sections for article in section.articles]
+        self._push([(category, None) for category in categories])
+        self._push([(section, section.category) for section in sections])
+        self._push([(article, article.section) for article in articles])
+        self._save_hashes(list(categories) + sections + articles)
+        if self.disable_comments:
+            _gather(self.req, [('put', (article, {'comments_disabled': True})) for article in articles])
 
 
 class Remover(object):
@@ -221,8 +510,10 @@ class Remover(object):
         self.req = req
 
     def remove(self, item):
-        if item.zendesk_id:
-            self.req.delete(item)
+        self.remove_all([item])
+
+    def remove_all(self, items):
+        _gather(self.req, [('delete', (item,)) for item in items if item.zendesk_id])
 
 
 class Mover(object):
@@ -231,8 +522,21 @@ class Mover(object):
         self.req = req
         self.image_cdn = image_cdn
 
-    def move(self, item):
-        self.req.put(item)
+    def move(self, item, parent):
+        self.move_all([item], parent)
+
+    def move_all(self, items, parent):
+        """
+        Re-parents the items by updating their section_id (articles) or category_id (sections). The content is left
+        as it is, nothing is uploaded again. Returns the items Zendesk moved.
+        """
+        parent_key = parent.zendesk_name + '_id'
+        items = [item for item in items if item.zendesk_id]
+        results = _gather(self.req, [('put', (item, {item.zendesk_name: {parent_key: parent.zendesk_id}}))
+                                     for item in items], return_exceptions=True)
+        moved = [item for item, result in zip(items, results) if result and not isinstance(result, Exception)]
+        print('Moved {} items in Zendesk'.format(len(moved)))
+        return moved
 
 
 class Doctor(object):
@@ -250,7 +554,7 @@ class Doctor(object):
             sorted_items = sorted(zendesk_items, key=attrgetter('updated_at'))
             for item in sorted_items[:-1]:
                 print('removing item with id: {}'.format(item['id']))
-                self.req.raw_delete(item['url'])
+                _call(self.req, 'raw_delete', item['url'])
             return sorted_items[0]
         else:
             print('There are {} entries with the same name {}:'.format(len(zendesk_items), zendesk_items[0]['name']))
@@ -264,11 +568,12 @@ class Doctor(object):
             for idx, item in enumerate(zendesk_items):
                 if not article_nr == idx + 1:
                     print('removing item with id: {}'.format(item['id']))
-                    self.req.raw_delete(item['url'])
+                    _call(self.req, 'raw_delete', item['url'])
             return zendesk_items[article_nr - 1]
 
-    def _fetch_item(self, item, parent=None):
-        zendesk_items = self.req.get_items(item, parent)
+    def _fetch_item(self, item, parent=None, zendesk_items=None):
+        if zendesk_items is None:
+            zendesk_items = _call(self.req, 'get_items', item, parent)
         named_items = list(filter(lambda i: i['name'] == item.name, zendesk_items))
         if len(named_items) > 1:
             return self._merge_items(named_items)
@@ -278,12 +583,12 @@ class Doctor(object):
 
     def _exists(self, item):
         try:
-            self.req.get_item(item)
+            _call(self.req, 'get_item', item)
         except RecordNotFoundError:
             return False
         return True
 
-    def _fix_item(self, item, parent=None):
+    def _fix_item(self, item, parent=None, zendesk_items=None):
         # parent is a new item so this is a new item as well
         if parent and not parent.zendesk_id:
             if item.zendesk_id:
@@ -293,13 +598,15 @@ class Doctor(object):
             return
 
         try:
-            zendesk_item = self._fetch_item(item, parent)
+            if isinstance(zendesk_items, RecordNotFoundError):
+                raise zendesk_items
+            zendesk_item = self._fetch_item(item, parent, zendesk_items)
             if item.zendesk_id:
                 if zendesk_item and zendesk_item.get('id') != item.zendesk_id:
                     print('Zendesk ID is incorrect but found item with the same name {}.'
                           ' If this is not corrent you need to fix it manually'.format(item.name))
                     item.meta = zendesk_item
-                    self.fs.save_json(item.meta_filepath, zendesk_item)
+                    self.fs.save_json(item.meta_filepath, item.meta)
                 elif not zendesk_item:
                     print('Zendesk ID is incorrect and no item with the same name'
                           ' was found for name {}. Assuming new item'.format(item.name))
@@ -310,44 +617,262 @@ class Doctor(object):
                     print('Zendesk ID is missing but found item with the same name {}.'
                           ' If this is not correct you need to fix it manually'.format(item.name))
                     item.meta = zendesk_item
-                    self.fs.save_json(item.meta_filepath, zendesk_item)
+                    self.fs.save_json(item.meta_filepath, item.meta)
 
         except RecordNotFoundError as e:
             logging.warning(str(e))
 
+    def _fix_items(self, items):
+        # one listing per parent serves all its children
+        listings = {}
+        for item, parent in items:
+            if parent and not parent.zendesk_id:
+                continue
+            key = parent.zendesk_id if parent else None
+            if key not in listings:
+                listings[key] = ('get_items', (item, parent))
+        keys = list(listings)
+        results = _gather(self.req, [listings[key] for key in keys], return_exceptions=True)
+        listings = dict(zip(keys, results))
+        for item, parent in items:
+            zendesk_items = listings.get(parent.zendesk_id if parent else None)
+            self._fix_item(item, parent, zendesk_items)
+
     def fix(self, categories):
-        for category in categories:
-            self._fix_item(category)
-            for section in category.sections:
-                self._fix_item(section, section.category)
-                for article in section.articles:
-                    self._fix_item(article, article.section)
+        sections = [section for category in categories for section in category.sections]
+        articles = [article for section in sections for article in section.articles]
+        self._fix_items([(category, None) for category in categories])
+        self._fix_items([(section, section.category) for section in sections])
+        self._fix_items([(article, article.section) for article in articles])
+        self.fs.flush()
+
+
+def _stub(kind, zendesk_id):
+    """
+    An item known only by its Zendesk id, enough to build the urls of requests about it.
+    """
+    if kind == model.Category.zendesk_name:
+        item = model.Category('', '', '')
+    elif kind == model.Section.zendesk_name:
+        item = model.Section(None, '', '', '')
+    else:
+        item = model.Article(None, '', '', '')
+    item.meta = {'id': zendesk_id}
+    return item
+
+
+def _batches(items, size=SNAPSHOT_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Snapshotter(object):
+
+    """
+    Streams the help center as snapshot records, every category, section and article followed by its translations.
+    Listings are paginated and run concurrently a batch of items at a time, so only one batch is held in memory.
+    """
+
+    def __init__(self, req):
+        self.req = req
+
+    def _records(self, kind, payloads):
+        translations = _gather(self.req, [('get_translations', (_stub(kind, payload['id']),)) for payload in payloads])
+        for payload, item_translations in zip(payloads, translations):
+            yield snapshot.item_record(kind, payload)
+            for translation in item_translations:
+                yield snapshot.translation_record(kind, payload['id'], translation)
+        metrics.increment('items', kind=kind, action='snapshot', value=len(payloads))
+
+    def _children(self, kind, parent_kind, parent_ids):
+        for batch in _batches(parent_ids):
+            listings = _gather(self.req, [('get_items', (kind, _stub(parent_kind, i))) for i in batch])
+            yield [child for listing in listings for child in listing]
+
+    def records(self):
+        categories = _call(self.req, 'get_items', model.Category)
+        for batch in _batches(categories):
+            yield from self._records(model.Category.zendesk_name, batch)
+        section_ids = []
+        for sections in self._children(model.Section, model.Category.zendesk_name, [c['id'] for c in categories]):
+            section_ids.extend(section['id'] for section in sections)
+            for batch in _batches(sections):
+                yield from self._records(model.Section.zendesk_name, batch)
+        for articles in self._children(model.Article, model.Section.zendesk_name, section_ids):
+            for batch in _batches(articles):
+                yield from self._records(model.Article.zendesk_name, batch)
+
+
+class Lister(object):
+
+    """
+    Lists every category, section and article of the help center with one paginated listing per kind. With a response
+    cache the pages that did not change are not downloaded again.
+    """
+
+    kinds = (model.Category, model.Section, model.Article)
+
+    def __init__(self, req):
+        self.req = req
+
+    def list(self):
+        """
+        Returns the payloads of all items by (zendesk name, id).
+        """
+        listings = _gather(self.req, [('get_items', (kind,)) for kind in self.kinds])
+        return {(kind.zendesk_name, payload['id']): payload
+                for kind, listing in zip(self.kinds, listings) for payload in listing}
+
+
+class Restorer(object):
+
+    """
+    Replays a snapshot into a help center. Items that still exist get the content of their translations back, missing
+    ones are created again under their restored parent with all their translations.
+    """
+
+    kinds = {model.Category.zendesk_name: model.Category, model.Section.zendesk_name: model.Section,
+             model.Article.zendesk_name: model.Article}
+    parent_keys = {model.Section.zendesk_name: (model.Category.zendesk_name, 'category_id'),
+                   model.Article.zendesk_name: (model.Section.zendesk_name, 'section_id')}
+    item_fields = {model.Category.zendesk_name: ('name', 'description', 'locale', 'position'),
+                   model.Section.zendesk_name: ('name', 'description', 'locale', 'position'),
+                   model.Article.zendesk_name: ('title', 'body', 'locale', 'position', 'draft', 'promoted',
+                                                'comments_disabled', 'label_names')}
+    translation_fields = ('locale', 'title', 'body', 'draft')
+
+    def __init__(self, req):
+        self.req = req
+        self.ids = {}
+        self._existing = {}
+
+    def _existing_ids(self, kind):
+        if kind not in self._existing:
+            self._existing[kind] = {item['id'] for item in _call(self.req, 'get_items', self.kinds[kind])}
+        return self._existing[kind]
+
+    def _restore_translations(self, kind, items):
+        calls = [(_stub(kind, data['id']), translation['locale'],
+                  {'translation': _pick(translation, self.translation_fields)})
+                 for data, translations in items for translation in translations]
+        results = _gather(self.req, [('put_translation', call) for call in calls], return_exceptions=True)
+        # a translation deleted since the snapshot has to be created again
+        _gather(self.req, [('post_translation', (item, data)) for (item, _, data), result in zip(calls, results)
+                           if isinstance(result, RecordNotFoundError)])
+        metrics.increment('translations', kind=kind, action='restored', value=len(calls))
+
+    def _create(self, kind, items):
+        parent_kind, parent_key = self.parent_keys.get(kind, (None, None))
+        new_items = []
+        for data, translations in items:
+            parent = None
+            if parent_kind:
+                parent_id = self.ids.get((parent_kind, data.get(parent_key)))
+                if parent_id is None:
+                    logging.warning('Parent of %s %s was not restored, skipping', kind, data['id'])
+                    continue
+                parent = _stub(parent_kind, parent_id)
+            new_items.append((data, translations, parent))
+        created = _gather(self.req, [('post', (self.kinds[kind], {kind: _pick(data, self.item_fields[kind])}, parent))
+                                     for data, _, parent in new_items])
+        translations = []
+        for (data, item_translations, _), zendesk_item in zip(new_items, created):
+            if not zendesk_item.get('id'):
+                continue
+            print('Restored {} {}'.format(kind, data.get('name') or data.get('title')))
+            self.ids[(kind, data['id'])] = zendesk_item['id']
+            translations.extend((zendesk_item['id'], translation) for translation in item_translations
+                                if translation['locale'] != data.get('locale'))
+        _gather(self.req, [('post_translation', (_stub(kind, zendesk_id),
+                                                 {'translation': _pick(translation, self.translation_fields)}))
+                           for zendesk_id, translation in translations])
+        restored = sum(1 for zendesk_item in created if zendesk_item.get('id'))
+        metrics.increment('items', kind=kind, action='created', value=restored)
+        return restored
+
+    def _restore_batch(self, kind, items):
+        existing_ids = self._existing_ids(kind)
+        existing = [(data, translations) for data, translations in items if data['id'] in existing_ids]
+        missing = [(data, translations) for data, translations in items if data['id'] not in existing_ids]
+        self.ids.update(((kind, data['id']), data['id']) for data, _ in existing)
+        self._restore_translations(kind, existing)
+        return self._create(kind, missing)
+
+    def restore(self, records):
+        """
+        Restores the items of the snapshot records a batch at a time and returns the number of items created again.
+        """
+        created = 0
+        kind, batch = None, []
+        for record, translations in snapshot.grouped(records):
+            if batch and (record['type'] != kind or len(batch) >= SNAPSHOT_BATCH_SIZE):
+                created += self._restore_batch(kind, batch)
+                batch = []
+            kind = record['type']
+            batch.append((record['data'], translations))
+        if batch:
+            created += self._restore_batch(kind, batch)
+        return created
+
+
+def _pick(data, fields):
+    return {field: data[field] for field in fields if field in data}
 
 
 class RecordNotFoundError(Exception):
     pass
 
 
-def fetcher(company_uri, user, password):
-    req = ZendeskRequest(company_uri, user, password)
-    return Fetcher(req)
+def _request(company_uri, user, password, cache_folder=None, concurrency=1):
+    if concurrency > 1 and utils.is_installed('aiohttp'):
+        import zendesk_async
+        return zendesk_async.AsyncZendeskRequest(company_uri, user, password, cache_folder, concurrency)
+    return ZendeskRequest(company_uri, user, password, cache_folder, concurrency)
+
 
+def fetcher(company_uri, user, password, cache_folder=None, concurrency=1, images_folder=None):
+    req = _request(company_uri, user, password, cache_folder, concurrency)
+    conversion_cache = None
+    if cache_folder:
+        conversion_cache = cache.ConversionCache(os.path.join(cache_folder, CONVERSION_CACHE_FOLDER),
+                                                 _conversion_options())
+    downloader = None
+    if images_folder:
+        import assets
+        downloader = assets.downloader(company_uri, user, password, images_folder, concurrency)
+    return Fetcher(req, conversion_cache, downloader=downloader)
 
-def pusher(company_uri, user, password, fs, image_cdn, disable_comments):
-    req = ZendeskRequest(company_uri, user, password)
+
+def pusher(company_uri, user, password, fs, image_cdn, disable_comments, cache_folder=None, concurrency=1):
+    req = _request(company_uri, user, password, cache_folder, concurrency)
     return Pusher(req, fs, image_cdn, disable_comments)
 
 
-def remover(company_uri, user, password):
-    req = ZendeskRequest(company_uri, user, password)
+def remover(company_uri, user, password, concurrency=1):
+    req = _request(company_uri, user, password, concurrency=concurrency)
     return Remover(req)
 
 
-def mover(company_uri, user, password, image_cdn):
-    req = ZendeskRequest(company_uri, user, password)
+def mover(company_uri, user, password, image_cdn, concurrency=1):
+    req = _request(company_uri, user, password, concurrency=concurrency)
     return Mover(req, image_cdn)
 
 
-def doctor(company_uri, user, password, fs, force):
-    req = ZendeskRequest(company_uri, user, password)
+def doctor(company_uri, user, password, fs, force, cache_folder=None, concurrency=1):
+    req = _request(company_uri, user, password, cache_folder, concurrency)
     return Doctor(req, fs, force)
+
+
+def snapshotter(company_uri, user, password, concurrency=1):
+    req = _request(company_uri, user, password, concurrency=concurrency)
+    return Snapshotter(req)
+
+
+def restorer(company_uri, user, password, concurrency=1):
+    req = _request(company_uri, user, password, concurrency=concurrency)
+    return Restorer(req)
+
+
+def lister(company_uri, user, password, cache_folder=None, concurrency=1):
+    req = _request(company_uri, user, password, cache_folder, concurrency)
+    return Lister(req)
@@ -0,0 +1,221 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+
+import metrics
+import utils
+from zendesk import RecordNotFoundError, ZendeskRequest
+
+
+async def _refusable(coroutine):
+    try:
+        return await coroutine
+    except utils.DeadlineExceeded as e:
+        return e
+
+
+class AsyncZendeskRequest(ZendeskRequest):
+
+    """
+    asyncio variant of ZendeskRequest. Every request method is a coroutine; all requests share one aiohttp session and
+    a semaphore capping the number of requests in flight.
+
+    Use it with `async with req:` inside a running loop, or hand a list of coroutines to `run` which executes them
+    concurrently on the request's own event loop. Fetcher, Pusher, Doctor, Remover and Mover do the latter through
+    `zendesk._gather` and `gather`. The loop is closed by `close`, or when the request is garbage collected.
+    """
+
+    def __init__(self, company_uri, user, password, cache_folder=None, concurrency=20):
+        super().__init__(company_uri, user, password, cache_folder, concurrency)
+        self.loop = None
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        import aiohttp
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        credentials = base64.b64encode('{}:{}'.format(self.user, self.password).encode('utf-8')).decode('ascii')
+        connect_timeout, read_timeout = utils.get_timeout()
+        self._session = aiohttp.ClientSession(headers={'Authorization': 'Basic ' + credentials},
+                                              connector=aiohttp.TCPConnector(limit=self.concurrency, ssl=False),
+                                              timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                                                            sock_read=read_timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    async def _run(self, coroutines, return_exceptions):
+        async with self:
+            return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
+
+    def run(self, coroutines, return_exceptions=False):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(self._run(coroutines, return_exceptions))
+
+    def gather(self, calls, return_exceptions=False):
+        """
+        Runs (method name, args) calls concurrently, see zendesk._gather. Calls refused by the deadline return the
+        error in place of their result.
+        """
+        return self.run([_refusable(getattr(self, name)(*args)) for name, args in calls], return_exceptions)
+
+    def close(self):
+        """
+        Closes the event loop of `run`, a later `run` starts a new one.
+        """
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+
+    def __del__(self):
+        # processors keep the request for their whole life, so the loop is closed when the request goes away
+        if self.loop is not None and not self.loop.is_running():
+            self.close()
+
+    async def _request(self, method, full_url, data=None, headers=None, measurements=None):
+        # with a measurements list the responses are added to it to be recorded later, and not recorded right away
+        limiter = utils.rate_limiter_for(full_url)
+        for attempt in range(utils.MAX_RETRIES + 1):
+            utils.check_deadline(method, full_url)
+            if limiter:
+                await asyncio.sleep(limiter.reserve())
+            async with self._semaphore:
+                start = time.perf_counter()
+                async with self._session.request(method, full_url, data=data, headers=headers) as response:
+                    body = await response.read()
+                measurement = (method, full_url, response.status, time.perf_counter() - start, len(data or ''),
+                               len(body))
+                if measurements is None:
+                    metrics.record_request(*measurement)
+                else:
+                    measurements.append(measurement)
+            if response.status != utils.RATE_LIMITED_STATUS or attempt == utils.MAX_RETRIES:
+                return response, body
+            delay = float(response.headers.get('Retry-After', 1))
+            logging.warning('Rate limited by %s, retrying in %s seconds', full_url, delay)
+            metrics.increment('retries', endpoint=metrics.endpoint_for(method, full_url))
+            await asyncio.sleep(delay)
+
+    def _parse_body(self, response, body):
+        if response.status == 404:
+            raise RecordNotFoundError('Missing record for {}'.format(response.url))
+        if response.status not in [200, 201]:
+            logging.error('getting data from %s failed. status was %s and message %s',
+                          response.url, response.status, body)
+            return {}
+        return json.loads(body.decode('utf-8'))
+
+    async def _hedged_request(self, method, full_url, headers=None):
+        """
+        Like utils.send_request, sends a GET again when it is slower than most responses of its endpoint and uses the
+        first response. The other request is cancelled and only the latency of the response used is recorded.
+        """
+        delay = utils.hedge_delay(method, full_url)
+        if delay is None:
+            return await self._request(method, full_url, headers=headers)
+        measurements = [[], []]
+        tasks = [asyncio.ensure_future(self._request(method, full_url, headers=headers,
+                                                     measurements=measurements[0]))]
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            metrics.increment('hedged_requests', endpoint=metrics.endpoint_for(method, full_url))
+            tasks.append(asyncio.ensure_future(self._request(method, full_url, headers=headers,
+                                                             measurements=measurements[1])))
+        try:
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    for measurement in measurements[tasks.index(task)]:
+                        metrics.record_request(*measurement)
+                    return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _get(self, full_url):
+        headers = self.cache.headers_for(full_url) if self.cache else {}
+        response, body = await self._hedged_request('GET', full_url, headers=headers)
+        if self.cache and response.status == 304:
+            logging.debug('%s not modified, using cached response', full_url)
+            return self.cache.read(full_url)
+        data = self._parse_body(response, body)
+        if self.cache and response.status == 200:
+            self.cache.save(full_url, response.headers, data)
+        return data
+
+    async def _send(self, method, full_url, data):
+        response, body = await self._request(method, full_url, data=json.dumps(data),
+                                             headers={'Content-type': 'application/json'})
+        return self._parse_body(response, body)
+
+    async def get_item(self, item):
+        url = self.item_url.format(item.zendesk_group, item.zendesk_id)
+        return (await self._get(self._url_for(url))).get(item.zendesk_name, {})
+
+    async def get_items(self, item, parent=None):
+        if parent:
+            url = self.items_in_group_url.format(parent.zendesk_group, parent.zendesk_id, item.zendesk_group)
+        else:
+            url = self.items_url.format(item.zendesk_group)
+        full_url = self._url_for(url)
+        items = []
+        while full_url:
+            data = await self._get(full_url)
+            items.extend(data.get(item.zendesk_group, []))
+            full_url = data.get('next_page')
+        return items
+
+    async def get_missing_locales(self, item):
+        url = self.missing_translations_url.format(item.zendesk_group, item.zendesk_id)
+        return (await self._get(self._translation_url_for(url))).get('locales', [])
+
+    async def get_translation(self, item, locale):
+        url = self.translation_url.format(item.zendesk_group, item.zendesk_id, locale)
+        return (await self._get(self._translation_url_for(url))).get('translation', {})
+
+    async def get_translations(self, item):
+        full_url = self._translation_url_for(self.translations_url.format(item.zendesk_group, item.zendesk_id))
+        translations = []
+        while full_url:
+            data = await self._get(full_url)
+            translations.extend(data.get('translations', []))
+            full_url = data.get('next_page')
+        return translations
+
+    async def put(self, item, data):
+        url = self.item_url.format(item.zendesk_group, item.zendesk_id)
+        return (await self._send('PUT', self._url_for(url), data)).get(item.zendesk_name, {})
+
+    async def put_translation(self, item, locale, data):
+        url = self.translation_url.format(item.zendesk_group, item.zendesk_id, locale)
+        return (await self._send('PUT', self._translation_url_for(url), data)).get('translation', {})
+
+    async def post(self, item, data, parent=None):
+        if parent:
+            url = self.items_in_group_url.format(parent.zendesk_group, parent.zendesk_id, item.zendesk_group)
+        else:
+            url = self.items_url.format(item.zendesk_group)
+        return (await self._send('POST', self._url_for(url), data)).get(item.zendesk_name, {})
+
+    async def post_translation(self, item, data):
+        url = self.translations_url.format(item.zendesk_group, item.zendesk_id)
+        return (await self._send('POST', self._translation_url_for(url), data)).get('translation', {})
+
+    async def delete(self, item):
+        url = self.item_url.format(item.zendesk_group, item.zendesk_id)
+        return await self.raw_delete(self._url_for(url))
+
+    async def raw_delete(self, full_url):
+        response, _ = await self._request('DELETE', full_url)
+        return response.status == 200